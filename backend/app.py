@@ -6,16 +6,28 @@
 """
 
 from flask import Flask, Blueprint, request, jsonify
+from flask import Response, stream_with_context
+from sqlalchemy.exc import SQLAlchemyError
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required
 from flask_jwt_extended import get_jwt_identity
 from datetime import datetime
 from models.user import User
 from models.snippet import Snippet
 from models import storage
+from models.engine.storage import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 from datetime import timedelta
+from types import SimpleNamespace
 from flask_cors import CORS
-from utilities import verify_password, format_datetime
+from utilities import format_datetime, needs_rehash
+from password_pool import password_pool, PasswordPoolBusy
+from export import ndjson_lines, zip_stream
+from models.engine.events import format_sse, RESYNC
+from serializers import snippet_serializer, snippet_summary_serializer
+from serializers import snippet_search_serializer
+from serializers import user_serializer
 from dotenv import load_dotenv
+import json
+import metrics
 import os
 
 
@@ -30,6 +42,20 @@ app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
 # Initialize JWT Manager
 jwt = JWTManager(app)
 
+# Latency, status, SQL and bcrypt time per route, served at GET /metrics
+metrics.init_app(app)
+
+# Snippets inserted per transaction by the bulk import
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 500))
+MAX_IMPORT_BATCH_SIZE = 5000
+# Per-line errors reported back by the bulk import, the rest are counted
+MAX_IMPORT_ERRORS = 1000
+# Seconds between keep-alive comments on an idle event stream, a closed
+# connection is noticed at the next one
+EVENTS_HEARTBEAT = float(os.getenv('EVENTS_HEARTBEAT', 15))
+# Milliseconds a browser waits before reconnecting a dropped event stream
+EVENTS_RETRY = 3000
+
 # CORS(app)
 cors = CORS(app, resources={r"/*": {"origins": "*"}})
 
@@ -45,6 +71,115 @@ accepted_languages = [
     ]
 
 
+def normalize_language(language):
+    """
+    Normalizes the language of a snippet the way it is stored.
+    Spaces, '#' and '.' are removed and the result is lowercased.
+
+    Raises:
+        ValueError: if the language is not a string, not alphabetic or
+        not supported
+
+    Returns:
+        the normalized language
+    """
+    if not isinstance(language, str):
+        raise ValueError('Language must be a string')
+    language = language.replace(' ', '').replace('#', '').replace('.', '')
+
+    if not language.isalpha():
+        raise ValueError('Language must be alphabets only')
+
+    language = language.lower()
+
+    if language not in accepted_languages:
+        raise ValueError('Language not supported')
+
+    return language
+
+
+def get_page_args():
+    """
+    Reads the 'limit' and 'cursor' pagination query parameters.
+
+    Raises:
+        ValueError: if limit is not a positive integer
+
+    Returns:
+        tuple (limit, cursor)
+    """
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE)
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise ValueError('Limit must be an integer')
+    if limit < 1:
+        raise ValueError('Limit must be greater than 0')
+
+    return min(limit, MAX_PAGE_SIZE), request.args.get('cursor')
+
+
+def get_summary_arg():
+    """
+    Reads the 'fields' query parameter of the snippet lists.
+    'full' (the default) returns the code of every snippet, 'summary'
+    returns its line_count, byte_size and code_preview instead.
+
+    Raises:
+        ValueError: if fields is neither 'full' nor 'summary'
+
+    Returns:
+        True for summary pages
+    """
+    fields = request.args.get('fields', 'full')
+    if fields not in ('full', 'summary'):
+        raise ValueError("Fields must be 'full' or 'summary'")
+
+    return fields == 'summary'
+
+
+def snippets_page_response(snippets, next_cursor, summary, etag):
+    """
+    Returns the JSON response of a page of snippet rows.
+    """
+    serializer = snippet_summary_serializer if summary \
+        else snippet_serializer
+    return with_etag(Response(
+        serializer.dumps_page("snippets", snippets, next_cursor),
+        status=200, mimetype='application/json'), etag)
+
+
+def snippets_etag(user_id=None):
+    """
+    Returns the strong ETag of the snippets of a user, or of all snippets
+    if user_id is None.
+    It is built from the version Storage bumps on every write to the
+    snippets, so it changes exactly when they do and is known without
+    reading them.
+    """
+    version = storage.get_snippets_version(user_id)
+    return f'{user_id or "all"}.{version}'
+
+
+def with_etag(response, etag):
+    """
+    Sets the ETag of a response and asks clients to revalidate it.
+    """
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def not_modified(etag):
+    """
+    Returns a 304 Not Modified response if the request's If-None-Match
+    holds etag, None otherwise.
+    """
+    if etag in request.if_none_match:
+        return with_etag(Response(status=304), etag)
+    return None
+
+
 @app.teardown_appcontext
 def teardown(exc):
     """Closes the database session after each request"""
@@ -60,10 +195,20 @@ def protected():
     If this endpoint is reached, it means the token is valid
     """
     user_id = get_jwt_identity()
-    user = storage.get_user_by_user_id(user_id)
+    user = storage.get_cached_user(user_id)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
     return jsonify(logged_in_as=user.email), 200
 
 
+@app.errorhandler(PasswordPoolBusy)
+def password_pool_busy(error):
+    """Fails fast when too many password operations are waiting"""
+    response = jsonify({"error": "Server busy, please retry"})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
+
 # Custom response for expired tokens
 @jwt.expired_token_loader
 def my_expired_token_callback(jwt_header, jwt_payload):
@@ -86,6 +231,8 @@ def register_user():
         - 400 Bad Request if the user already exists or if there's a
         ValueError during user creation.
         - 201 Created on successful user creation along with user details.
+        - 503 Service Unavailable with Retry-After if the password pool
+        is full.
     """
     if not request.is_json:
         return jsonify({"error": "Not a JSON"}), 400
@@ -107,7 +254,7 @@ def register_user():
         return jsonify({"error": "Username already exists"}), 400
 
     try:
-        user = User(username, email, password)
+        user = User(username, email, password, hasher=password_pool.hash)
         storage.new(user)
         storage.save()
 
@@ -157,6 +304,8 @@ def login():
         - 401 Unauthorized if email or password is missing,
         the user is not found, or the password is invalid.
         - 200 OK on successful login along with an authentication token.
+        - 503 Service Unavailable with Retry-After if the password pool
+        is full.
     """
     if not request.is_json:
         return jsonify({"error": "Not a JSON"}), 400
@@ -172,9 +321,17 @@ def login():
     user = storage.get_user_by_email(email)
     if not user:
         return jsonify({"error": "User not found"}), 404
-    if not verify_password(password, user.hashed_password):
+    if not password_pool.verify(password, user.hashed_password):
         return jsonify({"error": "Invalid password"}), 401
 
+    # Move hashes made with an older bcrypt cost to the current one
+    if needs_rehash(user.hashed_password):
+        try:
+            user.hashed_password = password_pool.hash(password)
+            storage.save()
+        except PasswordPoolBusy:
+            pass  # keep the old hash, it is rehashed at a later login
+
     access_token = create_access_token(identity=user.user_id)
     return jsonify({
         "authentication_token": access_token,
@@ -192,7 +349,7 @@ def logout():
     """
     user_id = get_jwt_identity()
 
-    if storage.get_user_by_user_id(user_id):
+    if storage.get_cached_user(user_id):
         return jsonify({"message": "User logged out successfully"}), 200
     else:
         return jsonify({"error": "Not logged in"}), 404
@@ -225,34 +382,88 @@ def delete_user():
 @api.route('/users', methods=['GET'], strict_slashes=False)
 def get_all_users():
     """
-    Endpoint to retrieve all users.
-    Returns a JSON list of all users.
+    Endpoint to retrieve users one page at a time.
+    Accepts optional 'limit' and 'cursor' query parameters.
+    Returns a JSON object with the users of the page and the
+    'next_cursor' to pass back for the following page (null on the last).
     """
-    all_users = storage.all('User')
-    if all_users:
-        users = [user.to_dict() for user in all_users]
-        return jsonify(users), 200
-    else:
-        return jsonify({"error": "No user found"}), 200
+    try:
+        limit, cursor = get_page_args()
+        all_users, next_cursor = storage.get_users_page(limit, cursor)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return Response(
+        user_serializer.dumps_page("users", all_users, next_cursor),
+        status=200, mimetype='application/json')
 
 
 @api.route('/snippets', methods=['GET'], strict_slashes=False)
 def get_all_snippets():
     """
-    Endpoint to retrieve all snippets.
-    Returns a JSON list of all snippets.
+    Endpoint to retrieve snippets one page at a time.
+    Accepts optional 'limit', 'cursor' and 'fields' query parameters,
+    fields=summary leaves the code out of the page.
+    Returns a JSON object with the snippets of the page and the
+    'next_cursor' to pass back for the following page (null on the last),
+    or 304 if If-None-Match holds the current ETag.
     """
-    all_snippets = storage.all('Snippet')
-    if all_snippets:
-        snippets = [snippet.to_dict() for snippet in all_snippets]
+    etag = snippets_etag()
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    try:
+        limit, cursor = get_page_args()
+        summary = get_summary_arg()
+        all_snippets, next_cursor = storage.get_snippets_page(
+            limit=limit, cursor=cursor, summary=summary)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        for snippet in snippets:
-            snippet['created_at'] = format_datetime(snippet['created_at'])
-            snippet['updated_at'] = format_datetime(snippet['updated_at'])
+    return snippets_page_response(all_snippets, next_cursor, summary, etag)
 
-        return jsonify(snippets), 200
-    else:
-        return jsonify({"error": "No snippet found"}), 200
+
+@api.route('/snippets/search', methods=['GET'], strict_slashes=False)
+@jwt_required()
+def search_user_snippets():
+    """
+    Endpoint to search the snippets of the logged-in user.
+    Requires a valid JWT token.
+    Expects a 'q' query parameter with the words or identifiers to look
+    for in titles, descriptions and code, and optionally 'language' and
+    'limit' (default 20).
+    Returns a JSON object with the matching snippets, best match first,
+    each with the fields of /user/get_snippets and its relevance 'score'.
+    """
+    query = request.args.get('q', '')
+    if not query.strip():
+        return jsonify({"error": "Missing query"}), 400
+
+    language = request.args.get('language')
+    if language:
+        try:
+            language = normalize_language(language)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({"error": "Limit must be an integer"}), 400
+    if limit < 1:
+        return jsonify({"error": "Limit must be greater than 0"}), 400
+
+    user_id = get_jwt_identity()
+    results = storage.search_snippets(
+        user_id, query, language or None, min(limit, MAX_PAGE_SIZE))
+
+    rows = [SimpleNamespace(score=round(score, 4), **{
+        field: getattr(snippet, field)
+        for field in snippet_serializer.fields}) for snippet, score in results]
+    body = '{"snippets":' + snippet_search_serializer.encode_list(rows) + '}'
+    return Response(body.encode('ascii'), status=200,
+                    mimetype='application/json')
 
 
 @api.route('/user/create_snippet', methods=['POST'], strict_slashes=False)
@@ -281,23 +492,16 @@ def create_user_snippet():
     else:
         description = data_received.get('description')
     title, code = data_received.get('title'), data_received.get('code')
-    language = data_received.get('language').replace(
-        ' ', '').replace('#', '').replace('.', '')
-
-    if not language.isalpha():
-        return jsonify({"error": "Language must be alphabets only"}), 400
-
-    language = language.lower()
-
-    if language not in accepted_languages:
-        return jsonify({"error": "Language not supported"}), 400
+    try:
+        language = normalize_language(data_received.get('language'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     user_id = get_jwt_identity()
 
     try:
-        snippet = Snippet(title, code, description, language, user_id)
-        storage.new(snippet)
-        storage.save()
+        snippet = storage.create_snippet(
+            Snippet(title, code, description, language, user_id))
 
         return jsonify({
             "message": "Snippet created successfully",
@@ -310,7 +514,7 @@ def create_user_snippet():
             "updated_at": format_datetime(snippet.updated_at)
             }), 201
     except Exception as e:
-        return jsonify({"error": e}), 400
+        return jsonify({"error": str(e)}), 400
 
     # In the future, return an html page with 'you are not logged in'
     # include a link to serve the landing page for user to login
@@ -344,21 +548,14 @@ def create_snippet():
         description = data_received.get('description')
     title, code = data_received.get('title'), data_received.get('code')
     user_id = data_received.get('user_id')
-    language = data_received.get('language').replace(
-        ' ', '').replace('#', '').replace('.', '')
-
-    if not language.isalpha():
-        return jsonify({"error": "Language must be alphabets only"}), 400
-
-    language = language.lower()
-
-    if language not in accepted_languages:
-        return jsonify({"error": "Language not supported"}), 400
+    try:
+        language = normalize_language(data_received.get('language'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     try:
-        snippet = Snippet(title, code, description, language, user_id)
-        storage.new(snippet)
-        storage.save()
+        snippet = storage.create_snippet(
+            Snippet(title, code, description, language, user_id))
 
         return jsonify({
             "message": "Snippet created successfully",
@@ -371,29 +568,273 @@ def create_snippet():
             "updated_at": format_datetime(snippet.updated_at)
             }), 201
     except Exception as e:
-        return jsonify({"error": e}), 400
+        return jsonify({"error": str(e)}), 400
+
+
+def parse_import_line(line, user_id):
+    """
+    Builds a Snippet from one line of an NDJSON import, applying the same
+    checks as create_user_snippet.
+
+    Raises:
+        ValueError: with the error to report for the line
+
+    Returns:
+        Snippet object, not yet in storage
+    """
+    try:
+        data_received = json.loads(line)
+    except ValueError:
+        raise ValueError('Not a JSON')
+    if not isinstance(data_received, dict):
+        raise ValueError('Not a JSON object')
+    if 'title' not in data_received:
+        raise ValueError('Missing title')
+    if 'language' not in data_received:
+        raise ValueError('Missing language')
+    if 'code' not in data_received:
+        raise ValueError('Missing code')
+
+    description = data_received.get('description', '')
+    title, code = data_received.get('title'), data_received.get('code')
+    language = normalize_language(data_received.get('language'))
+
+    return Snippet(title, code, description, language, user_id)
+
+
+@api.route('/user/import_snippets', methods=['POST'], strict_slashes=False)
+@jwt_required()
+def import_user_snippets():
+    """
+    Endpoint to import many snippets for the logged-in user at once.
+    Requires a valid JWT token.
+    Expects an NDJSON body: one JSON object per line with the fields of
+    /user/create_snippet. The body is read as a stream and snippets are
+    inserted in batches of 'batch_size' (query parameter, default 500).
+    An invalid line is reported and skipped, it does not stop the import.
+    When a batch cannot be saved its snippets are inserted one at a time,
+    so only those that fail are reported.
+    Returns a JSON object with the number of snippets imported and the
+    errors as a list of {"line", "error"}.
+    """
+    try:
+        batch_size = int(request.args.get('batch_size', IMPORT_BATCH_SIZE))
+    except ValueError:
+        return jsonify({"error": "Batch size must be an integer"}), 400
+    if batch_size < 1:
+        return jsonify({"error": "Batch size must be greater than 0"}), 400
+    batch_size = min(batch_size, MAX_IMPORT_BATCH_SIZE)
+
+    user_id = get_jwt_identity()
+    imported, error_count, errors = 0, 0, []
+    batch, batch_lines = [], []
+
+    def report(line_number, error):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_IMPORT_ERRORS:
+            errors.append({"line": line_number, "error": error})
+
+    def flush():
+        nonlocal imported
+        try:
+            imported += storage.bulk_insert_snippets(batch)
+        except SQLAlchemyError:
+            # Retry the snippets one at a time, so that only the lines
+            # at fault are reported
+            for snippet, line_number in zip(batch, batch_lines):
+                try:
+                    imported += storage.bulk_insert_snippets([snippet])
+                except SQLAlchemyError:
+                    report(line_number, "Could not be saved")
+        batch.clear()
+        batch_lines.clear()
+
+    for line_number, line in enumerate(request.stream, 1):
+        if not line.strip():
+            continue
+        try:
+            batch.append(parse_import_line(line, user_id))
+            batch_lines.append(line_number)
+        except ValueError as e:
+            report(line_number, str(e))
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    return jsonify({
+        "imported": imported,
+        "error_count": error_count,
+        "errors": errors
+        }), 200
+
+
+@api.route('/user/export_snippets', methods=['GET'], strict_slashes=False)
+@jwt_required()
+def export_user_snippets():
+    """
+    Endpoint to download every snippet of the logged-in user.
+    Requires a valid JWT token.
+    Accepts an optional 'format' query parameter: 'ndjson' (default) for
+    one JSON object per line, or 'zip' for the same lines compressed in a
+    zip archive. The snippets are streamed as they are read from the
+    database, so the download starts at once whatever their number.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'zip'):
+        return jsonify({"error": "Format must be ndjson or zip"}), 400
+
+    user_id = get_jwt_identity()
+    lines = ndjson_lines(storage.stream_snippets_by_user_id(user_id))
+
+    if export_format == 'zip':
+        body, mimetype = zip_stream(lines), 'application/zip'
+    else:
+        body, mimetype = lines, 'application/x-ndjson'
+
+    return Response(
+        stream_with_context(body), mimetype=mimetype,
+        headers={'Content-Disposition':
+                 f'attachment; filename=snippets.{export_format}'})
 
 
 @api.route('/user/get_snippets', methods=['GET'], strict_slashes=False)
 @jwt_required()
 def get_user_snippets():
     """
-    Endpoint to retrieve all snippets for the logged-in user.
+    Endpoint to retrieve the snippets of the logged-in user one page at a time.
     Requires a valid JWT token.
-    Returns a JSON list of snippets belonging to the user.
+    Accepts optional 'limit', 'cursor' and 'fields' query parameters,
+    fields=summary leaves the code out of the page.
+    Returns a JSON object with the snippets of the page and the
+    'next_cursor' to pass back for the following page (null on the last),
+    or 304 if If-None-Match holds the current ETag.
     """
     user_id = get_jwt_identity()
-    snippets = storage.get_snippets_by_user_id(user_id)
-    if snippets:
-        snippets = [snippet.to_dict() for snippet in snippets]
+    etag = snippets_etag(user_id)
+    cached = not_modified(etag)
+    if cached:
+        return cached
 
-        for snippet in snippets:
-            snippet['created_at'] = format_datetime(snippet['created_at'])
-            snippet['updated_at'] = format_datetime(snippet['updated_at'])
+    try:
+        limit, cursor = get_page_args()
+        summary = get_summary_arg()
+        snippets, next_cursor = storage.get_snippets_page(
+            user_id, limit, cursor, summary)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        return jsonify(snippets), 200
-    else:
-        return jsonify({}), 200
+    return snippets_page_response(snippets, next_cursor, summary, etag)
+
+
+@api.route('/user/snippet/<snippet_id>', methods=['GET'],
+           strict_slashes=False)
+@jwt_required()
+def get_user_snippet(snippet_id):
+    """
+    Endpoint to retrieve one snippet of the logged-in user with its code.
+    Requires a valid JWT token.
+    Returns the snippet as a JSON object, 404 if it does not exist or
+    belongs to another user, or 304 if If-None-Match holds the current
+    ETag of the user's snippets. The snippet is looked up first, the ETag
+    of the collection says nothing about whether it holds this snippet.
+    """
+    user_id = get_jwt_identity()
+    etag = snippets_etag(user_id)
+    snippet = storage.get_user_snippet(snippet_id, user_id)
+    if snippet is None:
+        return jsonify({"error": "Snippet not found"}), 404
+
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    return with_etag(Response(
+        snippet_serializer.encode(snippet).encode('ascii'),
+        status=200, mimetype='application/json'), etag)
+
+
+@api.route('/user/changes', methods=['GET'], strict_slashes=False)
+@jwt_required()
+def get_user_changes():
+    """
+    Endpoint to sync the snippets of the logged-in user incrementally.
+    Requires a valid JWT token.
+    Accepts optional 'since' (the next_since of the previous call, 0 the
+    first time) and 'limit' query parameters.
+    Returns a JSON object with the 'snippets' created or updated since,
+    the ids of the snippets 'deleted' since, the 'next_since' to pass
+    back, 'has_more' if more changes follow and 'reset' if the client
+    must drop its copy of the snippets before applying the changes.
+    """
+    user_id = get_jwt_identity()
+    try:
+        limit, _ = get_page_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        since = int(request.args.get('since', 0))
+    except ValueError:
+        return jsonify({"error": "Since must be an integer"}), 400
+    if since < 0:
+        return jsonify({"error": "Since must not be negative"}), 400
+
+    changes = storage.get_changes(user_id, since, limit)
+    body = ('{"snippets":' + snippet_serializer.encode_list(changes.snippets)
+            + ',"deleted":' + json.dumps(changes.deleted)
+            + ',"next_since":' + json.dumps(changes.next_since)
+            + ',"has_more":' + json.dumps(changes.has_more)
+            + ',"reset":' + json.dumps(changes.reset) + '}')
+    return Response(body.encode('ascii'), status=200,
+                    mimetype='application/json')
+
+
+@api.route('/user/events', methods=['GET'], strict_slashes=False)
+@jwt_required(locations=['headers', 'query_string'])
+def stream_user_events():
+    """
+    Endpoint pushing the changes to the logged-in user's snippets as
+    server-sent events.
+    Requires a valid JWT token, in the Authorization header or, since
+    EventSource cannot set headers, in the 'jwt' query parameter.
+    Sends a 'created', 'updated' or 'deleted' event with the snippet_id
+    and the seq of the change for every write committed while the stream
+    is open, and a 'resync' event when the client has to catch up with
+    /user/changes: after reconnecting with a Last-Event-ID (or 'since')
+    older than the latest change, or after falling behind.
+    """
+    user_id = get_jwt_identity()
+    since = request.headers.get('Last-Event-ID', request.args.get('since'))
+    try:
+        since = None if since is None else int(since)
+    except ValueError:
+        return jsonify({"error": "Last-Event-ID must be an integer"}), 400
+
+    # Subscribed before looking for missed changes, so none falls between
+    subscription = storage.subscribe_events(user_id)
+    missed = False
+    if since is not None:
+        changes = storage.get_changes(user_id, since, 1)
+        missed = bool(changes.snippets or changes.deleted or changes.reset)
+    # The stream holds no database connection while it waits
+    storage.close()
+
+    def stream():
+        try:
+            yield f'retry: {EVENTS_RETRY}\n\n'
+            if missed:
+                yield format_sse(RESYNC)
+            while True:
+                events = subscription.get(EVENTS_HEARTBEAT)
+                if not events:
+                    yield ': keep-alive\n\n'
+                for event in events:
+                    yield format_sse(event)
+        finally:
+            subscription.close()
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @api.route('/user/update_snippet', methods=['PUT'], strict_slashes=False)
@@ -417,60 +858,49 @@ def update_user_snippet():
 
     user_id = get_jwt_identity()
 
-    try:
-        user = storage.get_user_by_user_id(user_id)
+    values = {}
+    for attribute in ['title', 'code', 'description', 'language']:
+        if attribute in data_received and not isinstance(
+                data_received.get(attribute), str):
+            return jsonify({
+                "error": f"{attribute.capitalize()} must be a string"}), 400
+    for attribute in ['title', 'code', 'description']:
+        if attribute in data_received and len(data_received.get(
+                    attribute)) != 0:
+            values[attribute] = data_received.get(attribute)
+
+    if 'language' in data_received and len(
+            data_received.get('language')) != 0:
+        if 'code' not in values:
+            return jsonify({
+                "error": "Cannot update language unless \
+                    code is provided"}), 400
+        try:
+            values['language'] = normalize_language(
+                data_received.get('language'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    values['updated_at'] = datetime.now()
 
-        snippet = storage.get_snippet_by_snippet_id(snippet_id)
-
-        if snippet:
-            if snippet.user_id == user.user_id:
-                for attribute in ['title', 'code', 'description']:
-                    if attribute in data_received and len(data_received.get(
-                                attribute)) != 0:
-                        setattr(snippet, attribute, data_received.get(
-                            attribute))
-
-                if 'language' in data_received and len(
-                        data_received.get('language')) != 0:
-                    if len(data_received.get('code')) == 0:
-                        return jsonify({
-                            "error": "Cannot update language unless \
-                                code is provided"}), 400
-                    language = data_received.get('language').replace(
-                        ' ', '').replace('#', '').replace('.', '')
-
-                    if not language.isalpha():
-                        return jsonify({
-                            "error": "Language must be alphabets only"}), 400
-
-                    language = language.lower()
-
-                    if language not in accepted_languages:
-                        return jsonify({
-                            "error": "Language not supported"}), 400
-
-                    snippet.language = language
-
-                snippet.updated_at = datetime.now()
-
-                storage.save()
-
-                return jsonify({
-                    "message": "Snippet updated successfully",
-                    "snippet_id": snippet.snippet_id,
-                    "title": snippet.title,
-                    "description": snippet.description,
-                    "language": snippet.language,
-                    "code": snippet.code,
-                    "updated_at": format_datetime(snippet.updated_at)
-                    }), 200
-            else:
-                return jsonify({"error": "Not logged in"}), 404
-        else:
+    try:
+        # Checks ownership and writes in a single statement
+        snippet = storage.update_user_snippet(snippet_id, user_id, values)
+        if not snippet:
             return jsonify({"error": "Snippet not found"}), 404
 
+        return jsonify({
+            "message": "Snippet updated successfully",
+            "snippet_id": snippet_id,
+            "title": snippet.title,
+            "description": snippet.description,
+            "language": snippet.language,
+            "code": snippet.code,
+            "updated_at": format_datetime(snippet.updated_at)
+            }), 200
+
     except Exception as e:
-        return jsonify({"error": e}), 400
+        return jsonify({"error": str(e)}), 400
 
 
 @api.route('/user/delete_snippet', methods=['DELETE'], strict_slashes=False)
@@ -494,17 +924,13 @@ def delete_user_snippet():
     user_id = get_jwt_identity()
 
     try:
-        user = storage.get_user_by_user_id(user_id)
-
-        snippet = storage.get_snippet_by_snippet_id(snippet_id)
-        if snippet and snippet.user_id == user.user_id:
-            storage.delete(snippet)
-            storage.save()
+        # Checks ownership and deletes in a single statement
+        if storage.delete_user_snippet(snippet_id, user_id):
             return jsonify({"message": "Snippet deleted successfully"}), 200
         else:
             return jsonify({"error": "Snippet not found"}), 404
     except Exception as e:
-        return jsonify({"error": e}), 400
+        return jsonify({"error": str(e)}), 400
 
 
 # Blueprint registration
@@ -0,0 +1,570 @@
+#!/usr/bin/python3
+"""Benchmarks every route of the api blueprint
+
+Seeds a database with users x snippets from benchmarks.dataset, then
+sends requests to each route, through the Flask test client and through
+a real WSGI server over HTTP, from a few threads at once. The requests of
+a route are all built before it is timed, including the users and
+snippets the deleting routes consume, so only the requests are timed.
+
+Reported per route and per driver: requests per second and the p50, p95
+and p99 latency in milliseconds, printed and written as JSON. Given the
+JSON of an earlier run as baseline, routes whose p95 grew or whose
+throughput fell by more than the tolerance are listed as regressions and
+the exit status is 1. benchmarks/baseline.json holds the results of a
+reference run with the default options, --baseline without a path
+compares with it.
+
+The database is a new SQLite file unless --database gives another url.
+Run from the backend directory:
+    python3 -m benchmarks.bench_endpoints [--users 20] [--snippets 50]
+        [--requests 200] [--concurrency 4] [--drivers client,server]
+        [--server werkzeug|gunicorn] [--database url]
+        [--output results.json] [--baseline [baseline.json]]
+        [--tolerance 0.2]
+"""
+
+from collections import namedtuple
+import argparse
+import http.client
+import itertools
+import json
+import logging
+import math
+import os
+import platform
+import random
+import secrets
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+PREFIX = '/coda_vaulta/api'
+# Results of a reference run, compared with by --baseline without a path
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'baseline.json')
+# Snippets in the body of one import request
+IMPORT_SIZE = 50
+
+Request = namedtuple('Request', ['method', 'path', 'body', 'headers',
+                                 'expected', 'stream'])
+
+
+def request(method, path, body=None, token=None, expected=(200,),
+            stream=False, content_type='application/json'):
+    """Returns a Request, its body encoded as JSON unless it is bytes"""
+    headers = {}
+    if body is not None:
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        headers['Content-Type'] = content_type
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    return Request(method, PREFIX + path, body, headers, expected, stream)
+
+
+class Context:
+    """The seeded users and snippets the requests are built from"""
+
+    def __init__(self, app, storage, users, snippets_per_user, seed):
+        from benchmarks import dataset
+        from flask_jwt_extended import create_access_token
+        self.dataset = dataset
+        self.storage = storage
+        self.rng = random.Random(seed)
+        dataset.seed(storage, users, snippets_per_user, seed=seed)
+        self.users = [storage.get_user_by_email(user.email)
+                      for user in dataset.make_users(users)]
+        with app.app_context():
+            self.tokens = [create_access_token(identity=user.user_id)
+                           for user in self.users]
+        self.snippets = {}
+        for user in self.users:
+            rows, _ = storage.get_snippets_page(user.user_id, limit=200)
+            self.snippets[user.user_id] = [row.snippet_id for row in rows]
+        storage.close()
+        self.app = app
+        self.counter = itertools.count()
+
+    def pick(self):
+        """Returns a random seeded user, its token and its snippet ids"""
+        i = self.rng.randrange(len(self.users))
+        user = self.users[i]
+        return user, self.tokens[i], self.snippets[user.user_id]
+
+    def snippet_body(self):
+        """Returns the fields of a new snippet"""
+        return self.dataset.snippet_fields(self.rng)
+
+    def throwaway_users(self, count):
+        """Stores users that the deleting routes may consume"""
+        from flask_jwt_extended import create_access_token
+        users = self.dataset.make_users(count, f'gone{next(self.counter)}')
+        for user in users:
+            self.storage.new(user)
+        self.storage.save()
+        self.storage.close()
+        with self.app.app_context():
+            return [(user.user_id, create_access_token(identity=user.user_id))
+                    for user in users]
+
+    def throwaway_snippets(self, user, count):
+        """Stores snippets of a user that delete_snippet may consume"""
+        snippets = [self.dataset.make_snippet(self.rng, user.user_id)
+                    for _ in range(count)]
+        self.storage.bulk_insert_snippets(snippets)
+        self.storage.close()
+        return [snippet.snippet_id for snippet in snippets]
+
+
+def build_protected(ctx, count):
+    """Checks the token of a user"""
+    return [request('GET', '/protected', token=ctx.pick()[1])
+            for _ in range(count)]
+
+
+def build_register_user(ctx, count):
+    """Registers new users, bcrypt included"""
+    run = next(ctx.counter)
+    return [request('POST', '/user/register', {
+        'username': f'new {run} {i}', 'email': f'new{run}x{i}@example.com',
+        'password': ctx.dataset.PASSWORD}, expected=(201,))
+        for i in range(count)]
+
+
+def build_remove_user(ctx, count):
+    """Deletes throwaway users by id"""
+    return [request('DELETE', '/delete_user', {'user_id': user_id})
+            for user_id, _ in ctx.throwaway_users(count)]
+
+
+def build_login(ctx, count):
+    """Logs seeded users in, bcrypt included"""
+    return [request('POST', '/user/login', {
+        'email': ctx.pick()[0].email, 'password': ctx.dataset.PASSWORD})
+        for _ in range(count)]
+
+
+def build_logout(ctx, count):
+    """Logs seeded users out"""
+    return [request('POST', '/user/logout', token=ctx.pick()[1])
+            for _ in range(count)]
+
+
+def build_delete_user(ctx, count):
+    """Deletes throwaway users with their own token"""
+    return [request('DELETE', '/user/delete_user', token=token)
+            for _, token in ctx.throwaway_users(count)]
+
+
+def build_get_all_users(ctx, count):
+    """Reads the first page of users"""
+    return [request('GET', '/users?limit=50') for _ in range(count)]
+
+
+def build_get_all_snippets(ctx, count):
+    """Reads the first page of snippets"""
+    return [request('GET', '/snippets?limit=50') for _ in range(count)]
+
+
+def build_search_user_snippets(ctx, count):
+    """Searches for a word of the snippets"""
+    return [request('GET', '/snippets/search?q=' + ctx.rng.choice(
+        ctx.dataset.WORDS), token=ctx.pick()[1]) for _ in range(count)]
+
+
+def build_create_user_snippet(ctx, count):
+    """Creates snippets for the user of the token"""
+    return [request('POST', '/user/create_snippet', ctx.snippet_body(),
+                    token=ctx.pick()[1], expected=(201,))
+            for _ in range(count)]
+
+
+def build_create_snippet(ctx, count):
+    """Creates snippets for a given user"""
+    return [request('POST', '/create_snippet', {
+        **ctx.snippet_body(), 'user_id': ctx.pick()[0].user_id},
+        expected=(201,)) for _ in range(count)]
+
+
+def build_import_user_snippets(ctx, count):
+    """Imports IMPORT_SIZE snippets per request"""
+    requests = []
+    for _ in range(count):
+        body = '\n'.join(json.dumps(ctx.snippet_body())
+                         for _ in range(IMPORT_SIZE)).encode()
+        requests.append(request('POST', '/user/import_snippets', body,
+                                token=ctx.pick()[1],
+                                content_type='application/x-ndjson'))
+    return requests
+
+
+def build_export_user_snippets(ctx, count):
+    """Exports every snippet of a user"""
+    return [request('GET', '/user/export_snippets', token=ctx.pick()[1])
+            for _ in range(count)]
+
+
+def build_get_user_snippets(ctx, count):
+    """Reads the first page of the snippets of a user"""
+    return [request('GET', '/user/get_snippets?limit=50',
+                    token=ctx.pick()[1]) for _ in range(count)]
+
+
+def build_get_user_snippet(ctx, count):
+    """Reads one snippet of a user"""
+    requests = []
+    for _ in range(count):
+        _, token, snippet_ids = ctx.pick()
+        requests.append(request(
+            'GET', f'/user/snippet/{ctx.rng.choice(snippet_ids)}',
+            token=token))
+    return requests
+
+
+def build_get_user_changes(ctx, count):
+    """Syncs the change feed of a user from the start"""
+    return [request('GET', '/user/changes?since=0&limit=50',
+                    token=ctx.pick()[1]) for _ in range(count)]
+
+
+def build_stream_user_events(ctx, count):
+    """Opens event streams, timed until the first message"""
+    return [request('GET', '/user/events', token=ctx.pick()[1], stream=True)
+            for _ in range(count)]
+
+
+def build_update_user_snippet(ctx, count):
+    """Updates snippets of a user"""
+    requests = []
+    for _ in range(count):
+        _, token, snippet_ids = ctx.pick()
+        body = ctx.snippet_body()
+        body['snippet_id'] = ctx.rng.choice(snippet_ids)
+        requests.append(request('PUT', '/user/update_snippet', body,
+                                token=token))
+    return requests
+
+
+def build_delete_user_snippet(ctx, count):
+    """Deletes throwaway snippets of a user"""
+    user, token, _ = ctx.pick()
+    return [request('DELETE', '/user/delete_snippet',
+                    {'snippet_id': snippet_id}, token=token)
+            for snippet_id in ctx.throwaway_snippets(user, count)]
+
+
+# Builder of the requests of every route, by endpoint name
+BUILDERS = {name[len('build_'):]: builder
+            for name, builder in globals().items()
+            if name.startswith('build_')}
+
+
+class ClientDriver:
+    """Sends requests through the Flask test client, one per thread"""
+    name = 'client'
+
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def send(self, req):
+        """Sends a request, returns its status code"""
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        response = client.open(req.path, method=req.method, data=req.body,
+                               headers=req.headers, buffered=not req.stream)
+        if req.stream:
+            next(iter(response.response), None)
+        response.close()
+        return response.status_code
+
+    def close(self):
+        """Nothing to stop, the clients go with their threads"""
+
+
+class HTTPDriver:
+    """Sends requests over HTTP to a server, one connection per thread"""
+    name = 'http'
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.local = threading.local()
+
+    def fetch(self, req):
+        """Sends a request, returns its status code and body
+
+        The body of a stream is its first line only.
+        """
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = http.client.HTTPConnection(
+                self.host, self.port, timeout=60)
+        try:
+            connection.request(req.method, req.path, req.body, req.headers)
+            response = connection.getresponse()
+            if req.stream:
+                body = response.readline()
+                connection.close()
+            else:
+                body = response.read()
+                if response.will_close:
+                    connection.close()
+            return response.status, body
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            raise
+
+    def send(self, req):
+        """Sends a request, returns its status code"""
+        return self.fetch(req)[0]
+
+    def close(self):
+        """Nothing to stop, the server is not ours"""
+
+
+class ServerDriver(HTTPDriver):
+    """Sends requests over HTTP to a WSGI server it starts
+
+    The server is werkzeug's threaded server in this process, or gunicorn
+    workers in their own processes.
+    """
+    name = 'server'
+
+    def __init__(self, app, server='werkzeug', workers=2, threads=8):
+        self.process = self.server = None
+        if server == 'gunicorn':
+            if not shutil.which('gunicorn'):
+                raise SystemExit('gunicorn is not installed')
+            with socket.socket() as probe:
+                probe.bind(('127.0.0.1', 0))
+                self.port = probe.getsockname()[1]
+            self.process = subprocess.Popen(
+                ['gunicorn', '-w', str(workers), '-k', 'gthread',
+                 '--threads', str(threads), '-b', f'127.0.0.1:{self.port}',
+                 'app:app'], env=os.environ.copy(),
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            self.wait_ready()
+        else:
+            from werkzeug.serving import make_server
+            # One line per request would drown the results
+            logging.getLogger('werkzeug').setLevel(logging.ERROR)
+            self.server = make_server('127.0.0.1', 0, app, threaded=True)
+            self.port = self.server.server_port
+            threading.Thread(target=self.server.serve_forever,
+                             daemon=True).start()
+        super().__init__('127.0.0.1', self.port)
+
+    def wait_ready(self, timeout=30):
+        """Waits until the server accepts connections"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(('127.0.0.1', self.port), 1).close()
+                return
+            except OSError:
+                time.sleep(0.1)
+        raise SystemExit('the server did not start')
+
+    def close(self):
+        """Stops the server"""
+        if self.server is not None:
+            self.server.shutdown()
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+
+
+def percentile(values, percent):
+    """Returns the nearest-rank percentile of sorted values"""
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+def run(driver, requests, concurrency):
+    """Sends requests from concurrency threads
+
+    Returns:
+        dict with requests, errors, rps and p50_ms, p95_ms, p99_ms
+    """
+    pending = iter(requests)
+    lock = threading.Lock()
+    latencies, errors = [], []
+    start = threading.Barrier(concurrency + 1)
+
+    def work():
+        start.wait()
+        while True:
+            with lock:
+                req = next(pending, None)
+            if req is None:
+                return
+            began = time.perf_counter()
+            try:
+                status = driver.send(req)
+            except Exception as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - began
+            with lock:
+                latencies.append(elapsed)
+                if status not in req.expected:
+                    errors.append(status)
+
+    workers = [threading.Thread(target=work) for _ in range(concurrency)]
+    for worker in workers:
+        worker.start()
+    start.wait()
+    began = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    wall = time.perf_counter() - began
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': round(len(latencies) / wall, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Returns the regressions of results against a baseline
+
+    Returns:
+        list of (driver, endpoint, metric, baseline value, value)
+    """
+    regressions = []
+    for driver, endpoints in results.items():
+        for endpoint, current in endpoints.items():
+            before = baseline.get(driver, {}).get(endpoint)
+            if not before:
+                continue
+            if current['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                regressions.append((driver, endpoint, 'p95_ms',
+                                    before['p95_ms'], current['p95_ms']))
+            if current['rps'] < before['rps'] * (1 - tolerance):
+                regressions.append((driver, endpoint, 'rps',
+                                    before['rps'], current['rps']))
+    return regressions
+
+
+def parse_args(argv):
+    """Returns the command line options"""
+    parser = argparse.ArgumentParser(
+        prog='python3 -m benchmarks.bench_endpoints',
+        description='Benchmarks every route of the api blueprint')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--snippets', type=int, default=50,
+                        help='snippets per user')
+    parser.add_argument('--requests', type=int, default=200,
+                        help='timed requests per route and driver')
+    parser.add_argument('--warmup', type=int, default=10,
+                        help='untimed requests per route and driver')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--drivers', default='client,server')
+    parser.add_argument('--server', default='werkzeug',
+                        choices=('werkzeug', 'gunicorn'))
+    parser.add_argument('--routes', help='comma separated endpoint names')
+    parser.add_argument('--database', help='database url, a new SQLite '
+                        'file by default')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='path of the JSON results')
+    parser.add_argument('--baseline', nargs='?', const=BASELINE,
+                        help='JSON results to compare with, '
+                        'benchmarks/baseline.json if no path is given')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='slowdown allowed before a regression')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Runs the benchmark, returns the exit status"""
+    options = parse_args(argv)
+    database = options.database or 'sqlite:///' + os.path.join(
+        tempfile.mkdtemp(), 'bench.db')
+    # Read by db_configs and app at import, so set before importing them
+    os.environ['DATABASE_URL'] = database
+    os.environ.setdefault('JWT_SECRET_KEY', secrets.token_hex(32))
+    # Streams left by the events route end at their next heartbeat
+    os.environ.setdefault('EVENTS_HEARTBEAT', '1')
+    import app as application
+    from models import storage
+
+    storage.migrate()
+    ctx = Context(application.app, storage, options.users,
+                  options.snippets, options.seed)
+    endpoints = [rule.endpoint[len('api.'):]
+                 for rule in application.app.url_map.iter_rules()
+                 if rule.endpoint.startswith('api.')]
+    missing = [endpoint for endpoint in endpoints
+               if endpoint not in BUILDERS]
+    if missing:
+        raise SystemExit(f'no requests for the routes {", ".join(missing)}')
+    if options.routes:
+        endpoints = [endpoint for endpoint in endpoints
+                     if endpoint in options.routes.split(',')]
+
+    results = {}
+    for name in options.drivers.split(','):
+        if name == 'client':
+            driver = ClientDriver(application.app)
+        else:
+            driver = ServerDriver(application.app, options.server)
+        results[driver.name] = {}
+        try:
+            for endpoint in endpoints:
+                build = BUILDERS[endpoint]
+                run(driver, build(ctx, options.warmup), options.concurrency)
+                result = run(driver, build(ctx, options.requests),
+                             options.concurrency)
+                results[driver.name][endpoint] = result
+                print(f'{driver.name:6} {endpoint:24} '
+                      f'{result["rps"]:8.1f} req/s  '
+                      f'p50 {result["p50_ms"]:8.2f}  '
+                      f'p95 {result["p95_ms"]:8.2f}  '
+                      f'p99 {result["p99_ms"]:8.2f} ms'
+                      + (f'  {result["errors"]} errors'
+                         if result['errors'] else ''))
+        finally:
+            driver.close()
+
+    report = {
+        'meta': {
+            'users': options.users,
+            'snippets_per_user': options.snippets,
+            'requests': options.requests,
+            'concurrency': options.concurrency,
+            'server': options.server,
+            'database': storage.engine.dialect.name,
+            'python': platform.python_version(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    status = 0
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, options.tolerance)
+        for driver, endpoint, metric, before, after in regressions:
+            print(f'regression: {driver} {endpoint} {metric} '
+                  f'{before} -> {after}')
+        if regressions:
+            status = 1
+        else:
+            print(f'no regression beyond {options.tolerance:.0%}')
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
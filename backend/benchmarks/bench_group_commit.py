@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+"""Benchmarks concurrent snippet inserts with and without group commit
+
+Threads insert snippets into a SQLite file, which syncs to disk on every
+commit as MySQL does by default. Without group commit each insert is its
+own transaction, with it the inserts of a 2 ms window share one.
+
+Run from the backend directory:
+    python3 -m benchmarks.bench_group_commit [threads] [inserts per thread]
+"""
+
+from models.base import Base
+from models.snippet import Snippet
+from models.engine.group_commit import GroupCommit
+from sqlalchemy import create_engine, insert, event
+import os
+import sys
+import tempfile
+import threading
+import time
+
+COLUMNS = [column.key for column in Snippet.__table__.columns]
+
+
+def make_engine(path):
+    """Returns an engine on a new SQLite file holding the tables"""
+    engine = create_engine(f'sqlite:///{path}', pool_size=64,
+                           connect_args={'check_same_thread': False,
+                                         'timeout': 60})
+
+    @event.listens_for(engine, 'connect')
+    def synchronous_full(connection, record):
+        connection.execute('PRAGMA synchronous=FULL')
+
+    Base.metadata.create_all(engine)
+    return engine
+
+
+def make_snippet(i):
+    """Returns the row of a new snippet"""
+    snippet = Snippet(f'Snippet {i}', 'print("hello")\n' * 10, '',
+                      'python', 'bench-user')
+    return {key: getattr(snippet, key) for key in COLUMNS}
+
+
+def run(threads, per_thread, insert_one):
+    """Runs insert_one from many threads, returns inserts per second"""
+    start = threading.Barrier(threads + 1)
+
+    def work(offset):
+        start.wait()
+        for i in range(per_thread):
+            insert_one(make_snippet(offset + i))
+
+    workers = [threading.Thread(target=work, args=(n * per_thread,))
+               for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    start.wait()
+    began = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return threads * per_thread / (time.perf_counter() - began)
+
+
+def main(threads=32, per_thread=20):
+    """Prints the insert throughput of both modes"""
+    directory = tempfile.mkdtemp()
+    engine = make_engine(os.path.join(directory, 'single.db'))
+    lock = threading.Lock()
+
+    def insert_single(row):
+        # SQLite takes one writer at a time, as a hot InnoDB page would
+        with lock, engine.begin() as connection:
+            connection.execute(insert(Snippet), [row])
+
+    single = run(threads, per_thread, insert_single)
+
+    engine = make_engine(os.path.join(directory, 'grouped.db'))
+
+    def commit(rows):
+        with lock, engine.begin() as connection:
+            connection.execute(insert(Snippet), rows)
+        return rows
+
+    group = GroupCommit(commit, 0.002, 64)
+    grouped = run(threads, per_thread, group.submit)
+
+    print(f'{threads} threads x {per_thread} inserts')
+    print(f'one commit per insert: {single:9.0f} inserts/s')
+    print(f'group commit:          {grouped:9.0f} inserts/s '
+          f'({group.batches} commits)')
+    print(f'speedup: {grouped / single:.1f}x')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:3]))
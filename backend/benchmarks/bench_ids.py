@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+"""Benchmarks inserting snippets keyed by uuid4 text against uuid7 bytes
+
+Each run fills a SQLite table clustered on its primary key (WITHOUT
+ROWID), like an InnoDB table, with a secondary index on the owner as the
+snippets table has. Random uuid4 keys go to random pages, which split
+and are left partly empty, while uuid7 keys always go to the last page.
+
+Reported per key type: inserts per second, pages of the table and of the
+index, and how full the pages are on average, when SQLite was built with
+the dbstat table. Fuller pages mean fewer splits happened.
+
+Run from the backend directory:
+    python3 -m benchmarks.bench_ids [rows] [rows per commit]
+"""
+
+from models.ids import uuid7
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+
+USERS = 100
+
+
+def fill(path, key_type, make_id, rows, batch):
+    """Inserts rows into a new table, returns the seconds it took"""
+    connection = sqlite3.connect(path)
+    connection.execute(
+        f'CREATE TABLE snippets (snippet_id {key_type} PRIMARY KEY, '
+        f'user_id {key_type} NOT NULL, title TEXT, code TEXT) '
+        'WITHOUT ROWID')
+    connection.execute('CREATE INDEX ix_snippets_user_id '
+                       'ON snippets (user_id, snippet_id)')
+    users = [make_id() for _ in range(USERS)]
+    code = 'print("hello")\n' * 10
+    began = time.perf_counter()
+    for start in range(0, rows, batch):
+        connection.executemany(
+            'INSERT INTO snippets VALUES (?, ?, ?, ?)',
+            [(make_id(), users[i % USERS], f'Snippet {i}', code)
+             for i in range(start, min(start + batch, rows))])
+        connection.commit()
+    elapsed = time.perf_counter() - began
+    connection.close()
+    return elapsed
+
+
+def pages(path):
+    """Returns {name: (pages, fill ratio or None)} of the table and index"""
+    connection = sqlite3.connect(path)
+    result = {}
+    for name in ('snippets', 'ix_snippets_user_id'):
+        try:
+            count, used, size = connection.execute(
+                'SELECT COUNT(*), SUM(pgsize - unused), SUM(pgsize) '
+                'FROM dbstat WHERE name = ?', (name,)).fetchone()
+            result[name] = (count, used / size)
+        except sqlite3.OperationalError:
+            result[name] = (None, None)
+    connection.close()
+    return result
+
+
+def main(rows=200000, batch=1000):
+    """Prints the insert throughput and page usage of both key types"""
+    directory = tempfile.mkdtemp()
+    runs = (
+        ('uuid4 text', 'VARCHAR(60)', lambda: str(uuid.uuid4())),
+        ('uuid7 bytes', 'BINARY(16)', lambda: uuid.UUID(uuid7()).bytes),
+    )
+    print(f'{rows} rows, {batch} per commit')
+    for label, key_type, make_id in runs:
+        path = os.path.join(directory, label.replace(' ', '_') + '.db')
+        elapsed = fill(path, key_type, make_id, rows, batch)
+        print(f'{label:12} {rows / elapsed:9.0f} inserts/s  '
+              f'{os.path.getsize(path) / 2 ** 20:7.1f} MiB')
+        for name, (count, ratio) in pages(path).items():
+            if count is not None:
+                print(f'    {name:20} {count:7} pages {ratio:6.1%} full')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:3]))
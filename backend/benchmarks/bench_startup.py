@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+"""Measures how long a fresh process takes to import the app
+
+Every run starts a new interpreter, like a gunicorn worker or the console
+does, and times importing app.py and console.py in it. Storage connects
+on first use, so none of this waits on the database. The modules slowest
+to import, from python -X importtime, show where the time goes.
+
+Run from the backend directory:
+    python3 -m benchmarks.bench_startup [runs] [json output path]
+"""
+
+import json
+import statistics
+import subprocess
+import sys
+
+MODULES = ('app', 'console')
+# Modules listed from the import time report
+SLOWEST = 10
+
+TIMED = ('import time\n'
+         'began = time.perf_counter()\n'
+         'import {module}\n'
+         'print(time.perf_counter() - began)\n')
+
+
+def time_import(module):
+    """Returns the seconds a new interpreter takes to import module"""
+    output = subprocess.run(
+        [sys.executable, '-c', TIMED.format(module=module)],
+        check=True, capture_output=True, text=True).stdout
+    return float(output.split()[-1])
+
+
+def slowest_imports(module, count=SLOWEST):
+    """Returns [(cumulative microseconds, name)] of the slowest imports"""
+    report = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        check=True, capture_output=True, text=True).stderr
+    rows = []
+    for line in report.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            rows.append((int(cumulative), name.rstrip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main(runs=10, output=None):
+    """Prints the import times of app and console, optionally as json"""
+    results = {}
+    for module in MODULES:
+        times = [time_import(module) for _ in range(runs)]
+        results[module] = {
+            'runs': runs,
+            'min_ms': min(times) * 1000,
+            'median_ms': statistics.median(times) * 1000,
+            'max_ms': max(times) * 1000,
+        }
+        print(f'import {module:8} min {min(times) * 1000:7.1f} ms  '
+              f'median {statistics.median(times) * 1000:7.1f} ms  '
+              f'max {max(times) * 1000:7.1f} ms')
+    print('slowest imports of app (cumulative):')
+    for cumulative, name in slowest_imports('app'):
+        print(f'    {cumulative / 1000:7.1f} ms {name}')
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:2]), *sys.argv[2:3])
@@ -0,0 +1,173 @@
+#!/usr/bin/python3
+"""Synthetic users and snippets for benchmarks and load tests
+
+Snippet sizes follow a log-normal distribution: most snippets are a few
+hundred bytes and a few run to tens of kilobytes, as pasted code does.
+The code is made of lines typical of its language, built from a shared
+vocabulary of identifiers so that searching for a word finds snippets.
+A seed makes the same dataset every time.
+"""
+
+from models.snippet import Snippet
+from models.user import User
+from utilities import password_hash
+import math
+import random
+
+# Password of every generated user
+PASSWORD = 'Benchmark123'
+# Median size of a snippet in bytes, and the spread of the sizes
+MEDIAN_CODE_SIZE = 600
+CODE_SIZE_SIGMA = 1.0
+MIN_CODE_SIZE = 40
+MAX_CODE_SIZE = 50000
+# bcrypt hash of PASSWORD, see shared_hash
+_hashed = None
+
+# Languages and how often they are used
+LANGUAGES = {
+    'python': 30, 'javascript': 25, 'typescript': 10, 'go': 8, 'java': 8,
+    'sql': 7, 'bash': 5, 'rust': 4, 'c': 3,
+}
+
+WORDS = ('user', 'snippet', 'cache', 'token', 'request', 'response',
+         'parse', 'config', 'record', 'batch', 'query', 'index', 'vault',
+         'stream', 'buffer', 'session', 'render', 'retry', 'merge', 'hash')
+
+LINES = {
+    'python': ('def {a}_{b}({c}):', '    {a} = {b}.get({c!r})',
+               '    for {a} in {b}_{c}s:', '        yield {a}.{b}()',
+               '    return {a}_{b}', '# {A} the {b} before the {c}'),
+    'javascript': ('function {a}{B}({c}) {{', '  const {a} = await {b}({c});',
+                   '  if (!{a}) return null;', '  {a}.{b}({c});', '}}',
+                   '// {A} the {b} before the {c}'),
+    'typescript': ('export function {a}{B}({c}: {C}): {A} {{',
+                   '  const {a}: {B} = {c}.{b};', '  return {a} ?? {b};',
+                   '}}', 'interface {A}{B} {{ {c}: string }}'),
+    'go': ('func {a}{B}({c} *{C}) error {{', '\t{a}, err := {b}({c})',
+           '\tif err != nil {{', '\t\treturn err', '\t}}', '}}'),
+    'java': ('public {A} {a}{B}({C} {c}) {{', '    {A} {a} = {c}.{b}();',
+             '    return {a};', '}}', '// {A} the {b} before the {c}'),
+    'sql': ('SELECT {a}_id, {b} FROM {c}s', 'JOIN {a}s ON {a}s.id = {b}_id',
+            'WHERE {a} = :{b}', 'ORDER BY {c} DESC;'),
+    'bash': ('for {a} in "${b}s"; do', '  {b} "${a}" >> {c}.log', 'done',
+             '# {A} the {b} before the {c}'),
+    'rust': ('fn {a}_{b}({c}: &{C}) -> Result<{A}, Error> {{',
+             '    let {a} = {c}.{b}()?;', '    Ok({a})', '}}'),
+    'c': ('int {a}_{b}(struct {c} *{c}) {{', '    int {a} = {c}->{b};',
+          '    return {a};', '}}'),
+}
+
+
+def code_size(rng):
+    """Returns a snippet size in bytes drawn from the size distribution"""
+    size = rng.lognormvariate(math.log(MEDIAN_CODE_SIZE), CODE_SIZE_SIGMA)
+    return int(min(max(size, MIN_CODE_SIZE), MAX_CODE_SIZE))
+
+
+def make_code(rng, language, size):
+    """Returns about size bytes of code in a language"""
+    lines, length = [], 0
+    while length < size:
+        a, b, c = rng.choice(WORDS), rng.choice(WORDS), rng.choice(WORDS)
+        line = rng.choice(LINES[language]).format(
+            a=a, b=b, c=c, A=a.capitalize(), B=b.capitalize(),
+            C=c.capitalize())
+        lines.append(line)
+        length += len(line) + 1
+    return '\n'.join(lines)
+
+
+def snippet_fields(rng):
+    """Returns the title, code, description and language of a snippet"""
+    language = rng.choices(list(LANGUAGES), list(LANGUAGES.values()))[0]
+    return {
+        'title': ' '.join(rng.sample(WORDS, 3)).capitalize(),
+        'code': make_code(rng, language, code_size(rng)),
+        'description': f'{rng.choice(WORDS).capitalize()} helper in '
+                       f'{language}',
+        'language': language,
+    }
+
+
+def make_snippet(rng, user_id):
+    """Returns a new Snippet of a user with a random language and size"""
+    return Snippet(user_id=user_id, **snippet_fields(rng))
+
+
+def shared_hash():
+    """Returns the bcrypt hash of PASSWORD that every generated user has
+
+    bcrypt runs once per process, so generating millions of users takes
+    no hashing time.
+    """
+    global _hashed
+    if _hashed is None:
+        _hashed = password_hash(PASSWORD)
+    return _hashed
+
+
+def user_email(prefix, n):
+    """Returns the email of the n-th generated user of a prefix"""
+    return f'{prefix}.{n}@example.com'
+
+
+def make_users(count, prefix='bench', start=0):
+    """Returns count new Users, all with the password PASSWORD
+
+    The users are named '<prefix> <n>' with the email
+    '<prefix>.<n>@example.com', n counting from start.
+    """
+    hashed = shared_hash()
+    return [User(f'{prefix} {i}', user_email(prefix, i), PASSWORD,
+                 hasher=lambda _: hashed)
+            for i in range(start, start + count)]
+
+
+def seed(storage, users, snippets_per_user, batch_size=1000, seed=0,
+         prefix='bench', progress=None):
+    """Stores users with their snippets, a batch at a time
+
+    A batch of users is committed, then their snippets in batches of
+    batch_size with bulk_insert_snippets, so memory does not grow with
+    the number of users.
+
+    Args:
+        storage: Storage to write to
+        users (int): number of users
+        snippets_per_user (int): snippets of every user
+        batch_size (int): users or snippets committed at a time
+        seed (int): seed of the random choices
+        prefix (str): letters and digits starting the usernames and
+            emails, which must not be taken yet
+        progress (callable): called with (users done, snippets done)
+            after every batch of snippets
+
+    Returns:
+        tuple (users stored, snippets stored)
+    """
+    rng = random.Random(seed)
+    users_done = snippets_done = 0
+    batch = []
+    for start in range(0, users, batch_size):
+        created = make_users(min(batch_size, users - start), prefix, start)
+        for user in created:
+            storage.new(user)
+        storage.save()
+        storage.close()
+        users_done += len(created)
+        for user in created:
+            for _ in range(snippets_per_user):
+                batch.append(make_snippet(rng, user.user_id))
+                if len(batch) >= batch_size:
+                    snippets_done += storage.bulk_insert_snippets(batch)
+                    batch = []
+                    storage.close()
+                    if progress:
+                        progress(users_done, snippets_done)
+    if batch:
+        snippets_done += storage.bulk_insert_snippets(batch)
+        storage.close()
+    if progress:
+        progress(users_done, snippets_done)
+    return users_done, snippets_done
@@ -0,0 +1,202 @@
+#!/usr/bin/python3
+"""Replays a mix of api calls against a running server
+
+For capacity planning: seed a database with `console.py seed`, start the
+server as it runs in production, then let loadgen send a weighted mix of
+requests from many threads for a while. Every thread picks its next
+route at random by weight and sends it as soon as the last one returned,
+so concurrency is the number of users clicking at once with no think
+time.
+
+The requests are those of benchmarks.bench_endpoints, built against the
+seeded users: loadgen logs a few of them in over HTTP and reads their
+snippet ids. Routes that delete, or that revoke the tokens it shares
+between threads, are left out of the mix.
+
+Reported per route: requests, errors, requests per second and the p50,
+p95 and p99 latency in milliseconds.
+"""
+
+from collections import namedtuple
+import base64
+import itertools
+import json
+import random
+import threading
+import time
+
+from benchmarks import dataset
+from benchmarks.bench_endpoints import BUILDERS, percentile, request
+
+# Share of the requests of each route, read-heavy like real use
+DEFAULT_MIX = {
+    'get_user_snippets': 40,
+    'get_user_snippet': 20,
+    'search_user_snippets': 10,
+    'get_user_changes': 10,
+    'get_all_snippets': 5,
+    'create_user_snippet': 8,
+    'update_user_snippet': 5,
+    'login': 2,
+}
+# Routes a mix may name, those that neither delete nor revoke tokens
+ROUTES = ('protected', 'login', 'get_all_users', 'get_all_snippets',
+          'search_user_snippets', 'create_user_snippet', 'create_snippet',
+          'import_user_snippets', 'export_user_snippets',
+          'get_user_snippets', 'get_user_snippet', 'get_user_changes',
+          'update_user_snippet')
+# Seconds between progress reports
+REPORT_EVERY = 5
+
+SeededUser = namedtuple('SeededUser', ['user_id', 'email'])
+
+
+def parse_mix(text):
+    """Returns the mix described by 'route=weight,route=weight'
+
+    Raises:
+        ValueError: if a route is unknown or a weight is not a positive
+            integer
+    """
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.strip().partition('=')
+        if name not in ROUTES:
+            raise ValueError(f'unknown route {name!r}')
+        if not weight.isdigit() or int(weight) == 0:
+            raise ValueError(f'bad weight {weight!r} for {name}')
+        mix[name] = int(weight)
+    return mix
+
+
+def token_identity(token):
+    """Returns the user id a JWT was issued to, without verifying it"""
+    payload = token.split('.')[1]
+    payload += '=' * (-len(payload) % 4)
+    return json.loads(base64.urlsafe_b64decode(payload))['sub']
+
+
+class RemoteContext:
+    """The seeded users of a running server the requests are built from
+
+    Logs the first users of a seeded prefix in and reads the first page of
+    their snippet ids, with the same interface as the Context of
+    bench_endpoints so its builders work unchanged.
+    """
+
+    def __init__(self, driver, users, prefix='bench', seed=0):
+        self.dataset = dataset
+        self.rng = random.Random(seed)
+        self.counter = itertools.count()
+        self.users, self.tokens, self.snippets = [], [], {}
+        for i in range(users):
+            email = dataset.user_email(prefix, i)
+            status, body = driver.fetch(request('POST', '/user/login', {
+                'email': email, 'password': dataset.PASSWORD}))
+            if status != 200:
+                raise ValueError(f'cannot log {email} in: {status}')
+            token = json.loads(body)['authentication_token']
+            user = SeededUser(token_identity(token), email)
+            status, body = driver.fetch(request(
+                'GET', '/user/get_snippets?limit=200', token=token))
+            snippet_ids = [row['snippet_id']
+                           for row in json.loads(body)['snippets']] \
+                if status == 200 else []
+            if not snippet_ids:
+                raise ValueError(f'{email} has no snippets')
+            self.users.append(user)
+            self.tokens.append(token)
+            self.snippets[user.user_id] = snippet_ids
+
+    def pick(self):
+        """Returns a random seeded user, its token and its snippet ids"""
+        i = self.rng.randrange(len(self.users))
+        user = self.users[i]
+        return user, self.tokens[i], self.snippets[user.user_id]
+
+    def snippet_body(self):
+        """Returns the fields of a new snippet"""
+        return self.dataset.snippet_fields(self.rng)
+
+
+def summary(latencies, errors, wall):
+    """Returns requests, errors, rps and percentiles of sorted latencies"""
+    if not latencies:
+        return {'requests': 0, 'errors': errors, 'rps': 0.0,
+                'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0}
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / wall, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def loadgen(driver, ctx, mix, duration, concurrency, report=print):
+    """Sends a weighted mix of requests from concurrency threads
+
+    Args:
+        driver: HTTPDriver of the server
+        ctx: RemoteContext of its seeded users
+        mix (dict): weight of each route
+        duration (float): seconds to keep sending
+        concurrency (int): threads sending at once
+        report (callable): called with a line of progress every
+            REPORT_EVERY seconds
+
+    Returns:
+        dict of route name to the summary of its requests, with the
+        totals under 'all'
+    """
+    names, weights = list(mix), list(mix.values())
+    lock = threading.Lock()
+    latencies = {name: [] for name in names}
+    errors = dict.fromkeys(names, 0)
+    stop = threading.Event()
+
+    def work():
+        while not stop.is_set():
+            with lock:
+                # The context's random state is shared by the threads
+                name = ctx.rng.choices(names, weights)[0]
+                req = BUILDERS[name](ctx, 1)[0]
+            began = time.perf_counter()
+            try:
+                status = driver.send(req)
+            except Exception as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - began
+            with lock:
+                latencies[name].append(elapsed)
+                if status not in req.expected:
+                    errors[name] += 1
+
+    workers = [threading.Thread(target=work, daemon=True)
+               for _ in range(concurrency)]
+    began = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    sent = 0
+    while not stop.wait(min(REPORT_EVERY,
+                            max(0, began + duration - time.perf_counter()))):
+        elapsed = time.perf_counter() - began
+        if elapsed >= duration:
+            stop.set()
+            break
+        with lock:
+            total = sum(map(len, latencies.values()))
+            failed = sum(errors.values())
+        report(f'{elapsed:5.0f}s {total:8} requests '
+               f'{(total - sent) / REPORT_EVERY:8.1f}/s {failed:6} errors')
+        sent = total
+    for worker in workers:
+        worker.join()
+    wall = time.perf_counter() - began
+    results = {name: summary(sorted(latencies[name]), errors[name], wall)
+               for name in names}
+    results['all'] = summary(
+        sorted(itertools.chain.from_iterable(latencies.values())),
+        sum(errors.values()), wall)
+    return results
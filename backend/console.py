@@ -11,6 +11,11 @@ import models
 from models.user import User
 from models.snippet import Snippet
 import shlex  # for splitting the line along spaces except in double quotes
+import sys
+import time
+from urllib.parse import urlsplit
+from utilities import calibrate_bcrypt_rounds, get_bcrypt_rounds
+from export import ndjson_lines, zip_stream
 
 classes = {"User": User, "Snippet": Snippet}
 
@@ -135,6 +140,168 @@ class CODAVAULTAConsole(cmd.Cmd):
         else:
             print("** class doesn't exist **")
 
+    def do_migrate(self, arg):
+        """Adds missing tables and indexes to an existing database"""
+        applied = models.storage.migrate()
+        if not applied:
+            print("** database is up to date **")
+        for name in applied:
+            print(f"added {name}")
+
+    def do_export(self, arg):
+        """Writes every snippet of a user to a file
+        Usage: export <user_id> <path> [ndjson|zip]  (default ndjson)"""
+        args = shlex.split(arg)
+        if len(args) < 2:
+            print("** user id or path missing **")
+            return False
+        user_id, path = args[0], args[1]
+        export_format = args[2] if len(args) > 2 else 'ndjson'
+        if export_format not in ('ndjson', 'zip'):
+            print("** format must be ndjson or zip **")
+            return False
+        if not models.storage.get_user_by_user_id(user_id):
+            print("** user doesn't exist **")
+            return False
+
+        count = 0
+        lines = ndjson_lines(models.storage.stream_snippets_by_user_id(
+            user_id))
+
+        def counted(lines):
+            nonlocal count
+            for line in lines:
+                count += 1
+                yield line
+
+        chunks = counted(lines)
+        if export_format == 'zip':
+            chunks = zip_stream(chunks)
+        with open(path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        print(f"exported {count} snippets to {path}")
+
+    def do_reindex(self, arg):
+        """Rebuilds the snippet search index from the snippets table
+        migrate already indexes the snippets stored before the index
+        existed, reindex is for an index that went out of step"""
+        count = models.storage.reindex_search()
+        print(f"indexed {count} snippets")
+
+    def do_reconcile(self, arg):
+        """Recounts users and snippets and repairs the counters that drifted"""
+        drift = models.storage.reconcile_counts()
+        for scope, name, stored, actual in drift:
+            print(f"{scope} {name}: {stored} -> {actual}")
+        print(f"repaired {len(drift)} counters")
+
+    def do_calibrate_bcrypt(self, arg):
+        """Finds the bcrypt cost hashing closest to a target time on this host
+        Usage: calibrate_bcrypt [target_ms]  (default 250)"""
+        args = arg.split()
+        try:
+            target_ms = float(args[0]) if args else 250
+        except ValueError:
+            print("** target must be a number of milliseconds **")
+            return False
+        if target_ms <= 0:
+            print("** target must be a number of milliseconds **")
+            return False
+
+        rounds, elapsed = calibrate_bcrypt_rounds(target_ms)
+        print(f"cost {rounds} hashes in {elapsed:.0f} ms "
+              f"(current cost {get_bcrypt_rounds()})")
+        print(f"set BCRYPT_ROUNDS={rounds} in .env to use it, existing "
+              "passwords are rehashed at their next login")
+
+    def do_seed(self, arg):
+        """Stores generated users and snippets in batches, for load tests
+        Usage: seed <users> <snippets_per_user> [batch_size] [prefix]
+        (default batch 1000, prefix bench; every password is Benchmark123)"""
+        args = shlex.split(arg)
+        if len(args) < 2:
+            print("** number of users or snippets per user missing **")
+            return False
+        try:
+            users, per_user = int(args[0]), int(args[1])
+            batch_size = int(args[2]) if len(args) > 2 else 1000
+        except ValueError:
+            print("** users, snippets and batch size must be integers **")
+            return False
+        if users < 1 or per_user < 0 or batch_size < 1:
+            print("** users, snippets and batch size must be integers **")
+            return False
+        prefix = args[3] if len(args) > 3 else 'bench'
+        if not prefix.isalnum():
+            print("** prefix must be letters and digits **")
+            return False
+        from benchmarks import dataset
+        if models.storage.get_user_by_email(dataset.user_email(prefix, 0)):
+            print(f"** users with prefix {prefix} already exist **")
+            return False
+
+        began = time.perf_counter()
+
+        def progress(users_done, snippets_done):
+            elapsed = time.perf_counter() - began
+            print(f"\r{users_done}/{users} users, {snippets_done}/"
+                  f"{users * per_user} snippets, "
+                  f"{snippets_done / max(elapsed, 1e-9):.0f} snippets/s",
+                  end='', flush=True)
+
+        users_done, snippets_done = dataset.seed(
+            models.storage, users, per_user, batch_size, prefix=prefix,
+            progress=progress)
+        print(f"\nseeded {users_done} users and {snippets_done} snippets "
+              f"in {time.perf_counter() - began:.1f} s")
+
+    def do_loadgen(self, arg):
+        """Replays a mix of api calls against a running server
+        Usage: loadgen <url> [seconds] [concurrency] [mix] [users]
+        (default 60 s, 16 threads, a read-heavy mix and 20 users seeded
+        with prefix bench; mix is e.g. get_user_snippets=3,login=1)"""
+        args = shlex.split(arg)
+        if not args:
+            print("** server url missing **")
+            return False
+        url = urlsplit(args[0])
+        if url.scheme != 'http' or not url.hostname:
+            print("** url must be http://host:port **")
+            return False
+        try:
+            duration = float(args[1]) if len(args) > 1 else 60
+            concurrency = int(args[2]) if len(args) > 2 else 16
+            users = int(args[4]) if len(args) > 4 else 20
+        except ValueError:
+            print("** seconds, concurrency and users must be numbers **")
+            return False
+        if duration <= 0 or concurrency < 1 or users < 1:
+            print("** seconds, concurrency and users must be numbers **")
+            return False
+        from benchmarks import loadgen
+        from benchmarks.bench_endpoints import HTTPDriver
+        try:
+            mix = loadgen.parse_mix(args[3]) if len(args) > 3 and args[3] \
+                else loadgen.DEFAULT_MIX
+        except ValueError as e:
+            print(f"** {e} **")
+            return False
+
+        driver = HTTPDriver(url.hostname, url.port or 80)
+        try:
+            ctx = loadgen.RemoteContext(driver, users)
+        except (OSError, ValueError) as e:
+            print(f"** cannot prepare the load: {e} **")
+            return False
+        results = loadgen.loadgen(driver, ctx, mix, duration, concurrency)
+        print(f"{'route':24} {'requests':>9} {'errors':>7} {'rps':>8} "
+              f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for name, result in results.items():
+            print(f"{name:24} {result['requests']:9} {result['errors']:7} "
+                  f"{result['rps']:8} {result['p50_ms']:8} "
+                  f"{result['p95_ms']:8} {result['p99_ms']:8}")
+
     def do_update_snippet(self, arg):
         """Updates a snippet object"""
         args = shlex.split(arg)
@@ -167,4 +334,8 @@ class CODAVAULTAConsole(cmd.Cmd):
 
 
 if __name__ == '__main__':
-    CODAVAULTAConsole().cmdloop()
+    if len(sys.argv) > 1:
+        # One command from the command line, e.g. python3 console.py migrate
+        CODAVAULTAConsole().onecmd(shlex.join(sys.argv[1:]))
+    else:
+        CODAVAULTAConsole().cmdloop()
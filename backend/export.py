@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+"""Module turns a stream of snippets into NDJSON or zip bytes
+
+Both formats are produced as generators of byte chunks, one snippet at a
+time, so an export never holds more than a chunk in memory and its first
+bytes can be sent before the last snippet is read.
+"""
+
+import json
+import zipfile
+
+EXPORT_FILENAME = 'snippets.ndjson'
+
+
+def ndjson_lines(snippets):
+    """Yields one JSON line per snippet
+
+    Every line can be fed back to /user/import_snippets.
+
+    Args:
+        snippets (iterable): rows or objects with the snippet columns
+
+    Yields:
+        bytes of one line, newline included
+    """
+    for snippet in snippets:
+        yield json.dumps({
+            'snippet_id': snippet.snippet_id,
+            'title': snippet.title,
+            'description': snippet.description,
+            'language': snippet.language,
+            'code': snippet.code,
+            'created_at': snippet.created_at.isoformat(),
+            'updated_at': snippet.updated_at.isoformat(),
+        }).encode('utf-8') + b'\n'
+
+
+class StreamBuffer:
+    """Write-only file object collecting what zipfile writes to it
+
+    zipfile supports output it cannot seek, writing sizes after the data
+    instead of before, which is what allows the archive to be streamed.
+    """
+
+    def __init__(self):
+        """Initializes an empty buffer"""
+        self.__chunks = []
+        self.__offset = 0
+
+    def write(self, data):
+        """Keeps data until the next drain"""
+        self.__chunks.append(bytes(data))
+        self.__offset += len(data)
+        return len(data)
+
+    def tell(self):
+        """Returns the number of bytes written so far"""
+        return self.__offset
+
+    def flush(self):
+        """Nothing to flush, data leaves through drain"""
+
+    def drain(self):
+        """Returns and forgets everything written since the last drain"""
+        data = b''.join(self.__chunks)
+        self.__chunks = []
+        return data
+
+
+def zip_stream(chunks, filename=EXPORT_FILENAME):
+    """Yields a zip archive holding chunks as a single compressed file
+
+    Args:
+        chunks (iterable): bytes of the file to archive
+        filename (str): name of the file inside the archive
+
+    Yields:
+        bytes of the archive
+    """
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, mode='w',
+                         compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(filename, mode='w', force_zip64=True) as entry:
+            for chunk in chunks:
+                entry.write(chunk)
+                data = buffer.drain()
+                if data:
+                    yield data
+    yield buffer.drain()
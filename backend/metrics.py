@@ -0,0 +1,414 @@
+#!/usr/bin/python3
+"""Module records per-request metrics and serves them to Prometheus
+
+For every route the app counts the requests by status, keeps a histogram
+of their latency and adds up the SQL statements they ran, the time spent
+in them and the time spent in bcrypt. The SQL is counted through cursor
+events of the Storage engines, bcrypt by the password pool. Streamed
+responses are timed until their last byte is sent, the others until the
+view returns.
+
+GET /metrics returns them in the Prometheus text format. Each gunicorn
+worker keeps its own metrics in memory. With METRICS_DIR set, it also
+writes them to a file of its own in that directory, at most every
+METRICS_FLUSH_SECONDS and when it exits. The worker answering a scrape
+then adds up the files of all the workers, including those that exited,
+so counters never go backwards. Empty the directory when the app is
+restarted.
+"""
+
+from collections import defaultdict
+from sqlalchemy import event
+import atexit
+import contextvars
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+
+METRICS_DIR = os.getenv('METRICS_DIR') or None
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', 1))
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+# Upper bounds in seconds of the bcrypt histogram buckets
+BCRYPT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# Route of the statements that run outside a request, e.g. in the console
+BACKGROUND = 'background'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+PREFIX = 'coda_vaulta_'
+# Type and help of every metric, by name without PREFIX
+METRICS = {
+    'http_requests_total': (
+        'counter', 'Requests by route, method and status'),
+    'http_request_duration_seconds': (
+        'histogram', 'Time to handle a request, streams until the last byte'),
+    'http_sql_statements_total': (
+        'counter', 'SQL statements run by the requests of a route'),
+    'http_sql_duration_seconds_total': (
+        'counter', 'Time spent in SQL statements by the requests of a route'),
+    'http_bcrypt_duration_seconds_total': (
+        'counter', 'Time spent in bcrypt by the requests of a route'),
+    'bcrypt_duration_seconds': (
+        'histogram', 'Time bcrypt takes to hash or verify a password'),
+}
+
+# Statistics of the request being served, see RequestStats
+_current = contextvars.ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    """Work done by one request, added up while it is served"""
+
+    def __init__(self, route=None):
+        self.route = route
+        self.began = time.perf_counter()
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.bcrypt_seconds = 0.0
+
+
+def escape(value):
+    """Escapes a label value for the text format"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def format_labels(labels, extra=()):
+    """Returns the {name="value",...} of a metric line"""
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"'
+                          for name, value in pairs) + '}'
+
+
+def format_value(value):
+    """Returns a sample value as the text format writes it"""
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class Registry:
+    """Counters and histograms of a process, optionally shared in files
+
+    Counters and histograms are keyed by name and by the sorted pairs of
+    their labels. A histogram keeps the count of each bucket, the count
+    above the last bucket and the sum of the observed values.
+    """
+
+    def __init__(self, directory=METRICS_DIR,
+                 flush_seconds=METRICS_FLUSH_SECONDS):
+        """Initializes an empty registry
+
+        Args:
+            directory (str): directory shared by the worker processes, or
+                None to keep the metrics in memory only
+            flush_seconds (float): least seconds between two writes of the
+                file of this process
+        """
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self.__lock = threading.Lock()
+        self.__flush_lock = threading.Lock()
+        self.__reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self.__after_fork)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            atexit.register(self.__flush_at_exit)
+
+    def __reset(self):
+        """Forgets every value and the file of the process"""
+        self.__counters = defaultdict(float)
+        self.__histograms = {}
+        self.__path = None
+        self.__flushed = 0.0
+
+    def __after_fork(self):
+        """Starts a forked worker with no values of its own
+
+        The values recorded by the parent, if any, stay in the parent's
+        file and are not counted twice.
+        """
+        self.__lock = threading.Lock()
+        self.__flush_lock = threading.Lock()
+        self.__reset()
+
+    def __flush_at_exit(self):
+        """Writes the last values of an exiting worker, if it still can"""
+        try:
+            self.flush()
+        except OSError:
+            pass
+
+    def inc(self, name, value=1, **labels):
+        """Adds value to a counter"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.__lock:
+            self.__counters[key] += value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        """Adds an observed value to a histogram"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.__lock:
+            histogram = self.__histograms.get(key)
+            if histogram is None:
+                histogram = self.__histograms[key] = {
+                    'buckets': list(buckets),
+                    'counts': [0] * (len(buckets) + 1), 'sum': 0.0}
+            index = len(buckets)
+            for i, bound in enumerate(histogram['buckets']):
+                if value <= bound:
+                    index = i
+                    break
+            histogram['counts'][index] += 1
+            histogram['sum'] += value
+
+    def value(self, name, **labels):
+        """Returns a counter, or the number of values a histogram observed"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.__lock:
+            if key in self.__histograms:
+                return sum(self.__histograms[key]['counts'])
+            return self.__counters.get(key, 0)
+
+    def record_request(self, route, method, status, stats):
+        """Records a request once its response is sent
+
+        Args:
+            route (str): endpoint of the request
+            method (str): HTTP method
+            status (int): status code of the response
+            stats (RequestStats): work done by the request
+        """
+        self.inc('http_requests_total', route=route, method=method,
+                 status=str(status))
+        self.observe('http_request_duration_seconds',
+                     time.perf_counter() - stats.began, route=route,
+                     method=method)
+        self.inc('http_sql_statements_total', stats.sql_statements,
+                 route=route)
+        self.inc('http_sql_duration_seconds_total', stats.sql_seconds,
+                 route=route)
+        self.inc('http_bcrypt_duration_seconds_total', stats.bcrypt_seconds,
+                 route=route)
+        self.maybe_flush()
+
+    def record_sql(self, seconds):
+        """Records a statement outside a request, see track_sql"""
+        self.inc('http_sql_statements_total', route=BACKGROUND)
+        self.inc('http_sql_duration_seconds_total', seconds,
+                 route=BACKGROUND)
+
+    def record_bcrypt(self, operation, seconds):
+        """Records the time bcrypt took to hash or verify a password
+
+        Args:
+            operation (str): 'hash' or 'verify'
+            seconds (float): time bcrypt ran for
+        """
+        self.observe('bcrypt_duration_seconds', seconds,
+                     buckets=BCRYPT_BUCKETS, operation=operation)
+        stats = _current.get()
+        if stats is not None:
+            stats.bcrypt_seconds += seconds
+
+    def snapshot(self):
+        """Returns the values of this process as a dict of JSON types"""
+        with self.__lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value
+                             in self.__counters.items()],
+                'histograms': [[name, labels, dict(histogram,
+                                                   counts=list(
+                                                       histogram['counts']))]
+                               for (name, labels), histogram
+                               in self.__histograms.items()],
+            }
+
+    def flush(self):
+        """Writes the values of this process to its file in directory
+
+        The file is replaced in one rename, so readers never see half of
+        it.
+        """
+        if not self.directory:
+            return
+        with self.__flush_lock:
+            self.__write()
+
+    def __write(self):
+        """Writes the file of this process, holding the flush lock"""
+        if self.__path is None:
+            self.__path = os.path.join(
+                self.directory, f'{os.getpid()}-{uuid.uuid4().hex[:8]}.json')
+        temporary = self.__path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temporary, self.__path)
+        self.__flushed = time.monotonic()
+
+    def maybe_flush(self):
+        """Flushes if flush_seconds passed since the last flush
+
+        A thread finding another one flushing goes on without waiting.
+        """
+        if not self.directory or \
+                time.monotonic() - self.__flushed < self.flush_seconds:
+            return
+        if self.__flush_lock.acquire(blocking=False):
+            try:
+                self.__write()
+            finally:
+                self.__flush_lock.release()
+
+    def collect(self):
+        """Returns the values of all the processes, added up
+
+        Returns:
+            tuple (counters, histograms) keyed like those of the registry
+        """
+        snapshots = [self.snapshot()]
+        if self.directory:
+            for name in sorted(os.listdir(self.directory)):
+                path = os.path.join(self.directory, name)
+                if not name.endswith('.json') or path == self.__path:
+                    continue
+                try:
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue  # removed or from another version, skip it
+
+        counters, histograms = defaultdict(float), {}
+        for snapshot in snapshots:
+            for name, labels, value in snapshot['counters']:
+                counters[(name, tuple(map(tuple, labels)))] += value
+            for name, labels, histogram in snapshot['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                total = histograms.get(key)
+                if total is None:
+                    histograms[key] = dict(histogram,
+                                           counts=list(histogram['counts']))
+                elif total['buckets'] == histogram['buckets']:
+                    total['counts'] = [a + b for a, b in zip(
+                        total['counts'], histogram['counts'])]
+                    total['sum'] += histogram['sum']
+        return counters, histograms
+
+    def render(self):
+        """Returns the values of all the processes in the text format"""
+        counters, histograms = self.collect()
+        lines = []
+        for name, (kind, description) in METRICS.items():
+            lines.append(f'# HELP {PREFIX}{name} {description}')
+            lines.append(f'# TYPE {PREFIX}{name} {kind}')
+            if kind == 'counter':
+                for (key, labels), value in sorted(counters.items()):
+                    if key == name:
+                        lines.append(f'{PREFIX}{name}{format_labels(labels)} '
+                                     f'{format_value(value)}')
+                continue
+            for (key, labels), histogram in sorted(histograms.items()):
+                if key != name:
+                    continue
+                cumulative = 0
+                bounds = [format_value(bound)
+                          for bound in histogram['buckets']] + ['+Inf']
+                for bound, count in zip(bounds, histogram['counts']):
+                    cumulative += count
+                    lines.append(
+                        f'{PREFIX}{name}_bucket'
+                        f'{format_labels(labels, [("le", bound)])} '
+                        f'{cumulative}')
+                lines.append(f'{PREFIX}{name}_sum{format_labels(labels)} '
+                             f'{format_value(histogram["sum"])}')
+                lines.append(f'{PREFIX}{name}_count{format_labels(labels)} '
+                             f'{cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def current_route():
+    """Returns the endpoint of the request being served, or None"""
+    stats = _current.get()
+    return stats.route if stats is not None else None
+
+
+def track_sql(engine, metrics=registry):
+    """Counts and times the statements run on an engine
+
+    A statement run while a request is served is added to that request,
+    any other to the BACKGROUND route.
+
+    Args:
+        engine: sqlalchemy engine
+        metrics (Registry): registry of the statements run outside
+            requests
+    """
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_timer(connection, cursor, statement, parameters, context,
+                    executemany):
+        context._metrics_began = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def stop_timer(connection, cursor, statement, parameters, context,
+                   executemany):
+        seconds = time.perf_counter() - context._metrics_began
+        stats = _current.get()
+        if stats is None:
+            metrics.record_sql(seconds)
+        else:
+            stats.sql_statements += 1
+            stats.sql_seconds += seconds
+
+
+def init_app(app, metrics=registry):
+    """Records the requests of a Flask app and adds its GET /metrics
+
+    Args:
+        app: Flask application
+        metrics (Registry): registry to record to and serve
+    """
+    # Only the app needs Flask, storage and the console track SQL without it
+    from flask import Response, request
+
+    @app.before_request
+    def start_request():
+        """Starts adding up the work of the request"""
+        _current.set(RequestStats(request.endpoint or 'unmatched'))
+
+    @app.after_request
+    def end_request(response):
+        """Records the request once its response is sent"""
+        stats = _current.get()
+        if stats is None:
+            return response
+        route, method = stats.route, request.method
+        status = response.status_code
+
+        def record():
+            _current.set(None)
+            metrics.record_request(route, method, status, stats)
+
+        if inspect.isgenerator(response.response):
+            # A streamed view runs until the server closes the response
+            # after its last byte
+            response.call_on_close(record)
+        else:
+            record()
+        return response
+
+    def serve_metrics():
+        """Returns the metrics of every worker in the Prometheus format"""
+        return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+    app.add_url_rule('/metrics', 'metrics', serve_metrics, methods=['GET'])
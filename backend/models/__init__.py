@@ -1,7 +1,10 @@
 #!/usr/bin/python3
-"""Create an instance of the Storage class and reload it"""
+"""Create the instance of the Storage class
+
+Storage connects to the database on first use, importing models opens no
+connection. Tables are created with the migrate command of console.py.
+"""
 
 from models.engine.storage import Storage
 
 storage = Storage()
-storage.reload()
@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+"""Engines of the database backends storage can run on
+
+The backend is chosen by the url in DATABASE_URL: MySQL for production,
+or a SQLite file for single-node deployments and CI.
+
+SQLite is tuned for one writer alongside many readers. In WAL mode
+readers never wait for the writer and the writer never waits for
+readers. synchronous=NORMAL syncs the log at checkpoints, not on every
+commit, which stays consistent after a crash and may only lose the last
+commits on power loss. Reads go through mmap instead of copies of each
+page. A writer that finds the database locked retries for busy_timeout
+instead of failing at once. Foreign keys are enforced, as InnoDB does.
+"""
+
+from models.engine.db_configs import POOL_SIZE, MAX_OVERFLOW
+from models.engine.db_configs import POOL_RECYCLE, POOL_TIMEOUT
+from models.engine.db_configs import SQLITE_BUSY_TIMEOUT_MS, SQLITE_MMAP_SIZE
+from models.engine.db_configs import SQLITE_SYNCHRONOUS
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+
+
+def is_memory(url):
+    """Returns whether url is an in-memory SQLite database"""
+    return url.database in (None, '', ':memory:') or \
+        url.query.get('mode') == 'memory'
+
+
+def engine_options(url):
+    """Returns the create_engine keyword arguments suited to url
+
+    Args:
+        url (str): database url, its scheme picks the backend
+
+    Returns:
+        dict of keyword arguments
+    """
+    url = make_url(url)
+    if url.get_backend_name() != 'sqlite':
+        return {
+            'pool_pre_ping': True,
+            'pool_size': POOL_SIZE,
+            'max_overflow': MAX_OVERFLOW,
+            'pool_recycle': POOL_RECYCLE,
+            'pool_timeout': POOL_TIMEOUT,
+        }
+    options = {
+        # Sessions are per thread but pooled connections move between
+        # threads, never used by two at once
+        'connect_args': {'check_same_thread': False,
+                         'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000},
+    }
+    if not is_memory(url):
+        # A file needs no pre ping or recycling, just enough connections
+        options.update(pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW,
+                       pool_timeout=POOL_TIMEOUT)
+    return options
+
+
+def tune_sqlite(engine, busy_timeout_ms=SQLITE_BUSY_TIMEOUT_MS,
+                mmap_size=SQLITE_MMAP_SIZE, synchronous=SQLITE_SYNCHRONOUS):
+    """Sets the pragmas of every new connection of a SQLite engine
+
+    Args:
+        engine: SQLite engine
+        busy_timeout_ms (int): milliseconds to wait for a lock
+        mmap_size (int): bytes of the database file read through mmap
+        synchronous (str): OFF, NORMAL or FULL
+    """
+    wal = not is_memory(engine.url)
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(connection, record):
+        cursor = connection.cursor()
+        if wal:
+            cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA synchronous={synchronous}')
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout_ms)}')
+        cursor.execute(f'PRAGMA mmap_size={int(mmap_size)}')
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
+def create_storage_engine(url):
+    """Returns an engine on url configured for its backend
+
+    Args:
+        url (str): database url, e.g. mysql+mysqldb://user:pw@host/db or
+            sqlite:////var/lib/coda_vaulta/vault.db
+    """
+    engine = create_engine(url, **engine_options(url))
+    if engine.dialect.name == 'sqlite':
+        tune_sqlite(engine)
+    return engine
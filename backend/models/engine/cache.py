@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+"""Contains a bounded, thread-safe LRU cache whose entries expire"""
+
+from collections import OrderedDict
+import threading
+import time
+
+
+class LRUCache:
+    """Least recently used cache with a time to live
+
+    Holds at most maxsize entries, dropping the least recently used one
+    when full. An entry older than ttl seconds counts as a miss.
+
+    Attributes:
+        hits (int): lookups answered from the cache
+        misses (int): lookups that found nothing or an expired entry
+    """
+
+    def __init__(self, maxsize, ttl):
+        """Initializes an empty cache
+
+        Args:
+            maxsize (int): maximum number of entries, 0 disables the cache
+            ttl (float): seconds an entry stays valid
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        """Returns the number of entries, expired ones included"""
+        return len(self.__entries)
+
+    def get(self, key):
+        """Returns the value cached for key, or None"""
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self.__entries[key]
+                self.misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        """Caches value under key, evicting the oldest entry if full"""
+        if self.maxsize <= 0:
+            return
+        with self.__lock:
+            self.__entries[key] = (value, time.monotonic() + self.ttl)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.maxsize:
+                self.__entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """Removes key from the cache"""
+        with self.__lock:
+            self.__entries.pop(key, None)
+
+    def clear(self):
+        """Removes every entry from the cache"""
+        with self.__lock:
+            self.__entries.clear()
+
+    def stats(self):
+        """Returns the hit and miss counters and the current size"""
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self.__entries), 'maxsize': self.maxsize}
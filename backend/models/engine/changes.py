@@ -0,0 +1,125 @@
+#!/usr/bin/python3
+"""Change log of every user's snippets, for incremental sync
+
+The log keeps one row per snippet with the sequence number of its last
+change and whether that change deleted it, so deleted snippets stay as
+tombstones and the log never grows beyond one row per snippet ever stored.
+
+Sequence numbers are per user. They are taken from the user's SEQUENCE
+counter, whose row stays locked until the writing transaction ends, so
+two transactions writing the snippets of one user commit their numbers
+in order and a client reading up to a number never misses a change that
+commits later with a smaller one.
+
+A client that synced before the HORIZON of its user, set when the log
+is truncated, has to download everything again.
+"""
+
+from collections import defaultdict
+from models.base import Base
+from models.ids import UUID
+from models.engine import stats
+from models.engine.upsert import upsert
+from sqlalchemy import Table, Column, BigInteger, Boolean, Index
+from sqlalchemy import select, delete
+
+# Scopes of the per-user counters kept in stats_counters
+SEQUENCE = 'sequence'
+HORIZON = 'horizon'
+
+snippet_changes = Table(
+    'snippet_changes', Base.metadata,
+    Column('user_id', UUID, primary_key=True),
+    Column('snippet_id', UUID, primary_key=True),
+    Column('seq', BigInteger, nullable=False),
+    Column('deleted', Boolean, nullable=False),
+    Index('ix_snippet_changes_user_id_seq', 'user_id', 'seq'),
+)
+
+
+def record(connection, saved=(), deleted=()):
+    """Logs the snippets a transaction created, updated or deleted
+
+    Args:
+        connection: sqlalchemy connection in the writing transaction
+        saved (iterable): (user_id, snippet_id) of snippets created or
+            updated
+        deleted (iterable): (user_id, snippet_id) of snippets deleted
+
+    Returns:
+        list of the rows logged, dicts with user_id, snippet_id, seq and
+        deleted
+    """
+    changes = defaultdict(dict)
+    for is_deleted, snippets in ((False, saved), (True, deleted)):
+        for user_id, snippet_id in snippets:
+            changes[user_id][snippet_id] = is_deleted
+
+    rows = []
+    for user_id in sorted(changes):
+        snippets = sorted(changes[user_id].items())
+        stats.adjust(connection, {(SEQUENCE, user_id): len(snippets)}, 0)
+        # An int even if a driver sums the counter as a Decimal, the
+        # sequence numbers go into JSON events and responses
+        last = int(stats.get(connection, SEQUENCE, user_id))
+        first = last - len(snippets) + 1
+        rows.extend({'user_id': user_id, 'snippet_id': snippet_id,
+                     'seq': first + i, 'deleted': is_deleted}
+                    for i, (snippet_id, is_deleted) in enumerate(snippets))
+
+    upsert(connection, snippet_changes, rows, ('user_id', 'snippet_id'),
+           lambda new: {'seq': new.seq, 'deleted': new.deleted})
+    return rows
+
+
+def read(connection, user_id, since, limit):
+    """Returns the changes of a user's snippets after a sequence number
+
+    Args:
+        connection: sqlalchemy connection
+        user_id (str): owner of the snippets
+        since (int): sequence number the client synced up to
+        limit (int): maximum number of changes returned
+
+    Returns:
+        tuple (list of rows with snippet_id, seq and deleted in sequence
+        order, True if more changes follow)
+    """
+    rows = connection.execute(
+        select(snippet_changes.c.snippet_id, snippet_changes.c.seq,
+               snippet_changes.c.deleted).where(
+                   snippet_changes.c.user_id == user_id,
+                   snippet_changes.c.seq > since)
+        .order_by(snippet_changes.c.seq).limit(limit + 1)).all()
+    return rows[:limit], len(rows) > limit
+
+
+def horizon(connection, user_id):
+    """Returns the oldest sequence number the log can sync from"""
+    return stats.get(connection, HORIZON, user_id)
+
+
+def remove_users(connection, user_ids):
+    """Forgets the changes and sequence numbers of deleted users"""
+    if not user_ids:
+        return
+    connection.execute(delete(snippet_changes).where(
+        snippet_changes.c.user_id.in_(list(user_ids))))
+    for scope in (SEQUENCE, HORIZON):
+        stats.remove(connection, scope, user_ids)
+
+
+def truncate(connection):
+    """Empties the log, clients of every user will sync from scratch
+
+    Meant for snippets removed behind the log's back. Every sequence moves
+    one past the last change, so even a client that had synced everything
+    is behind the new horizon.
+    """
+    sequences = stats.counts(connection, SEQUENCE)
+    stats.adjust(connection, {(SEQUENCE, user_id): 1
+                              for user_id in sequences}, 0)
+    stats.remove(connection, HORIZON, list(sequences))
+    stats.adjust(connection, {(HORIZON, user_id): value + 1 for
+                              user_id, value in sequences.items()}, 0)
+    connection.execute(delete(snippet_changes))
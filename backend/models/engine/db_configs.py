@@ -16,3 +16,51 @@ USER = os.getenv('DB_USER')
 PASSWORD = os.getenv('PASSWORD')
 HOST = os.getenv('HOST')
 PORT = os.getenv('PORT')
+
+# Database storage runs on, chosen by the scheme of the url, e.g.
+# sqlite:////var/lib/coda_vaulta/vault.db, MySQL from the values above
+# by default, see models/engine/backends.py
+DATABASE_URL = os.getenv('DATABASE_URL',
+                         f'mysql+mysqldb://{USER}:{PASSWORD}@{HOST}/{DB}')
+
+# Read replicas of DATABASE_URL, comma separated, and the seconds a user
+# keeps reading from the primary after a write to their data
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv(
+    'DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+REPLICA_PIN_SECONDS = float(os.getenv('REPLICA_PIN_SECONDS', 5))
+# SQLite file the pins are shared through by the workers of a node
+REPLICA_PINS_DB = os.getenv('REPLICA_PINS_DB', '/tmp/coda_vaulta_pins.db')
+
+# Tuning of the SQLite backend
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+
+# Connection pool, shared by all the threads of a worker process
+POOL_SIZE = int(os.getenv('POOL_SIZE', 5))
+MAX_OVERFLOW = int(os.getenv('MAX_OVERFLOW', 10))
+POOL_RECYCLE = int(os.getenv('POOL_RECYCLE', 3600))
+POOL_TIMEOUT = int(os.getenv('POOL_TIMEOUT', 30))
+
+# Users looked up by the authenticated endpoints, cached per worker process
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', 60))
+
+# Broker of the snippet change events, 'local' delivers within a worker
+# process, 'sqlite' shares them between the workers through EVENTS_DB
+EVENTS_BROKER = os.getenv('EVENTS_BROKER', 'local')
+EVENTS_DB = os.getenv('EVENTS_DB', '/tmp/coda_vaulta_events.db')
+
+# Group commit of the snippets created by concurrent requests, off when
+# the window is 0, see models/engine/group_commit.py
+GROUP_COMMIT_WINDOW_MS = float(os.getenv('GROUP_COMMIT_WINDOW_MS', 0))
+GROUP_COMMIT_SIZE = int(os.getenv('GROUP_COMMIT_SIZE', 64))
+
+# Statements slower than SLOW_QUERY_MS are written with their plan to
+# SLOW_QUERY_LOG, rotated at SLOW_QUERY_LOG_BYTES, off when it is 0, see
+# models/engine/slow_queries.py
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 0))
+SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG',
+                           '/tmp/coda_vaulta_slow_queries.log')
+SLOW_QUERY_LOG_BYTES = int(os.getenv('SLOW_QUERY_LOG_BYTES', 10 * 1024 * 1024))
+SLOW_QUERY_LOG_BACKUPS = int(os.getenv('SLOW_QUERY_LOG_BACKUPS', 5))
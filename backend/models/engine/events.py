@@ -0,0 +1,272 @@
+#!/usr/bin/python3
+"""Contains the brokers pushing snippet change events to subscribers
+
+Storage publishes an event for every snippet it writes once the write is
+committed, and each open /user/events stream holds a Subscription to the
+events of its user.
+
+A subscription is a queue and a condition, not a thread, so holding
+thousands of them costs memory only. The stream waiting on it needs a
+worker that does not spend a thread per request either, such as gunicorn's
+gevent worker, which turns every wait here into a greenlet switch.
+
+LocalBroker delivers within one process. SQLiteBroker shares the events
+of every worker process of a node through a SQLite file: publishers
+append to it and one thread per process reads the new rows and delivers
+them to the local subscriptions.
+"""
+
+from collections import defaultdict, deque
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+# Events a subscription holds before it gives up and asks for a resync
+MAX_PENDING_EVENTS = 256
+# Seconds between two reads of the SQLite queue
+POLL_INTERVAL = 0.1
+# Seconds an event stays in the SQLite queue
+RETENTION = 60
+
+# Sent instead of the events a subscription could not hold, the client
+# catches up with the change feed
+RESYNC = {'type': 'resync'}
+
+
+def format_sse(event):
+    """Returns an event as a server-sent event message
+
+    The sequence number of the change becomes the id of the message, which
+    the browser sends back in Last-Event-ID when it reconnects.
+
+    Args:
+        event (dict): event with a 'type', and a 'seq' for snippet changes
+
+    Returns:
+        str of the message, ended by a blank line
+    """
+    lines = []
+    if 'seq' in event:
+        lines.append(f"id: {event['seq']}")
+    lines.append(f"event: {event['type']}")
+    lines.append(f"data: {json.dumps(event)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+class Subscription:
+    """Queue of the events of one user for one stream"""
+
+    def __init__(self, broker, user_id, max_pending=MAX_PENDING_EVENTS):
+        """Initializes an empty subscription
+
+        Args:
+            broker: broker the subscription belongs to
+            user_id (str): user whose events are delivered
+            max_pending (int): events held before a RESYNC replaces them
+        """
+        self.user_id = user_id
+        self.max_pending = max_pending
+        self.__broker = broker
+        self.__pending = deque()
+        self.__ready = threading.Condition()
+
+    def put(self, event):
+        """Queues an event, or a RESYNC if the subscriber fell behind"""
+        with self.__ready:
+            if self.__pending and self.__pending[-1] is RESYNC:
+                return
+            if len(self.__pending) >= self.max_pending:
+                self.__pending.clear()
+                event = RESYNC
+            self.__pending.append(event)
+            self.__ready.notify()
+
+    def get(self, timeout=None):
+        """Waits for events and returns every one queued
+
+        Args:
+            timeout (float): seconds to wait, forever if None
+
+        Returns:
+            list of events, empty if none came within timeout
+        """
+        with self.__ready:
+            if not self.__pending:
+                self.__ready.wait(timeout)
+            events = list(self.__pending)
+            self.__pending.clear()
+        return events
+
+    def close(self):
+        """Stops the delivery of events to this subscription"""
+        self.__broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """Delivers events to the subscriptions of the current process"""
+
+    def __init__(self, max_pending=MAX_PENDING_EVENTS):
+        """Initializes a broker without subscriptions
+
+        Args:
+            max_pending (int): events each subscription holds
+        """
+        self.max_pending = max_pending
+        self.__subscriptions = defaultdict(set)
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        """Returns the number of open subscriptions"""
+        with self.__lock:
+            return sum(map(len, self.__subscriptions.values()))
+
+    def subscribe(self, user_id):
+        """Returns a new Subscription to the events of a user"""
+        subscription = Subscription(self, user_id, self.max_pending)
+        with self.__lock:
+            self.__subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Removes a subscription, does nothing if it was removed already"""
+        with self.__lock:
+            subscriptions = self.__subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.__subscriptions[subscription.user_id]
+
+    def publish(self, events):
+        """Delivers events to the subscriptions of their users
+
+        Args:
+            events (iterable): (user_id, event) tuples
+        """
+        with self.__lock:
+            targets = [(subscription, event) for user_id, event in events
+                       for subscription in self.__subscriptions.get(
+                           user_id, ())]
+        for subscription, event in targets:
+            subscription.put(event)
+
+    def close(self):
+        """Releases what the broker holds, nothing for a LocalBroker"""
+
+
+class SQLiteBroker(LocalBroker):
+    """Shares events between the processes of a node through a SQLite file
+
+    Every process opens the same file. publish only appends the events to
+    it; a thread per process, started with the first subscription, reads
+    the rows appended since its last read and delivers them locally, so
+    the publishing process gets its own events the same way as the others.
+    """
+
+    def __init__(self, path, poll_interval=POLL_INTERVAL,
+                 retention=RETENTION, max_pending=MAX_PENDING_EVENTS):
+        """Initializes the broker and creates its queue if missing
+
+        Args:
+            path (str): SQLite file shared by the processes
+            poll_interval (float): seconds between two reads of the queue
+            retention (float): seconds an event stays in the queue
+            max_pending (int): events each subscription holds
+        """
+        super().__init__(max_pending)
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.__local = threading.local()
+        self.__closed = threading.Event()
+        self.__poller = None
+        self.__pid = None
+        self.__start_lock = threading.Lock()
+        self.__connect().execute(
+            'CREATE TABLE IF NOT EXISTS events ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, '
+            'data TEXT NOT NULL, created_at REAL NOT NULL)')
+
+    def __connect(self):
+        """Returns the SQLite connection of the current thread"""
+        connection = getattr(self.__local, 'connection', None)
+        if connection is None or self.__local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5,
+                                         isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.__local.connection = connection
+            self.__local.pid = os.getpid()
+        return connection
+
+    def publish(self, events):
+        """Appends events to the queue shared by the processes
+
+        Args:
+            events (iterable): (user_id, event) tuples
+        """
+        now = time.time()
+        rows = [(user_id, json.dumps(event), now)
+                for user_id, event in events]
+        if not rows:
+            return
+        connection = self.__connect()
+        connection.executemany(
+            'INSERT INTO events (user_id, data, created_at) '
+            'VALUES (?, ?, ?)', rows)
+        connection.execute('DELETE FROM events WHERE created_at < ?',
+                           (now - self.retention,))
+
+    def subscribe(self, user_id):
+        """Returns a new Subscription, reading the queue from now on"""
+        with self.__start_lock:
+            if self.__poller is None or self.__pid != os.getpid():
+                # A forked worker has no copy of its parent's thread
+                last_id = self.__connect().execute(
+                    'SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+                self.__poller = threading.Thread(
+                    target=self.__poll, args=(last_id,), daemon=True)
+                self.__pid = os.getpid()
+                self.__poller.start()
+        return super().subscribe(user_id)
+
+    def __poll(self, last_id):
+        """Delivers the events appended to the queue until closed"""
+        while not self.__closed.wait(self.poll_interval):
+            try:
+                rows = self.__connect().execute(
+                    'SELECT id, user_id, data FROM events WHERE id > ? '
+                    'ORDER BY id', (last_id,)).fetchall()
+            except sqlite3.Error as e:
+                logging.error(f"Cannot read the event queue: {e}")
+                continue
+            if rows:
+                last_id = rows[-1][0]
+                super().publish((user_id, json.loads(data))
+                                for _, user_id, data in rows)
+
+    def close(self):
+        """Stops the thread reading the queue"""
+        self.__closed.set()
+        if self.__poller is not None and self.__pid == os.getpid():
+            self.__poller.join()
+
+
+def create_broker(name, path=None):
+    """Returns the broker configured by EVENTS_BROKER
+
+    Args:
+        name (str): 'local' for a LocalBroker, 'sqlite' for a SQLiteBroker
+        path (str): SQLite file of a SQLiteBroker
+
+    Raises:
+        ValueError: if name is not a known broker
+    """
+    if name == 'local':
+        return LocalBroker()
+    if name == 'sqlite':
+        return SQLiteBroker(path)
+    raise ValueError(f'Unknown events broker: {name}')
@@ -0,0 +1,112 @@
+#!/usr/bin/python3
+"""Contains the group commit coalescing concurrent writes
+
+Every commit waits for the database to flush its log to disk, which
+bounds a worker to a few hundred commits a second whatever their size.
+GroupCommit gathers the items submitted by concurrent threads within a
+short window into one batch, commits the batch in one transaction and
+hands each thread the result of its own item.
+
+No thread runs the batches. The first thread to submit into an empty
+batch leads it: it waits for the window to pass or the batch to fill,
+commits it and wakes the others.
+"""
+
+import threading
+
+
+class _Batch:
+    """Items gathered for one commit and their results"""
+
+    def __init__(self):
+        """Initializes an empty, open batch"""
+        self.items = []
+        self.results = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+
+class GroupCommit:
+    """Coalesces the items submitted by concurrent threads into batches
+
+    Attributes:
+        batches (int): number of batches committed
+    """
+
+    def __init__(self, commit, window, max_size):
+        """Initializes the group commit
+
+        Args:
+            commit (callable): commits a list of items in one transaction
+                and returns the list of their results, in the same order
+            window (float): seconds the leader of a batch waits for more
+                items
+            max_size (int): items that close a batch before the window
+                has passed
+        """
+        self.commit = commit
+        self.window = window
+        self.max_size = max_size
+        self.batches = 0
+        self.__batch = None
+        self.__lock = threading.Lock()
+
+    def submit(self, item):
+        """Commits an item together with those submitted at the same time
+
+        Args:
+            item: item passed in the list given to commit
+
+        Raises:
+            Exception: whatever commit raised for this item
+
+        Returns:
+            the result commit returned for this item
+        """
+        with self.__lock:
+            batch = self.__batch
+            leader = batch is None
+            if leader:
+                batch = self.__batch = _Batch()
+            index = len(batch.items)
+            batch.items.append(item)
+            if len(batch.items) >= self.max_size:
+                self.__batch = None
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self.__lock:
+                if self.__batch is batch:
+                    self.__batch = None
+            try:
+                self.__run(batch)
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+
+        result = batch.results[index]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def __run(self, batch):
+        """Commits a closed batch and stores the result of every item
+
+        When the batch as a whole fails, its items are committed one at a
+        time, so that only the items at fault fail.
+        """
+        self.batches += 1
+        try:
+            batch.results = list(self.commit(batch.items))
+            return
+        except Exception as e:
+            if len(batch.items) == 1:
+                batch.results = [e]
+                return
+        for item in batch.items:
+            try:
+                batch.results.extend(self.commit([item]))
+            except Exception as e:
+                batch.results.append(e)
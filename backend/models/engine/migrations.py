@@ -0,0 +1,385 @@
+#!/usr/bin/python3
+"""Brings an existing database up to date with the models
+
+Base.metadata.create_all only creates tables that do not exist yet, it never
+alters a table that is already there. The functions in this module compare
+the live schema with the models and add whatever is missing, without
+rebuilding the tables, except to convert the ids stored as text before
+they became 16-byte uuids, see convert_ids.
+"""
+
+from models.base import Base
+from models.ids import UUID
+from models.engine import changes, search, stats
+from sqlalchemy import inspect, select, update, insert, bindparam, tuple_
+from sqlalchemy import literal
+from sqlalchemy import MetaData, Table, String
+from sqlalchemy.schema import CreateIndex, CreateColumn
+from itertools import chain
+import logging
+
+BACKFILL_BATCH_SIZE = 500
+# Rows copied per statement when a table is rebuilt
+COPY_BATCH_SIZE = 1000
+
+
+def missing_columns(connection):
+    """Returns the columns declared on the models but absent from database
+
+    Args:
+        connection: sqlalchemy connection to the database
+
+    Returns:
+        list of sqlalchemy Column objects
+    """
+    inspector = inspect(connection)
+    existing_tables = inspector.get_table_names()
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column['name'] for column in inspector.get_columns(
+            table.name)}
+        missing.extend(column for column in table.columns
+                       if column.name not in existing)
+    return missing
+
+
+def add_column(connection, column):
+    """Adds a column to a table that already exists
+
+    On MySQL the column is added with ALGORITHM=INPLACE, LOCK=NONE like
+    the indexes. The column must be nullable or have a server default.
+
+    Args:
+        connection: sqlalchemy connection to the database
+        column (Column): column declared on a model
+    """
+    dialect = connection.dialect
+    preparer = dialect.identifier_preparer
+    definition = CreateColumn(column).compile(dialect=dialect)
+    online = ', ALGORITHM=INPLACE, LOCK=NONE' if dialect.name == 'mysql' \
+        else ''
+    connection.exec_driver_sql(
+        f'ALTER TABLE {preparer.format_table(column.table)} '
+        f'ADD COLUMN {definition}{online}')
+
+
+def backfill_code_summaries(connection, batch_size=BACKFILL_BATCH_SIZE):
+    """Computes the summary columns of snippets stored before they existed
+
+    Snippets without a code_preview are read and updated batch by batch,
+    each batch in its own transaction.
+
+    Args:
+        connection: sqlalchemy connection to the database
+        batch_size (int): snippets updated per transaction
+
+    Returns:
+        number of snippets updated
+    """
+    from models.snippet import Snippet, summarize_code
+
+    statement = update(Snippet.__table__).where(
+        Snippet.__table__.c.snippet_id == bindparam('id')).values(
+            line_count=bindparam('line_count'),
+            byte_size=bindparam('byte_size'),
+            code_preview=bindparam('code_preview'))
+    count = 0
+    while True:
+        rows = connection.execute(
+            select(Snippet.snippet_id, Snippet.code).where(
+                Snippet.code_preview.is_(None)).limit(batch_size)).all()
+        if not rows:
+            return count
+        connection.execute(statement, [
+            dict(summarize_code(row.code), id=row.snippet_id)
+            for row in rows])
+        connection.commit()
+        count += len(rows)
+
+
+def missing_indexes(connection):
+    """Returns the indexes declared on the models but absent from database
+
+    Args:
+        connection: sqlalchemy connection to the database
+
+    Returns:
+        list of sqlalchemy Index objects
+    """
+    inspector = inspect(connection)
+    existing_tables = inspector.get_table_names()
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(
+            table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name not in existing:
+                missing.append(index)
+    return missing
+
+
+def add_index(connection, index):
+    """Adds an index to a table that already exists
+
+    On MySQL the index is built with ALGORITHM=INPLACE, LOCK=NONE, so that
+    reads and writes to the table carry on while it is being built. Other
+    databases use a plain CREATE INDEX.
+
+    Args:
+        connection: sqlalchemy connection to the database
+        index (Index): index declared on a model
+    """
+    dialect = connection.dialect
+    if dialect.name == 'mysql':
+        preparer = dialect.identifier_preparer
+        columns = ', '.join(
+            preparer.quote(column.name) for column in index.columns)
+        unique = 'UNIQUE ' if index.unique else ''
+        connection.exec_driver_sql(
+            f'ALTER TABLE {preparer.format_table(index.table)} '
+            f'ADD {unique}INDEX {preparer.quote(index.name)} ({columns}), '
+            f'ALGORITHM=INPLACE, LOCK=NONE')
+    else:
+        connection.execute(CreateIndex(index))
+
+
+def text_id_tables(connection):
+    """Returns the tables whose uuid columns are still stored as text
+
+    Args:
+        connection: sqlalchemy connection to the database
+
+    Returns:
+        list of sqlalchemy Table objects, referenced tables first
+    """
+    inspector = inspect(connection)
+    existing_tables = inspector.get_table_names()
+    tables = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        types = {column['name']: column['type'] for column in
+                 inspector.get_columns(table.name)}
+        if any(isinstance(column.type, UUID) and
+               isinstance(types.get(column.name), String)
+               for column in table.columns):
+            tables.append(table)
+    return tables
+
+
+def keyset_pages(connection, columns, key, batch_size):
+    """Yields the rows of a table page by page, in the order of key
+
+    Each page is read in full by a query of its own starting after the
+    key of the last row of the previous page. No cursor is left open
+    between pages, so the connection can be written to in between, which
+    MySQL refuses while a streamed result still has unread rows.
+
+    Args:
+        connection: sqlalchemy connection to the database
+        columns (list): columns to read, key among them
+        key (list): columns of a unique key, e.g. the primary key
+        batch_size (int): rows per page
+    """
+    positions = [list(columns).index(column) for column in key]
+    last = None
+    while True:
+        query = select(*columns).order_by(*key).limit(batch_size)
+        if last is not None:
+            # Bound with the type of their column, e.g. uuids as bytes
+            query = query.where(tuple_(*key) > tuple_(*[
+                literal(value, column.type)
+                for column, value in zip(key, last)]))
+        rows = connection.execute(query).all()
+        if not rows:
+            return
+        yield rows
+        last = [rows[-1][position] for position in positions]
+
+
+def convert_ids(connection, tables, batch_size=COPY_BATCH_SIZE):
+    """Rebuilds tables to store their text uuids in 16 bytes
+
+    A column type cannot be changed in place on SQLite, and on MySQL the
+    foreign keys of the snippets forbid changing the users' key alone, so
+    each table is renamed, created again from the models and filled from
+    the renamed copy, referenced tables first. The copies are dropped at
+    the end, referencing tables first. The ids keep their value, only
+    their storage changes.
+
+    MySQL commits every statement changing the schema, run it with the
+    application stopped.
+
+    Args:
+        connection: sqlalchemy connection to the database
+        tables (list): tables to rebuild, from text_id_tables
+        batch_size (int): rows copied per statement
+
+    Returns:
+        number of rows copied
+    """
+    dialect = connection.dialect
+    preparer = dialect.identifier_preparer
+    copied = 0
+    old_tables = []
+    for table in tables:
+        old_name = f'{table.name}_text_ids'
+        connection.exec_driver_sql(
+            f'ALTER TABLE {preparer.quote(table.name)} '
+            f'RENAME TO {preparer.quote(old_name)}')
+        if dialect.name == 'sqlite':
+            # Index names are global on SQLite, free them for the new table
+            for index in inspect(connection).get_indexes(old_name):
+                connection.exec_driver_sql(
+                    f'DROP INDEX {preparer.quote(index["name"])}')
+        table.create(connection)
+
+        old = Table(old_name, MetaData(), autoload_with=connection)
+        names = [column.name for column in table.columns
+                 if column.name in old.c]
+        columns = [old.c[name] for name in names]
+        key = [old.c[column.name] for column in table.primary_key]
+        for batch in keyset_pages(connection, columns, key, batch_size):
+            connection.execute(insert(table), [
+                dict(zip(names, row)) for row in batch])
+            copied += len(batch)
+        connection.commit()
+        old_tables.append(old)
+
+    for old in reversed(old_tables):
+        old.drop(connection)
+    connection.commit()
+    return copied
+
+
+def fill_counters(connection):
+    """Counts users and snippets if the counters were never filled in
+
+    Happens once, on a database that had users before the counters
+    existed. The counters are kept up to date from then on.
+
+    Returns:
+        True if the counters were filled in
+    """
+    users = Base.metadata.tables['users']
+    if not stats.is_empty(connection) or connection.execute(
+            select(users.c.user_id).limit(1)).first() is None:
+        return False
+    stats.reconcile(connection)
+    connection.commit()
+    return True
+
+
+def fill_search_index(connection, batch_size=BACKFILL_BATCH_SIZE):
+    """Indexes the snippets if the search index was never filled in
+
+    Happens once, on a database that had snippets before the search
+    tables existed. The index is kept up to date from then on.
+
+    Returns:
+        number of snippets indexed
+    """
+    snippets = Base.metadata.tables['snippets']
+    if connection.execute(select(search.search_documents.c.snippet_id)
+                          .limit(1)).first() is not None or \
+            connection.execute(select(snippets.c.snippet_id)
+                               .limit(1)).first() is None:
+        return 0
+    count = search.rebuild(connection, chain.from_iterable(keyset_pages(
+        connection, list(snippets.columns), [snippets.c.snippet_id],
+        batch_size)))
+    connection.commit()
+    return count
+
+
+def fill_change_log(connection, batch_size=BACKFILL_BATCH_SIZE):
+    """Logs every snippet as a change if the change log was never filled in
+
+    Happens once, on a database that had snippets before the change log
+    existed, so that a client syncing from 0 gets them. Each snippet gets
+    the next sequence number of its user.
+
+    Returns:
+        number of snippets logged
+    """
+    snippets = Base.metadata.tables['snippets']
+    if connection.execute(select(changes.snippet_changes.c.snippet_id)
+                          .limit(1)).first() is not None or \
+            connection.execute(select(snippets.c.snippet_id)
+                               .limit(1)).first() is None:
+        return 0
+    count = 0
+    for batch in keyset_pages(connection,
+                              [snippets.c.user_id, snippets.c.snippet_id],
+                              [snippets.c.snippet_id], batch_size):
+        changes.record(connection, saved=[
+            (row.user_id, row.snippet_id) for row in batch])
+        count += len(batch)
+    connection.commit()
+    return count
+
+
+def migrate(engine):
+    """Creates missing tables, adds missing columns and indexes
+
+    Safe to run any number of times, only what is missing gets applied.
+    Ids stored as text are converted once, see convert_ids, and counters,
+    the search index and the change log are filled in the first time, see
+    fill_counters, fill_search_index and fill_change_log.
+
+    Args:
+        engine: sqlalchemy engine of the database to migrate
+
+    Returns:
+        list of the names of the tables, columns and indexes that were
+        added, and '<table> ids' for the tables whose ids were converted
+    """
+    applied = []
+
+    existing_tables = inspect(engine).get_table_names()
+    new_tables = [table for table in Base.metadata.sorted_tables
+                  if table.name not in existing_tables]
+    if new_tables:
+        Base.metadata.create_all(engine, tables=new_tables)
+        applied.extend(table.name for table in new_tables)
+
+    with engine.connect() as connection:
+        columns = missing_columns(connection)
+        for column in columns:
+            logging.info(f"Adding column {column.name} to {column.table.name}")
+            add_column(connection, column)
+            connection.commit()
+            applied.append(f'{column.table.name}.{column.name}')
+        if any(column.table.name == 'snippets' and
+               column.name == 'code_preview' for column in columns):
+            count = backfill_code_summaries(connection)
+            logging.info(f"Summarized the code of {count} snippets")
+
+        tables = text_id_tables(connection)
+        if tables:
+            count = convert_ids(connection, tables)
+            logging.info(f"Converted the ids of {count} rows to binary")
+            applied.extend(f'{table.name} ids' for table in tables)
+
+        for index in missing_indexes(connection):
+            logging.info(f"Adding index {index.name} to {index.table.name}")
+            add_index(connection, index)
+            connection.commit()
+            applied.append(index.name)
+
+        if fill_counters(connection):
+            logging.info("Counted the existing users and snippets")
+
+        count = fill_search_index(connection)
+        if count:
+            logging.info(f"Indexed {count} existing snippets for search")
+
+        count = fill_change_log(connection)
+        if count:
+            logging.info(f"Logged {count} existing snippets as changes")
+
+    return applied
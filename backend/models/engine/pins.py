@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+"""Contains the pins sending the reads of a user to the primary
+
+After a write to a user's data, Storage pins the user so that their reads
+go to the primary for a few seconds while the replicas catch up. gunicorn
+spreads the requests of a user across its worker processes, so the pins
+are kept in a SQLite file every worker of the node opens, the same way
+SQLiteBroker shares events: the worker that served the write pins the
+user and the others see it at the user's next read.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+
+class ReplicaPins:
+    """Deadlines until which users read from the primary, in a SQLite file
+
+    Deadlines are wall clock times, as they are compared by several
+    processes. A pin that cannot be read counts as pinned, reading from
+    the primary is always correct.
+    """
+
+    def __init__(self, path, seconds):
+        """Initializes the pins and creates their table if missing
+
+        Args:
+            path (str): SQLite file shared by the processes
+            seconds (float): seconds a user stays pinned after a write
+        """
+        self.path = path
+        self.seconds = seconds
+        self.__local = threading.local()
+        self.__connect().execute(
+            'CREATE TABLE IF NOT EXISTS pins ('
+            'user_id TEXT PRIMARY KEY, deadline REAL NOT NULL)')
+
+    def __connect(self):
+        """Returns the SQLite connection of the current thread"""
+        connection = getattr(self.__local, 'connection', None)
+        if connection is None or self.__local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5,
+                                         isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.__local.connection = connection
+            self.__local.pid = os.getpid()
+        return connection
+
+    def pin(self, user_ids):
+        """Sends the reads of users to the primary for the pin window
+
+        The expired pins are dropped at the same time. A failure is logged
+        and not raised, as the write that led to it is already committed.
+
+        Args:
+            user_ids (iterable): ids of the users whose data was written
+        """
+        now = time.time()
+        rows = [(str(user_id), now + self.seconds) for user_id in user_ids]
+        if not rows:
+            return
+        try:
+            connection = self.__connect()
+            connection.executemany(
+                'INSERT OR REPLACE INTO pins (user_id, deadline) '
+                'VALUES (?, ?)', rows)
+            connection.execute('DELETE FROM pins WHERE deadline < ?',
+                               (now,))
+        except sqlite3.Error as e:
+            logging.error(f"Cannot pin users to the primary: {e}")
+
+    def pinned(self, user_id):
+        """Returns whether a user reads from the primary"""
+        try:
+            row = self.__connect().execute(
+                'SELECT deadline FROM pins WHERE user_id = ?',
+                (str(user_id),)).fetchone()
+        except sqlite3.Error as e:
+            logging.error(f"Cannot read the replica pins: {e}")
+            return True
+        return row is not None and row[0] > time.time()
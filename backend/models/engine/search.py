@@ -0,0 +1,211 @@
+#!/usr/bin/python3
+"""Inverted index over snippet titles, descriptions and code
+
+Every snippet is split into code-aware terms: whole identifiers plus their
+snake_case and camelCase parts, so 'getUserById' is found by 'getuserbyid',
+'user' or 'id'. The index keeps one posting per (user, term, snippet) with
+the term frequency, and queries are ranked with BM25.
+
+Storage keeps the index up to date in the same transaction as the snippet
+writes, see Storage.__after_flush.
+"""
+
+from collections import Counter
+from math import log
+from models.base import Base
+from models.ids import UUID
+from sqlalchemy import Table, Column, String, Integer, Index
+from sqlalchemy import select, delete, insert, func
+import re
+
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 32
+# Terms found in the title count this many times
+TITLE_WEIGHT = 3
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+WORD_PATTERN = re.compile(r'[A-Za-z0-9_]+')
+PART_PATTERN = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+')
+
+search_postings = Table(
+    'search_postings', Base.metadata,
+    Column('user_id', UUID, primary_key=True),
+    Column('term', String(MAX_TERM_LENGTH), primary_key=True),
+    Column('snippet_id', UUID, primary_key=True),
+    Column('language', String(20), nullable=False),
+    Column('tf', Integer, nullable=False),
+    Column('doc_length', Integer, nullable=False),
+    Index('ix_search_postings_snippet_id', 'snippet_id'),
+)
+
+search_documents = Table(
+    'search_documents', Base.metadata,
+    Column('snippet_id', UUID, primary_key=True),
+    Column('user_id', UUID, nullable=False),
+    Column('language', String(20), nullable=False),
+    Column('length', Integer, nullable=False),
+    Index('ix_search_documents_user_id_language', 'user_id', 'language'),
+)
+
+
+def tokenize(text):
+    """Splits text into lowercase search terms
+
+    Args:
+        text (str): title, description, code or query
+
+    Returns:
+        list of terms, with repetitions
+    """
+    terms = []
+    for word in WORD_PATTERN.findall(text or ''):
+        parts = [part.lower() for piece in word.split('_')
+                 for part in PART_PATTERN.findall(piece)]
+        whole = word.lower().strip('_')
+        if len(whole) >= MIN_TERM_LENGTH:
+            terms.append(whole[:MAX_TERM_LENGTH])
+        if len(parts) > 1:
+            terms.extend(part[:MAX_TERM_LENGTH] for part in parts
+                         if len(part) >= MIN_TERM_LENGTH)
+    return terms
+
+
+def snippet_terms(title, description, code):
+    """Returns the term frequencies of a snippet as a Counter"""
+    terms = Counter(tokenize(description))
+    terms.update(tokenize(code))
+    for term in tokenize(title):
+        terms[term] += TITLE_WEIGHT
+    return terms
+
+
+def index_snippets(connection, snippets, replace=True):
+    """Adds snippets to the index
+
+    Args:
+        connection: sqlalchemy connection in the writing transaction
+        snippets (list): objects or rows with snippet_id, user_id,
+            language, title, description and code
+        replace (bool): remove previous entries of the snippets first,
+            False is only safe for snippets that were never indexed
+    """
+    if not snippets:
+        return
+    if replace:
+        remove_snippets(connection, [s.snippet_id for s in snippets])
+
+    documents, postings = [], []
+    for snippet in snippets:
+        terms = snippet_terms(
+            snippet.title, snippet.description, snippet.code)
+        length = sum(terms.values())
+        documents.append({
+            'snippet_id': snippet.snippet_id,
+            'user_id': snippet.user_id,
+            'language': snippet.language,
+            'length': length})
+        postings.extend({
+            'user_id': snippet.user_id,
+            'term': term,
+            'snippet_id': snippet.snippet_id,
+            'language': snippet.language,
+            'tf': tf,
+            'doc_length': length} for term, tf in terms.items())
+
+    connection.execute(insert(search_documents), documents)
+    if postings:
+        connection.execute(insert(search_postings), postings)
+
+
+def remove_snippets(connection, snippet_ids):
+    """Removes snippets from the index"""
+    if not snippet_ids:
+        return
+    snippet_ids = list(snippet_ids)
+    connection.execute(delete(search_postings).where(
+        search_postings.c.snippet_id.in_(snippet_ids)))
+    connection.execute(delete(search_documents).where(
+        search_documents.c.snippet_id.in_(snippet_ids)))
+
+
+def remove_user(connection, user_id):
+    """Removes every snippet of a user from the index"""
+    connection.execute(delete(search_postings).where(
+        search_postings.c.user_id == user_id))
+    connection.execute(delete(search_documents).where(
+        search_documents.c.user_id == user_id))
+
+
+def search(connection, user_id, query, language=None, limit=20):
+    """Ranks the snippets of a user against a query with BM25
+
+    Args:
+        connection: sqlalchemy connection
+        user_id (str): owner of the snippets searched
+        query (str): free text, tokenized like the snippets
+        language (str): only search snippets of this language if given
+        limit (int): maximum number of results
+
+    Returns:
+        list of (snippet_id, score) tuples, best match first
+    """
+    terms = set(tokenize(query))
+    if not terms:
+        return []
+
+    stats = select(func.count(), func.avg(search_documents.c.length)).where(
+        search_documents.c.user_id == user_id)
+    postings = select(
+        search_postings.c.term, search_postings.c.snippet_id,
+        search_postings.c.tf, search_postings.c.doc_length).where(
+            search_postings.c.user_id == user_id,
+            search_postings.c.term.in_(terms))
+    if language is not None:
+        stats = stats.where(search_documents.c.language == language)
+        postings = postings.where(search_postings.c.language == language)
+
+    total, average_length = connection.execute(stats).one()
+    if not total:
+        return []
+    average_length = float(average_length) or 1.0
+
+    rows = connection.execute(postings).all()
+    frequencies = Counter(row.term for row in rows)
+    scores = Counter()
+    for row in rows:
+        df = frequencies[row.term]
+        idf = log(1 + (total - df + 0.5) / (df + 0.5))
+        norm = K1 * (1 - B + B * row.doc_length / average_length)
+        scores[row.snippet_id] += idf * row.tf * (K1 + 1) / (row.tf + norm)
+
+    return scores.most_common(limit)
+
+
+def clear(connection):
+    """Removes every snippet from the index"""
+    connection.execute(delete(search_postings))
+    connection.execute(delete(search_documents))
+
+
+def rebuild(connection, snippets):
+    """Empties the index and indexes snippets again from scratch
+
+    Args:
+        connection: sqlalchemy connection
+        snippets (iterable): every snippet in the database
+
+    Returns:
+        number of snippets indexed
+    """
+    clear(connection)
+    count, batch = 0, []
+    for snippet in snippets:
+        batch.append(snippet)
+        if len(batch) == 500:
+            index_snippets(connection, batch, replace=False)
+            count += len(batch)
+            batch = []
+    index_snippets(connection, batch, replace=False)
+    return count + len(batch)
@@ -0,0 +1,178 @@
+#!/usr/bin/python3
+"""Logs the statements of an engine that run slower than a threshold
+
+Each slow statement is written as one JSON line with its duration, its
+parameters redacted, the Storage method that ran it and the route of the
+request being served. The database's plan for it is included: EXPLAIN
+QUERY PLAN on SQLite, EXPLAIN on MySQL. The plan is read right after the
+statement, on the same connection and with the same parameters, so it is
+the plan the statement got. Full scans show up as SCAN on SQLite and as
+type ALL on MySQL.
+
+Parameters are redacted as they may hold emails, password hashes or
+code: strings and bytes become their type and length, numbers, dates and
+None are kept. The log file rotates at a given size.
+
+Logging is opt-in, see SLOW_QUERY_MS in db_configs.py. Statements under
+the threshold cost two timer reads.
+"""
+
+from datetime import date, datetime
+from logging.handlers import RotatingFileHandler
+from metrics import current_route
+from models.engine.db_configs import SLOW_QUERY_LOG, SLOW_QUERY_LOG_BYTES
+from models.engine.db_configs import SLOW_QUERY_LOG_BACKUPS
+from sqlalchemy import event
+import json
+import logging
+import os
+import sys
+import time
+
+# Statements whose plan is read, the others change the schema or data
+EXPLAINED = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+# Module whose outermost frame names the Storage method
+STORAGE_MODULE = 'models.engine.storage'
+
+
+def redact(value):
+    """Returns a parameter value safe to write to the log"""
+    if isinstance(value, date):
+        return value.isoformat()
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, (str, bytes, bytearray, memoryview)):
+        return f'<{type(value).__name__} {len(value)}>'
+    return f'<{type(value).__name__}>'
+
+
+def redact_parameters(parameters):
+    """Returns statement parameters with every value redacted"""
+    if isinstance(parameters, dict):
+        return {name: redact(value) for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [redact_parameters(value)
+                if isinstance(value, (dict, list, tuple))
+                else redact(value) for value in parameters]
+    return redact(parameters)
+
+
+def storage_method():
+    """Returns the outermost Storage method on the stack, or None
+
+    Storage methods call each other and helper modules, the outermost one
+    is the method the app or the console called.
+    """
+    method = None
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame.f_globals.get('__name__') == STORAGE_MODULE:
+            method = frame.f_code.co_name
+        frame = frame.f_back
+    return method
+
+
+def explain(connection, dialect, statement, parameters, executemany):
+    """Returns the plan of a statement as a list of rows, or an error
+
+    A new cursor of the same DBAPI connection runs the EXPLAIN, so the
+    results of the statement are left alone.
+    """
+    if not statement.lstrip().upper().startswith(EXPLAINED):
+        return None
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect == 'sqlite' else 'EXPLAIN '
+    if executemany:
+        parameters = parameters[0] if parameters else ()
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        return [[str(value) for value in row] for row in cursor.fetchall()]
+    except Exception as e:
+        return f'unavailable: {e}'
+    finally:
+        cursor.close()
+
+
+class SlowQueryLog:
+    """Rotating file of the slow statements, opened on the first one"""
+
+    def __init__(self, path=SLOW_QUERY_LOG, max_bytes=SLOW_QUERY_LOG_BYTES,
+                 backups=SLOW_QUERY_LOG_BACKUPS):
+        """Initializes the log
+
+        Args:
+            path (str): file written to, '{pid}' in it is replaced by the
+                id of the process so that each worker rotates its own file
+            max_bytes (int): size at which the file is rotated
+            backups (int): rotated files kept
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.__logger = None
+        self.__pid = None
+
+    def __get_logger(self):
+        """Returns the logger of the current process"""
+        if self.__logger is None or self.__pid != os.getpid():
+            self.__pid = os.getpid()
+            path = self.path.format(pid=self.__pid)
+            self.__logger = logging.getLogger(f'coda_vaulta.slow_queries.'
+                                              f'{id(self)}.{self.__pid}')
+            self.__logger.propagate = False
+            self.__logger.setLevel(logging.INFO)
+            handler = RotatingFileHandler(path, maxBytes=self.max_bytes,
+                                          backupCount=self.backups)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self.__logger.addHandler(handler)
+        return self.__logger
+
+    def write(self, entry):
+        """Appends an entry as one JSON line"""
+        self.__get_logger().info(json.dumps(entry, default=str))
+
+
+def log_slow_queries(engine, threshold_ms, log=None):
+    """Logs the statements of an engine slower than threshold_ms
+
+    Args:
+        engine: sqlalchemy engine
+        threshold_ms (float): milliseconds above which a statement is slow
+        log (SlowQueryLog): log to write to, a new one on SLOW_QUERY_LOG
+            by default
+
+    Returns:
+        the SlowQueryLog written to
+    """
+    log = log or SlowQueryLog()
+    threshold = threshold_ms / 1000
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_timer(connection, cursor, statement, parameters, context,
+                    executemany):
+        context._slow_query_began = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def check_duration(connection, cursor, statement, parameters, context,
+                       executemany):
+        seconds = time.perf_counter() - context._slow_query_began
+        if seconds < threshold:
+            return
+        if context.execution_options.get('stream_results'):
+            # A server-side cursor still holds its rows on the connection
+            plan = 'not read for a streaming cursor'
+        else:
+            plan = explain(connection, engine.dialect.name, statement,
+                           parameters, executemany)
+        log.write({
+            'at': datetime.now().isoformat(timespec='milliseconds'),
+            'duration_ms': round(seconds * 1000, 3),
+            'method': storage_method(),
+            'route': current_route(),
+            'statement': ' '.join(statement.split()),
+            'parameters': redact_parameters(parameters),
+            'executemany': executemany,
+            'plan': plan,
+        })
+
+    return log
@@ -0,0 +1,202 @@
+#!/usr/bin/python3
+"""Counters of users and snippets kept up to date by Storage
+
+Counting with COUNT(*) scans the table, and counting with len(all()) also
+loads every row. Instead Storage adds to these counters in the same
+transaction as the writes, so reading a count is a lookup of a few rows.
+
+Each counter is split over SLOTS rows and every write adds to one of them
+chosen at random, so that concurrent writers rarely wait for the lock of
+the same row. A count is the sum of its slots.
+
+Counters can drift if the tables are changed behind Storage's back,
+reconcile recounts everything from the tables.
+
+The same table holds the collection versions: one per user, and ALL for
+the snippets of every user. Every write adds 1 to the versions of the
+users whose snippets it changed, so a version never goes back and tells
+whether a collection changed without reading it. Versions are not
+counts, reconcile leaves them alone.
+"""
+
+from collections import Counter
+from models.base import Base
+from models.engine.upsert import upsert
+from sqlalchemy import Table, Column, String, Integer, BigInteger
+from sqlalchemy import select, delete, insert, func
+import random
+
+# Scopes of the counters
+GLOBAL = 'global'
+USER = 'user'
+LANGUAGE = 'language'
+VERSION = 'version'
+# Scopes rebuilt by reconcile
+COUNTED_SCOPES = (GLOBAL, USER, LANGUAGE)
+# Names of the global counters
+USERS = (GLOBAL, 'users')
+SNIPPETS = (GLOBAL, 'snippets')
+# Name of the version of all snippets, user ids never take this value
+ALL = '*'
+# Rows each counter is split over
+SLOTS = 8
+
+stats_counters = Table(
+    'stats_counters', Base.metadata,
+    Column('scope', String(10), primary_key=True),
+    Column('name', String(60), primary_key=True),
+    Column('slot', Integer, primary_key=True, autoincrement=False),
+    Column('value', BigInteger, nullable=False),
+)
+
+
+def snippet_deltas(added=(), removed=()):
+    """Returns the counter changes for snippets added and removed
+
+    Args:
+        added (iterable): (user_id, language) of each snippet added
+        removed (iterable): (user_id, language) of each snippet removed
+
+    Returns:
+        Counter mapping (scope, name) to the change of the counter
+    """
+    deltas = Counter()
+    for sign, snippets in ((1, added), (-1, removed)):
+        for user_id, language in snippets:
+            deltas[SNIPPETS] += sign
+            deltas[(USER, user_id)] += sign
+            deltas[(LANGUAGE, language)] += sign
+    return deltas
+
+
+def version_deltas(user_ids):
+    """Returns the version changes for writes to the snippets of users
+
+    Args:
+        user_ids (iterable): users whose snippets changed
+
+    Returns:
+        Counter bumping the version of each user and of ALL once
+    """
+    deltas = Counter((VERSION, user_id) for user_id in set(user_ids))
+    if deltas:
+        deltas[(VERSION, ALL)] += 1
+    return deltas
+
+
+def bump_versions(connection):
+    """Adds 1 to every version, after changes made outside of Storage"""
+    names = connection.execute(
+        select(stats_counters.c.name).distinct().where(
+            stats_counters.c.scope == VERSION)).scalars().all()
+    adjust(connection, {(VERSION, name): 1 for name in names})
+
+
+def adjust(connection, deltas, slot=None):
+    """Adds deltas to the counters, creating the counters that are missing
+
+    The rows are written in key order, so two transactions changing the
+    same counters always lock them in the same order.
+
+    Args:
+        connection: sqlalchemy connection in the writing transaction
+        deltas (dict): maps (scope, name) to the amount to add
+        slot (int): slot to add to, a random one if None
+    """
+    if slot is None:
+        slot = random.randrange(SLOTS)
+    rows = [{'scope': scope, 'name': name, 'slot': slot, 'value': value}
+            for (scope, name), value in sorted(deltas.items()) if value]
+    upsert(connection, stats_counters, rows, ('scope', 'name', 'slot'),
+           lambda new: {'value': stats_counters.c.value + new.value})
+
+
+def get(connection, scope, name):
+    """Returns the value of a counter, 0 if it does not exist
+
+    MySQL sums integers as DECIMAL, the value is made an int again.
+    """
+    return int(connection.execute(
+        select(func.coalesce(func.sum(stats_counters.c.value), 0)).where(
+            stats_counters.c.scope == scope,
+            stats_counters.c.name == name)).scalar_one())
+
+
+def counts(connection, scope):
+    """Returns every counter of a scope as a dict mapping name to value"""
+    rows = connection.execute(
+        select(stats_counters.c.name, func.sum(stats_counters.c.value))
+        .where(stats_counters.c.scope == scope)
+        .group_by(stats_counters.c.name))
+    return {name: int(value) for name, value in rows if value}
+
+
+def remove(connection, scope, names):
+    """Removes the counters of a scope with the given names"""
+    if not names:
+        return
+    connection.execute(delete(stats_counters).where(
+        stats_counters.c.scope == scope,
+        stats_counters.c.name.in_(list(names))))
+
+
+def compute(connection):
+    """Counts users and snippets from their tables
+
+    Returns:
+        Counter mapping (scope, name) to the actual count
+    """
+    users = Base.metadata.tables['users']
+    snippets = Base.metadata.tables['snippets']
+    actual = Counter()
+    actual[USERS] = connection.execute(
+        select(func.count()).select_from(users)).scalar_one()
+    actual[SNIPPETS] = connection.execute(
+        select(func.count()).select_from(snippets)).scalar_one()
+    for user_id, count in connection.execute(
+            select(snippets.c.user_id, func.count())
+            .group_by(snippets.c.user_id)):
+        actual[(USER, user_id)] = count
+    for language, count in connection.execute(
+            select(snippets.c.language, func.count())
+            .group_by(snippets.c.language)):
+        actual[(LANGUAGE, language)] = count
+    return actual
+
+
+def is_empty(connection):
+    """Returns True if no counter is stored"""
+    row = connection.execute(select(stats_counters.c.scope).where(
+        stats_counters.c.scope.in_(COUNTED_SCOPES)).limit(1)).first()
+    return row is None
+
+
+def reconcile(connection):
+    """Recounts users and snippets and rewrites the counters, not versions
+
+    Args:
+        connection: sqlalchemy connection, the caller commits
+
+    Returns:
+        list of (scope, name, stored, actual) for the counters that had
+        drifted
+    """
+    counted = stats_counters.c.scope.in_(COUNTED_SCOPES)
+    stored = Counter()
+    for scope, name, value in connection.execute(
+            select(stats_counters.c.scope, stats_counters.c.name,
+                   func.sum(stats_counters.c.value)).where(counted)
+            .group_by(stats_counters.c.scope, stats_counters.c.name)):
+        stored[(scope, name)] = int(value)
+    actual = compute(connection)
+
+    drift = [(scope, name, stored[(scope, name)], actual[(scope, name)])
+             for scope, name in sorted(set(stored) | set(actual))
+             if stored[(scope, name)] != actual[(scope, name)]]
+
+    connection.execute(delete(stats_counters).where(counted))
+    rows = [{'scope': scope, 'name': name, 'slot': 0, 'value': value}
+            for (scope, name), value in sorted(actual.items())
+            if value or (scope, name) in (USERS, SNIPPETS)]
+    connection.execute(insert(stats_counters), rows)
+    return drift
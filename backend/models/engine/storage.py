@@ -2,13 +2,36 @@
 """Contains class definition of storage"""
 
 from models.user import User
-from models.snippet import Snippet
-from models.base import Base
-from sqlalchemy import create_engine
+from models.snippet import Snippet, summarize_code
+from sqlalchemy import and_, or_, event, inspect
+from sqlalchemy import update, delete, select, insert
 from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.exc import SQLAlchemyError
-from models.engine.db_configs import DB, USER, PASSWORD, HOST
+from models.engine.db_configs import DATABASE_URL, DATABASE_REPLICA_URLS
+from models.engine.db_configs import REPLICA_PIN_SECONDS, REPLICA_PINS_DB
+from models.engine.db_configs import USER_CACHE_SIZE, USER_CACHE_TTL
+from models.engine.db_configs import EVENTS_BROKER, EVENTS_DB
+from models.engine.db_configs import GROUP_COMMIT_WINDOW_MS, GROUP_COMMIT_SIZE
+from models.engine.db_configs import SLOW_QUERY_MS
+from models.engine.backends import create_storage_engine
+from models.engine.cache import LRUCache
+from models.engine.events import create_broker
+from models.engine.group_commit import GroupCommit
+from models.engine.migrations import migrate, keyset_pages
+from models.engine.pins import ReplicaPins
+from models.engine.slow_queries import log_slow_queries
+from models.engine import search, stats, changes
+from metrics import track_sql
+from collections import Counter, namedtuple
+from itertools import chain, cycle
+from datetime import datetime
+from types import SimpleNamespace
+import base64
+import binascii
+import json
 import logging
+import os
+import threading
 
 
 classes = {
@@ -16,18 +39,228 @@ classes = {
     'Snippet': Snippet
 }
 
-created_engine = f'mysql+mysqldb://{USER}:{PASSWORD}@{HOST}/{DB}'
+# Read-only copy of the user fields the authenticated endpoints need
+UserIdentity = namedtuple('UserIdentity', ['user_id', 'username', 'email'])
+# Page of a user's change feed, see get_changes
+Changes = namedtuple('Changes', ['snippets', 'deleted', 'next_since',
+                                 'has_more', 'reset'])
+
+# Snippet attributes whose change requires reindexing the snippet
+INDEXED_ATTRIBUTES = ('title', 'description', 'code', 'language', 'user_id')
+# Columns of the summary pages, everything but the code itself
+SUMMARY_ATTRIBUTES = ('snippet_id', 'title', 'description', 'language',
+                      'line_count', 'byte_size', 'code_preview',
+                      'created_at', 'updated_at', 'user_id')
+# Snippet attributes a user may change with update_user_snippet
+UPDATABLE_ATTRIBUTES = ('title', 'description', 'code', 'language',
+                        'updated_at')
+
+created_engine = DATABASE_URL
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(updated_at, obj_id):
+    """Encodes the position of the last row of a page into an opaque cursor
+
+    Args:
+        updated_at (datetime): updated_at of the last row returned
+        obj_id (str): primary key of the last row returned
+
+    Returns:
+        url-safe string to be passed back to get the next page
+    """
+    raw = json.dumps([updated_at.isoformat(), obj_id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Decodes a cursor created by encode_cursor
+
+    Args:
+        cursor (str): opaque cursor received from a client
+
+    Raises:
+        ValueError: if the cursor was not created by encode_cursor
+
+    Returns:
+        tuple (updated_at, obj_id)
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii'))
+        updated_at, obj_id = json.loads(raw.decode('utf-8'))
+        return datetime.fromisoformat(updated_at), str(obj_id)
+    except (binascii.Error, UnicodeError, TypeError, ValueError):
+        raise ValueError('Invalid cursor')
 
 
 class Storage:
-    """Class definition of storage"""
-    __engine = None
-    __session = None
+    """Class definition of storage
+
+    Every thread gets its own session from a scoped_session registry, and
+    every session borrows its own connection from the engine pool, so
+    concurrent requests never share either. close() hands the session of
+    the current thread back at the end of a request. Nothing is created
+    until storage is first used.
+
+    With replicas, the methods that only read and return rows rather than
+    objects to change read from a replica. Each thread reads from one
+    replica until close(), the next request of the thread moves on to the
+    next replica, so the reads of a request see one state of the data. A
+    user whose data was written reads from the primary for the following
+    replica_pin_seconds, so they see their own writes while the replicas
+    catch up. The pins are kept in a SQLite file shared by the worker
+    processes of the node, whichever worker serves the next read.
+    """
+    __user_cache = None
+    __group_commit = None
+
+    def __init__(self, url=None, replica_urls=None, broker=None,
+                 group_commit_window_ms=GROUP_COMMIT_WINDOW_MS,
+                 group_commit_size=GROUP_COMMIT_SIZE,
+                 replica_pin_seconds=REPLICA_PIN_SECONDS,
+                 replica_pins_db=REPLICA_PINS_DB,
+                 slow_query_ms=SLOW_QUERY_MS):
+        """Initializes storage
 
-    def __init__(self):
-        """Initializes storage"""
-        self.__engine = create_engine(created_engine, pool_pre_ping=True)
-        self.reload()
+        Args:
+            url (str): url of the primary database, DATABASE_URL if None
+            replica_urls (list): urls of the read replicas of the primary,
+                DATABASE_REPLICA_URLS if None, all reads go to the primary
+                if empty
+            broker: broker the snippet change events are published to,
+                the one set by EVENTS_BROKER if None
+            group_commit_window_ms (float): milliseconds create_snippet
+                waits for concurrent snippets to commit with, 0 commits
+                every snippet on its own
+            group_commit_size (int): snippets committed together at most
+            replica_pin_seconds (float): seconds a user reads from the
+                primary after a write to their data
+            replica_pins_db (str): SQLite file the pins are shared
+                through, only opened with replicas
+            slow_query_ms (float): milliseconds above which a statement
+                is written to the slow query log, 0 logs none
+        """
+        self.__user_cache = LRUCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+        self.__url = url or created_engine
+        self.__replica_urls = list(DATABASE_REPLICA_URLS
+                                   if replica_urls is None else replica_urls)
+        self.__pin_seconds = replica_pin_seconds
+        self.__pins_db = replica_pins_db
+        self.__slow_query_ms = slow_query_ms
+        self.__pins = None
+        self.__given_broker = broker
+        self.__connected_engine = None
+        self.__replica_engines = []
+        self.__replicas = None
+        self.__registry = None
+        self.__connect_lock = threading.Lock()
+        if group_commit_window_ms > 0:
+            self.__group_commit = GroupCommit(
+                self.__commit_snippets, group_commit_window_ms / 1000,
+                group_commit_size)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self.__after_fork)
+
+    def __connect(self):
+        """Creates the engines, the session registries and the broker
+
+        Runs on the first use of storage rather than at import, so that
+        importing app.py or console.py opens no connection and does not
+        touch the schema. Tables are created by migrate, see console.py.
+        """
+        with self.__connect_lock:
+            if self.__registry is not None:
+                return
+            engine = create_storage_engine(self.__url)
+            track_sql(engine)
+            slow_queries = None
+            if self.__slow_query_ms > 0:
+                slow_queries = log_slow_queries(engine, self.__slow_query_ms)
+            session = sessionmaker(bind=engine, expire_on_commit=False)
+            event.listen(session, 'after_flush', self.__after_flush)
+            event.listen(session, 'after_commit', self.__after_commit)
+            event.listen(session, 'after_soft_rollback',
+                         self.__after_rollback)
+            self.__events_broker = self.__given_broker or create_broker(
+                EVENTS_BROKER, EVENTS_DB)
+            if self.__replica_urls:
+                self.__replica_engines = [create_storage_engine(url)
+                                          for url in self.__replica_urls]
+                for replica in self.__replica_engines:
+                    track_sql(replica)
+                    if slow_queries is not None:
+                        log_slow_queries(replica, self.__slow_query_ms,
+                                         slow_queries)
+                replicas = cycle(self.__replica_engines)
+                replica_session = sessionmaker(expire_on_commit=False)
+                self.__replicas = scoped_session(
+                    lambda: replica_session(bind=next(replicas)))
+                self.__pins = ReplicaPins(self.__pins_db, self.__pin_seconds)
+            self.__connected_engine = engine
+            self.__registry = scoped_session(session)
+
+    @property
+    def __engine(self):
+        """Returns the engine, connecting on first use"""
+        if self.__registry is None:
+            self.__connect()
+        return self.__connected_engine
+
+    @property
+    def __session(self):
+        """Returns the session registry, connecting on first use"""
+        if self.__registry is None:
+            self.__connect()
+        return self.__registry
+
+    @property
+    def __broker(self):
+        """Returns the event broker, connecting on first use"""
+        if self.__registry is None:
+            self.__connect()
+        return self.__events_broker
+
+    def __reader(self, user_id=None):
+        """Returns the session registry a read goes to
+
+        A replica, unless there is none or user_id was written within the
+        pin window.
+        """
+        session = self.__session
+        if self.__replicas is None or (
+                user_id is not None and self.__pins.pinned(user_id)):
+            return session
+        return self.__replicas
+
+    @property
+    def connected(self):
+        """Returns whether storage has connected yet"""
+        return self.__registry is not None
+
+    @property
+    def engine(self):
+        """Returns the sqlalchemy engine used by storage"""
+        return self.__engine
+
+    def __after_fork(self):
+        """Drops connections and sessions inherited from the parent process
+
+        Storage may have connected before gunicorn forked its workers, for
+        instance with --preload. Sockets opened by the parent must not be
+        used by a child, so the child starts with an empty pool and no
+        sessions. They are not closed here, as they still belong to the
+        parent.
+        """
+        if self.__registry is None:
+            return
+        self.__connected_engine.dispose(close=False)
+        self.__registry.registry.clear()
+        for engine in self.__replica_engines:
+            engine.dispose(close=False)
+        if self.__replicas is not None:
+            self.__replicas.registry.clear()
 
     def all(self, cls=None):
         """Returns all objects of a specific class in storage"""
@@ -65,6 +298,182 @@ class Storage:
 
         return None
 
+    def bulk_insert_snippets(self, snippets):
+        """Inserts many snippets in one transaction
+
+        The rows go to the database as a single executemany, batched into
+        multi-row INSERT statements by sqlalchemy (insertmanyvalues),
+        instead of one INSERT and one commit per snippet.
+
+        Args:
+            snippets (list): Snippet objects that are not in the session
+
+        Returns:
+            number of snippets inserted
+        """
+        if not snippets:
+            return 0
+        columns = [column.key for column in Snippet.__table__.columns]
+        rows = [{key: getattr(snippet, key) for key in columns}
+                for snippet in snippets]
+
+        session = self.__session()
+        try:
+            session.execute(insert(Snippet), rows)
+            self.__snippets_changed(session, created=snippets)
+            session.commit()
+        except SQLAlchemyError:
+            session.rollback()
+            raise
+        return len(rows)
+
+    def create_snippet(self, snippet):
+        """Stores and commits a new snippet
+
+        In group commit mode the snippet is committed with those other
+        threads create within the same window, in one transaction, and
+        still fails on its own if it cannot be stored.
+
+        Args:
+            snippet (Snippet): snippet that is not in the session
+
+        Raises:
+            SQLAlchemyError: if the snippet cannot be stored
+
+        Returns:
+            the snippet
+        """
+        if self.__group_commit is not None:
+            return self.__group_commit.submit(snippet)
+        self.new(snippet)
+        try:
+            self.save()
+        except SQLAlchemyError:
+            self.__session.rollback()
+            raise
+        return snippet
+
+    def __commit_snippets(self, snippets):
+        """Commits a group of snippets, see create_snippet"""
+        self.bulk_insert_snippets(snippets)
+        return snippets
+
+    def group_commit_batches(self):
+        """Returns the number of group commits, 0 if the mode is off"""
+        if self.__group_commit is None:
+            return 0
+        return self.__group_commit.batches
+
+    def update_user_snippet(self, snippet_id, user_id, values):
+        """Updates a snippet in one statement if it belongs to a user
+
+        Ownership is checked by the UPDATE itself, so no read is needed
+        first and a concurrent change cannot slip in between. Only when
+        the language is sent, the current one is read and locked first,
+        to move the snippet between the language counters. The snippet is
+        returned as it was written, read back only when part of it was
+        sent, so callers need not read it again.
+
+        Args:
+            snippet_id (str): id of the snippet to update
+            user_id (str): id of the user who must own the snippet
+            values (dict): new values, keys from UPDATABLE_ATTRIBUTES,
+                the summary columns follow the code
+
+        Raises:
+            ValueError: if values holds an attribute that cannot be updated
+
+        Returns:
+            the updated snippet, with snippet_id, user_id, title,
+            description, code, language and updated_at, or None if the
+            snippet does not exist or does not belong to the user
+        """
+        unknown = set(values) - set(UPDATABLE_ATTRIBUTES)
+        if unknown:
+            raise ValueError(f"Cannot update {', '.join(sorted(unknown))}")
+        if 'code' in values:
+            values = dict(values, **summarize_code(values['code']))
+        owned = (Snippet.snippet_id == snippet_id, Snippet.user_id == user_id)
+
+        session = self.__session()
+        try:
+            counts = None
+            if 'language' in values:
+                previous = session.execute(select(Snippet.language).where(
+                    *owned).with_for_update()).scalar()
+                if previous is None:
+                    session.commit()
+                    return None
+                counts = stats.snippet_deltas(
+                    added=[(user_id, values['language'])],
+                    removed=[(user_id, previous)])
+            result = session.execute(
+                update(Snippet).where(*owned).values(**values),
+                execution_options={'synchronize_session': 'evaluate'})
+            row = None
+            if result.rowcount == 1 and set(values) >= set(
+                    UPDATABLE_ATTRIBUTES):
+                row = SimpleNamespace(
+                    snippet_id=snippet_id, user_id=user_id, **{
+                        name: values[name] for name in UPDATABLE_ATTRIBUTES})
+            elif result.rowcount == 1:
+                # Only part of the snippet was sent, read the rest back
+                row = session.execute(select(
+                    Snippet.snippet_id, Snippet.user_id, Snippet.language,
+                    Snippet.title, Snippet.description, Snippet.code,
+                    Snippet.updated_at).where(
+                        Snippet.snippet_id == snippet_id)).one()
+            if row and set(values) & set(INDEXED_ATTRIBUTES):
+                self.__snippets_changed(session, updated=[row],
+                                        counts=counts)
+            elif row:
+                self.__snippets_changed(session, touched=[row])
+            session.commit()
+        except SQLAlchemyError:
+            session.rollback()
+            raise
+        return row
+
+    def delete_user_snippet(self, snippet_id, user_id):
+        """Deletes a snippet in one statement if it belongs to a user
+
+        The language of the deleted snippet, needed by the counters, comes
+        back with DELETE ... RETURNING where the database supports it. On
+        MySQL it is read and locked just before the DELETE.
+
+        Args:
+            snippet_id (str): id of the snippet to delete
+            user_id (str): id of the user who must own the snippet
+
+        Returns:
+            True if the snippet existed and belonged to the user
+        """
+        owned = (Snippet.snippet_id == snippet_id, Snippet.user_id == user_id)
+        statement = delete(Snippet).where(*owned)
+        options = {'synchronize_session': 'evaluate'}
+
+        session = self.__session()
+        try:
+            if self.__engine.dialect.delete_returning:
+                language = session.execute(
+                    statement.returning(Snippet.language),
+                    execution_options=options).scalar()
+            else:
+                language = session.execute(select(Snippet.language).where(
+                    *owned).with_for_update()).scalar()
+                if language is not None:
+                    session.execute(statement, execution_options=options)
+            matched = language is not None
+            if matched:
+                self.__snippets_changed(session, deleted=[SimpleNamespace(
+                    snippet_id=snippet_id, user_id=user_id,
+                    language=language)])
+            session.commit()
+        except SQLAlchemyError:
+            session.rollback()
+            raise
+        return matched
+
     def delete(self, obj=None):
         """Deletes object from storage"""
         if obj:
@@ -73,24 +482,206 @@ class Storage:
     def delete_all(self, obj):
         """Deletes all objects from storage"""
         self.__session.query(obj).delete()
+        if obj in (User, Snippet):
+            search.clear(self.__session.connection())
+            changes.truncate(self.__session.connection())
+            stats.reconcile(self.__session.connection())
+            stats.bump_versions(self.__session.connection())
+        if obj is User:
+            self.__user_cache.clear()
         self.save()
 
-    def reload(self):
-        """Creates all tables in database"""
-        Base.metadata.create_all(self.__engine)
-        session = sessionmaker(bind=self.__engine,
-                               expire_on_commit=False)
-        Session = scoped_session(session)
-        self.__session = Session()
+    def __after_flush(self, session, flush_context):
+        """Keeps derived data in step with the snippets just flushed
+
+        Runs inside the flushing transaction, so the search index is
+        committed or rolled back together with the snippets themselves.
+        """
+        created, updated, deleted, deleted_users = [], [], [], []
+        touched, moved = [], []
+        changed_users, written = set(), set()
+        counts = Counter()
+        for obj in session.new:
+            if isinstance(obj, Snippet):
+                created.append(obj)
+            elif isinstance(obj, User):
+                counts[stats.USERS] += 1
+                written.add(obj.user_id)
+        for obj in session.dirty:
+            if isinstance(obj, Snippet):
+                attrs = inspect(obj).attrs
+                if any(attrs[name].history.has_changes()
+                       for name in INDEXED_ATTRIBUTES):
+                    updated.append(obj)
+                elif session.is_modified(obj):
+                    touched.append(obj)
+                histories = [attrs[name].history
+                             for name in ('user_id', 'language')]
+                if any(history.deleted for history in histories):
+                    # Moved to another user or language, recount it
+                    previous = tuple(
+                        history.deleted[0] if history.deleted else value
+                        for history, value in zip(
+                            histories, (obj.user_id, obj.language)))
+                    counts.update(stats.snippet_deltas(
+                        added=[(obj.user_id, obj.language)],
+                        removed=[previous]))
+                    if previous[0] != obj.user_id:
+                        moved.append(SimpleNamespace(
+                            snippet_id=obj.snippet_id, user_id=previous[0]))
+            elif isinstance(obj, User) and session.is_modified(obj):
+                changed_users.add(obj.user_id)
+        for obj in session.deleted:
+            if isinstance(obj, Snippet):
+                deleted.append(obj)
+            elif isinstance(obj, User):
+                deleted_users.append(obj.user_id)
+                changed_users.add(obj.user_id)
+                counts[stats.USERS] -= 1
+
+        written.update(changed_users)
+        if written:
+            session.info.setdefault('written_users', set()).update(written)
+        if changed_users:
+            # Dropped again after commit, in case another thread cached
+            # the old row in between
+            session.info.setdefault('changed_users', set()).update(
+                changed_users)
+            for user_id in changed_users:
+                self.__user_cache.invalidate(user_id)
+
+        self.__snippets_changed(
+            session, created, updated, deleted, deleted_users, counts,
+            touched, moved)
+
+    def __snippets_changed(self, session, created=(), updated=(),
+                           deleted=(), deleted_users=(), counts=None,
+                           touched=(), moved=()):
+        """Updates the data derived from snippets that were just written
+
+        Called by the flush hook for changes made through ORM objects, and
+        directly by the methods writing with a single UPDATE or DELETE.
+
+        Args:
+            session: session of the writing transaction
+            created (list): new snippets
+            updated (list): snippets whose indexed attributes changed
+            deleted (list): deleted snippets, objects or rows with
+                snippet_id, user_id and language
+            deleted_users (list): user_id of deleted users
+            counts (dict): other counter changes, (scope, name) to delta
+            touched (list): other changed snippets, rows with snippet_id
+                and user_id, whose indexed attributes are unchanged
+            moved (list): snippets given to another user, rows with
+                snippet_id and the user_id of their previous owner
+        """
+        deltas = stats.snippet_deltas(
+            added=[(s.user_id, s.language) for s in created],
+            removed=[(s.user_id, s.language) for s in deleted])
+        deltas.update(counts or {})
+        saved = [(s.user_id, s.snippet_id) for s in chain(
+            created, updated, touched)]
+        removed = [(s.user_id, s.snippet_id) for s in chain(deleted, moved)]
+        changed = {user_id for user_id, _ in chain(saved, removed)}.union(
+            deleted_users)
+        deltas.update(stats.version_deltas(changed))
+        if not (changed or any(deltas.values())):
+            return
+        session.info.setdefault('written_users', set()).update(changed)
+        connection = session.connection()
+        search.index_snippets(connection, created, replace=False)
+        search.index_snippets(connection, updated)
+        search.remove_snippets(connection, [s.snippet_id for s in deleted])
+        for user_id in deleted_users:
+            search.remove_user(connection, user_id)
+        logged = changes.record(connection, saved, removed)
+        created_ids = {s.snippet_id for s in created}
+        session.info.setdefault('events', []).extend(
+            (row['user_id'], {
+                'type': 'deleted' if row['deleted'] else 'created'
+                if row['snippet_id'] in created_ids else 'updated',
+                'snippet_id': row['snippet_id'], 'seq': int(row['seq'])})
+            for row in logged)
+        changes.remove_users(connection, deleted_users)
+        stats.adjust(connection, deltas)
+        stats.remove(connection, stats.USER, deleted_users)
+        stats.remove(connection, stats.VERSION, deleted_users)
+
+    def __after_commit(self, session):
+        """Drops the cached copies of the users the commit changed
+
+        Then pins the users whose data was written to the primary, and
+        publishes the snippet change events of the commit. They are
+        only a hint to sync, a client that misses one catches up with the
+        change feed, so a broker failure is logged and not raised.
+        """
+        for user_id in session.info.pop('changed_users', ()):
+            self.__user_cache.invalidate(user_id)
+        written = session.info.pop('written_users', None)
+        if written and self.__replicas is not None:
+            self.__pins.pin(written)
+        events = session.info.pop('events', None)
+        if events:
+            try:
+                self.__broker.publish(events)
+            except Exception as e:
+                logging.error(f"Cannot publish snippet events: {e}")
+
+    def __after_rollback(self, session, previous_transaction):
+        """Forgets the changes of a transaction that was rolled back"""
+        session.info.pop('changed_users', None)
+        session.info.pop('written_users', None)
+        session.info.pop('events', None)
+
+    def migrate(self):
+        """Adds the tables and indexes missing from an existing database
+
+        Returns:
+            list of the names of the tables and indexes that were added
+        """
+        return migrate(self.__engine)
 
     def close(self):
-        """Closes storage"""
-        self.__session.close()
+        """Closes the session of the current thread
+
+        The sessions go back to their registries and their connections
+        back to the pools, the next call in this thread starts a new
+        session.
+        """
+        if self.__registry is not None:
+            self.__registry.remove()
+        if self.__replicas is not None:
+            self.__replicas.remove()
 
     def get_user_by_user_id(self, user_id):
         """Returns User object from database based on id"""
         return self.__session.query(User).filter_by(user_id=user_id).first()
 
+    def get_cached_user(self, user_id):
+        """Returns the identity of a user, from the user cache if possible
+
+        Meant for the authenticated endpoints, which only need to know
+        that the user of a token still exists. Use get_user_by_user_id to
+        get a User object that can be changed or deleted.
+
+        Returns:
+            UserIdentity, or None if the user does not exist
+        """
+        identity = self.__user_cache.get(user_id)
+        if identity is None:
+            row = self.__reader(user_id).query(
+                User.user_id, User.username, User.email).filter_by(
+                    user_id=user_id).first()
+            if row is None:
+                return None
+            identity = UserIdentity(*row)
+            self.__user_cache.set(user_id, identity)
+        return identity
+
+    def user_cache_stats(self):
+        """Returns the hit and miss counters of the user cache"""
+        return self.__user_cache.stats()
+
     def get_user_by_username(self, username):
         """Returns User object from database based on username"""
         return self.__session.query(User).filter_by(username=username).first()
@@ -109,27 +700,276 @@ class Storage:
         return self.__session.query(Snippet).filter(
             Snippet.user_id == user_id).all()
 
+    def get_user_snippet(self, snippet_id, user_id):
+        """Returns a snippet with its code if it belongs to a user
+
+        Args:
+            snippet_id (str): id of the snippet
+            user_id (str): id of the user who must own the snippet
+
+        Returns:
+            row with the snippet columns, or None
+        """
+        return self.__reader(user_id).execute(
+            select(*Snippet.__table__.columns).where(
+                Snippet.snippet_id == snippet_id,
+                Snippet.user_id == user_id)).first()
+
+    def get_snippets_page(self, user_id=None, limit=DEFAULT_PAGE_SIZE,
+                          cursor=None, summary=False):
+        """Returns one page of snippets, most recently updated first
+
+        The page is read as plain column rows, not Snippet objects, which
+        spares the ORM bookkeeping of objects that are only serialized.
+
+        Args:
+            user_id (str): only return snippets of this user if given
+            limit (int): maximum number of snippets in the page
+            cursor (str): next_cursor returned with the previous page
+            summary (bool): leave out the code column, the rows carry
+                SUMMARY_ATTRIBUTES only
+
+        Returns:
+            tuple (list of rows with the snippet columns, next_cursor or None)
+        """
+        if summary:
+            statement = select(*[getattr(Snippet, name)
+                                 for name in SUMMARY_ATTRIBUTES])
+        else:
+            statement = select(*Snippet.__table__.columns)
+        if user_id is not None:
+            statement = statement.where(Snippet.user_id == user_id)
+        return self.__paginate(statement, Snippet.updated_at,
+                               Snippet.snippet_id, limit, cursor, user_id)
+
+    def get_users_page(self, limit=DEFAULT_PAGE_SIZE, cursor=None):
+        """Returns one page of users, most recently updated first
+
+        Args:
+            limit (int): maximum number of users in the page
+            cursor (str): next_cursor returned with the previous page
+
+        Returns:
+            tuple (list of rows with the user columns but the password
+            hash, next_cursor or None)
+        """
+        statement = select(*[column for column in User.__table__.columns
+                             if column.key != 'hashed_password'])
+        return self.__paginate(
+            statement, User.updated_at, User.user_id, limit, cursor)
+
+    def __paginate(self, statement, order_column, id_column, limit, cursor,
+                   user_id=None):
+        """Applies keyset pagination over (order_column, id_column)
+
+        Seeks past the last row of the previous page instead of using
+        OFFSET, so every page costs the same whatever its position. The
+        page is read as user_id reads, see __reader.
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        if cursor:
+            last_value, last_id = decode_cursor(cursor)
+            statement = statement.where(or_(
+                order_column < last_value,
+                and_(order_column == last_value, id_column < last_id)))
+
+        rows = self.__reader(user_id).execute(statement.order_by(
+            order_column.desc(), id_column.desc()).limit(limit + 1)).all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor(
+                getattr(last, order_column.key), getattr(last, id_column.key))
+        return rows, next_cursor
+
+    def search_snippets(self, user_id, query, language=None, limit=20):
+        """Searches the snippets of a user, best match first
+
+        Args:
+            user_id (str): owner of the snippets searched
+            query (str): words or identifiers to look for
+            language (str): only search snippets of this language if given
+            limit (int): maximum number of results
+
+        Returns:
+            list of (Snippet, score) tuples
+        """
+        session = self.__reader(user_id)
+        ranked = search.search(session.connection(), user_id,
+                               query, language, limit)
+        if not ranked:
+            return []
+        snippets = {snippet.snippet_id: snippet for snippet in
+                    session.query(Snippet).filter(
+                        Snippet.snippet_id.in_([id for id, _ in ranked]))}
+        return [(snippets[snippet_id], score) for snippet_id, score in ranked
+                if snippet_id in snippets]
+
+    def reindex_search(self, batch_size=500):
+        """Rebuilds the search index from every snippet in storage
+
+        The snippets are read in pages ordered by id, each page in full
+        before its postings are written on the same connection, as MySQL
+        cannot write on a connection still streaming rows.
+
+        Args:
+            batch_size (int): snippets read per page
+
+        Returns:
+            number of snippets indexed
+        """
+        connection = self.__session.connection()
+        snippets = chain.from_iterable(keyset_pages(
+            connection, list(Snippet.__table__.columns),
+            [Snippet.__table__.c.snippet_id], batch_size))
+        count = search.rebuild(connection, snippets)
+        self.save()
+        return count
+
+    def stream_snippets_by_user_id(self, user_id, batch_size=500):
+        """Yields the snippets of a user one row at a time
+
+        Uses a server-side cursor on its own connection, so memory stays
+        the same whatever the number of snippets, and the first rows are
+        available before the query has finished sending all of them.
+
+        Args:
+            user_id (str): owner of the snippets
+            batch_size (int): rows fetched from the cursor at a time
+
+        Yields:
+            rows with the columns of the snippets table
+        """
+        statement = select(*Snippet.__table__.columns).where(
+            Snippet.user_id == user_id).order_by(
+                Snippet.updated_at.desc(), Snippet.snippet_id.desc())
+        engine = self.__reader(user_id).get_bind()
+        with engine.connect() as connection:
+            result = connection.execution_options(
+                stream_results=True, yield_per=batch_size).execute(statement)
+            for row in result:
+                yield row
+
+    def subscribe_events(self, user_id):
+        """Returns a Subscription to the snippet change events of a user
+
+        Each event is a dict with the 'type' of the change (created,
+        updated or deleted), the 'snippet_id' and the 'seq' of the change
+        in the change feed. The caller must close the subscription.
+        """
+        return self.__broker.subscribe(user_id)
+
+    def get_changes(self, user_id, since=0, limit=DEFAULT_PAGE_SIZE):
+        """Returns the changes of a user's snippets after a sync point
+
+        Only the snippets written since the previous sync are read, with
+        the ids of those deleted since, so syncing costs what changed and
+        not what the user has.
+
+        Args:
+            user_id (str): owner of the snippets
+            since (int): next_since of the previous sync, 0 the first time
+            limit (int): maximum number of changes returned
+
+        Returns:
+            Changes with the rows of the snippets created or updated and
+            the ids of the snippets deleted, in the order of their last
+            change, the next_since to pass back, has_more if more changes
+            follow and reset if the client synced before the log was
+            cleared and must drop its copy first
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        session = self.__reader(user_id)
+        connection = session.connection()
+        horizon = changes.horizon(connection, user_id)
+        reset = since < horizon
+        if reset:
+            # Every change older than the horizon is gone from the log
+            since = horizon
+        logged, has_more = changes.read(connection, user_id, since, limit)
+
+        saved = [row.snippet_id for row in logged if not row.deleted]
+        rows = {}
+        if saved:
+            rows = {row.snippet_id: row for row in session.execute(
+                select(*Snippet.__table__.columns).where(
+                    Snippet.user_id == user_id,
+                    Snippet.snippet_id.in_(saved)))}
+        # A snippet deleted since the log was read shows up as a tombstone
+        # at the next sync
+        snippets = [rows[snippet_id] for snippet_id in saved
+                    if snippet_id in rows]
+        deleted = [row.snippet_id for row in logged if row.deleted]
+        next_since = logged[-1].seq if logged else since
+        return Changes(snippets, deleted, next_since, has_more, reset)
+
     def count_snippets_by_user_id(self, user_id):
         """Get number of snippets belonging to a user by user_id"""
-        return self.__session.query(Snippet).filter(
-            Snippet.user_id == user_id).count()
+        return stats.get(self.__reader(user_id).connection(), stats.USER,
+                         user_id)
 
     def count_snippets(self):
         """Returns number of Snippet objects in storage"""
-        return self.__session.query(Snippet).count()
+        return stats.get(self.__reader().connection(), *stats.SNIPPETS)
 
     def count_users(self):
         """Returns number of User objects in storage"""
-        return self.__session.query(User).count()
+        return stats.get(self.__reader().connection(), *stats.USERS)
+
+    def get_snippets_version(self, user_id=None):
+        """Returns the version of a user's snippets, or of all snippets
+
+        The version grows with every write to the snippets and never goes
+        back, two reads returning the same version saw the same snippets.
+
+        Args:
+            user_id (str): user whose snippets are versioned, all snippets
+                if None
+
+        Returns:
+            int, 0 if the snippets were never written
+        """
+        return stats.get(self.__reader(user_id).connection(), stats.VERSION,
+                         stats.ALL if user_id is None else user_id)
+
+    def count_snippets_by_language(self):
+        """Returns a dict mapping each language to its number of snippets"""
+        return stats.counts(self.__reader().connection(), stats.LANGUAGE)
+
+    def reconcile_counts(self):
+        """Recounts users and snippets and repairs the counters
+
+        Returns:
+            list of (scope, name, stored, actual) for the counters that
+            had drifted
+        """
+        session = self.__session()
+        try:
+            drift = stats.reconcile(session.connection())
+            session.commit()
+        except SQLAlchemyError:
+            session.rollback()
+            raise
+        return drift
 
     def delete_user_and_snippets(self, user_id):
         """Delete all snippets belonging to a user by user_id"""
         try:
             user = self.get_user_by_user_id(user_id)
             if user:
+                # Locked so that the counters match what gets deleted
+                languages = self.__session.scalars(
+                    select(Snippet.language).where(
+                        Snippet.user_id == user_id).with_for_update()).all()
                 self.__session.query(Snippet).filter(
                     Snippet.user_id == user_id).delete(
                         synchronize_session='fetch')
+                counts = Counter({stats.SNIPPETS: -len(languages)})
+                for language in languages:
+                    counts[(stats.LANGUAGE, language)] -= 1
+                self.__snippets_changed(self.__session(), counts=counts)
                 self.delete(user)
                 self.save()
             else:
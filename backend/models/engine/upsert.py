@@ -0,0 +1,52 @@
+#!/usr/bin/python3
+"""Insert-or-update of many rows in one statement where possible
+
+MySQL has INSERT ... ON DUPLICATE KEY UPDATE, SQLite and PostgreSQL have
+INSERT ... ON CONFLICT DO UPDATE. Other databases fall back to an UPDATE
+per row, followed by an INSERT when it matched nothing.
+"""
+
+from sqlalchemy import insert, update, literal
+from types import SimpleNamespace
+
+
+def upsert(connection, table, rows, keys, values):
+    """Inserts rows, updating instead those whose keys already exist
+
+    Args:
+        connection: sqlalchemy connection in the writing transaction
+        table (Table): table written
+        rows (list): dicts of column values, all with the same columns
+        keys (tuple): names of the primary key columns
+        values (callable): given the row being inserted, whose columns are
+            attributes, returns the dict of columns to set on conflict
+    """
+    if not rows:
+        return
+
+    dialect = connection.dialect.name
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        statement = mysql_insert(table)
+        statement = statement.on_duplicate_key_update(
+            **values(statement.inserted))
+    elif dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as conflict_insert
+        else:
+            from sqlalchemy.dialects.postgresql import \
+                insert as conflict_insert
+        statement = conflict_insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=list(keys), set_=values(statement.excluded))
+    else:
+        for row in rows:
+            new = SimpleNamespace(**{name: literal(value, table.c[name].type)
+                                     for name, value in row.items()})
+            result = connection.execute(update(table).where(
+                *[table.c[key] == row[key] for key in keys]).values(
+                    values(new)))
+            if result.rowcount == 0:
+                connection.execute(insert(table), row)
+        return
+    connection.execute(statement, rows)
@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+"""Time-ordered ids of users and snippets, stored as 16 bytes
+
+Random uuid4 keys land anywhere in the primary key index, so every insert
+touches a different page and pages split all over the clustered index.
+uuid7 starts with the time in milliseconds, new keys go to the end of the
+index like an auto-increment would, and ids made by one process within
+the same millisecond keep increasing thanks to a counter.
+
+The ids are stored as BINARY(16) by UUID, a third of the 36 characters of
+their text form, in the primary keys and in every index and foreign key
+repeating them. The rest of the code and the API only ever see the usual
+text form.
+"""
+
+from sqlalchemy.types import TypeDecorator, BINARY
+import os
+import threading
+import time
+import uuid
+
+# Bits of the counter ordering the ids of one millisecond
+COUNTER_BITS = 12
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+
+def uuid7():
+    """Returns a new uuid7 (RFC 9562) in its text form
+
+    48 bits of unix time in milliseconds, the version, 12 bits of counter,
+    the variant and 62 random bits. The counter starts at a random value
+    in the lower half of its range each millisecond and goes up by one per
+    id, moving on to the next millisecond when it runs out.
+    """
+    global _last_ms, _counter
+    random_bits = int.from_bytes(os.urandom(8), 'big')
+    with _lock:
+        now = time.time_ns() // 1000000
+        if now > _last_ms:
+            _last_ms = now
+            _counter = random_bits >> (64 - COUNTER_BITS + 1)
+        else:
+            _counter += 1
+            if _counter >> COUNTER_BITS:
+                _last_ms += 1
+                _counter = 0
+        value = (_last_ms & (1 << 48) - 1) << 80 | 0x7 << 76 | \
+            _counter << 64 | 0b10 << 62 | random_bits & (1 << 62) - 1
+    return str(uuid.UUID(int=value))
+
+
+class UUID(TypeDecorator):
+    """Column type storing a uuid given as text in 16 bytes
+
+    Bound values are str in the usual text form. A str that is not a uuid
+    becomes NULL, so an id made up by a client matches no row instead of
+    failing the statement. Values read back are str again.
+    """
+
+    impl = BINARY
+    cache_ok = True
+
+    def __init__(self):
+        """Initializes a BINARY(16) column"""
+        super().__init__(16)
+
+    def process_bind_param(self, value, dialect):
+        """Returns the 16 bytes stored for an id"""
+        if value is None or isinstance(value, bytes):
+            return value
+        try:
+            return uuid.UUID(value).bytes
+        except (ValueError, TypeError, AttributeError):
+            return None
+
+    def process_result_value(self, value, dialect):
+        """Returns the text form of the 16 bytes read"""
+        if value is None:
+            return None
+        return str(uuid.UUID(bytes=bytes(value)))
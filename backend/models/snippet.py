@@ -2,11 +2,17 @@
 """Module contains Snippet class from which snippets can be instantiated"""
 
 from datetime import datetime
-from uuid import uuid4
 from models.base import Base
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey
+from models.ids import UUID, uuid7
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Index
+from sqlalchemy import Integer
+from sqlalchemy.orm import validates
 # from sqlalchemy.orm import relationship
 
+# The code preview keeps at most this many lines and characters
+CODE_PREVIEW_LINES = 5
+CODE_PREVIEW_LENGTH = 200
+
 
 class Snippet(Base):
     """Class for creating new snippets
@@ -23,11 +29,22 @@ class Snippet(Base):
         created_at (datetime): time snippet was created
         updated_at (datetime): time snippet was edited/updated
         user_id (int): id of user of the current account
+        line_count (int): number of lines of the code
+        byte_size (int): size of the code in bytes, encoded as utf-8
+        code_preview (str): first lines of the code, for list views
     """
 
     __tablename__ = 'snippets'
-
-    snippet_id = Column(String(60), primary_key=True)
+    __table_args__ = (
+        # Keyset pages of a user's snippets, also covers the user_id FK
+        Index('ix_snippets_user_id_updated_at',
+              'user_id', 'updated_at', 'snippet_id'),
+        # Keyset pages over all snippets
+        Index('ix_snippets_updated_at', 'updated_at', 'snippet_id'),
+        Index('ix_snippets_language_updated_at', 'language', 'updated_at'),
+    )
+
+    snippet_id = Column(UUID, primary_key=True)
     title = Column(String(60), nullable=False)
     description = Column(String(60), nullable=True)
     language = Column(String(20), nullable=False)
@@ -35,7 +52,11 @@ class Snippet(Base):
     created_at = Column(DateTime, nullable=False, default=datetime.now)
     updated_at = Column(
         DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
-    user_id = Column(String(60), ForeignKey('users.user_id'), nullable=False)
+    user_id = Column(UUID, ForeignKey('users.user_id'), nullable=False)
+    # Derived from code when it is written, see summarize_code
+    line_count = Column(Integer, nullable=False, server_default='0')
+    byte_size = Column(Integer, nullable=False, server_default='0')
+    code_preview = Column(String(CODE_PREVIEW_LENGTH), nullable=True)
 
     number_of_snippets = 0
 
@@ -47,6 +68,9 @@ class Snippet(Base):
             code (str): code to be made into a snippet
             description (str): description of the code snippet
             user_id (int): id of user
+
+        Raises:
+            ValueError: if a field is empty or not a string
         """
         if not title:
             raise ValueError('Title cannot be empty')
@@ -56,8 +80,16 @@ class Snippet(Base):
             raise ValueError('Language cannot be empty')
         if not user_id:
             raise ValueError('User_id must be present')
-
-        self.snippet_id = str(uuid4())
+        if not isinstance(title, str):
+            raise ValueError('Title must be a string')
+        if not isinstance(code, str):
+            raise ValueError('Code must be a string')
+        if not isinstance(language, str):
+            raise ValueError('Language must be a string')
+        if description is not None and not isinstance(description, str):
+            raise ValueError('Description must be a string')
+
+        self.snippet_id = uuid7()
         self.title = title
         self.description = description
         self.language = language
@@ -68,6 +100,13 @@ class Snippet(Base):
 
         Snippet.number_of_snippets += 1
 
+    @validates('code')
+    def validate_code(self, key, code):
+        """Updates the summary columns whenever the code is set"""
+        for name, value in summarize_code(code).items():
+            setattr(self, name, value)
+        return code
+
     def __repr__(self):
         """Returns a string representation of the object"""
         return f"Snippet({self.snippet_id}, {self.title}, {self.code})"
@@ -102,12 +141,28 @@ class Snippet(Base):
 
     @classmethod
     def count(cls):
-        """Returns number of user objects in database"""
-        from models.engine.storage import storage
-        return len(storage.all(cls))
+        """Returns number of snippet objects in database"""
+        from models import storage
+        return storage.count_snippets()
 
     @classmethod
     def clear_all(cls):
         """Deletes all user objects from database"""
         from models.engine.storage import storage
         storage.delete_all(cls)
+
+
+def summarize_code(code):
+    """Returns the summary columns of a snippet's code
+
+    Args:
+        code (str): code of the snippet
+
+    Returns:
+        dict with line_count, byte_size and code_preview
+    """
+    lines = (code or '').splitlines()
+    preview = '\n'.join(lines[:CODE_PREVIEW_LINES])[:CODE_PREVIEW_LENGTH]
+    return {'line_count': len(lines),
+            'byte_size': len((code or '').encode('utf-8')),
+            'code_preview': preview}
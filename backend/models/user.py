@@ -2,10 +2,10 @@
 """Module contains User class from which users can be instantiated"""
 
 from datetime import datetime
-from uuid import uuid4
 from utilities import validate_username, validate_email, password_hash
 from models.base import Base
-from sqlalchemy import Column, String, DateTime
+from models.ids import UUID, uuid7
+from sqlalchemy import Column, String, DateTime, Index
 from sqlalchemy.orm import relationship
 
 
@@ -24,8 +24,12 @@ class User(Base):
     """
 
     __tablename__ = 'users'
+    __table_args__ = (
+        # Keyset pages over all users
+        Index('ix_users_updated_at', 'updated_at', 'user_id'),
+    )
 
-    user_id = Column(String(60), primary_key=True)
+    user_id = Column(UUID, primary_key=True)
     username = Column(String(60), unique=True, nullable=False)
     email = Column(String(60), unique=True, nullable=False)
     hashed_password = Column(String(60), nullable=False)
@@ -37,21 +41,28 @@ class User(Base):
 
     number_of_users = 0
 
-    def __init__(self, username, email, password):
+    def __init__(self, username, email, password, hasher=None):
         """Creates a user object at instantiation
 
         Args:
-            user_id (str): unique id of a registered user
-            created_at (datetime): time user account was created
+            username (str): name of user
+            email (str): email address
+            password (str): plain text password, only its hash is kept
+            hasher (callable): function hashing the password, defaults to
+                utilities.password_hash. Pass password_pool.hash to run
+                bcrypt outside of the calling thread.
         """
-        self.user_id = str(uuid4())
+        validate_username(username)
+        validate_email(email)
+        if hasher is None:
+            hasher = password_hash
+
+        self.user_id = uuid7()
         self.username = username
         self.email = email
-        self.hashed_password = password_hash(password)
+        self.hashed_password = hasher(password)
         self.created_at = datetime.now()
         self.updated_at = datetime.now()
-        validate_username(username)
-        validate_email(email)
 
         User.number_of_users += 1
 
@@ -90,8 +101,8 @@ class User(Base):
     @classmethod
     def count(cls):
         """Returns number of user objects in database"""
-        from models.engine.storage import storage
-        return len(storage.all(cls))
+        from models import storage
+        return storage.count_users()
 
     @classmethod
     def clear_all(cls):
@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+"""Module runs bcrypt hashing and verification in a pool of processes
+
+bcrypt is deliberately slow, running it on the request thread blocks the
+worker for every other endpoint. The pool moves that work to separate
+processes and bounds how many operations may wait for them: once the pool
+is full, callers get PasswordPoolBusy straight away instead of queueing.
+If a pool process dies, the pool is replaced and the operation retried.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from utilities import password_hash, verify_password, get_bcrypt_rounds
+from metrics import registry
+import os
+import threading
+import time
+
+PASSWORD_WORKERS = int(os.getenv('PASSWORD_WORKERS', os.cpu_count() or 1))
+PASSWORD_QUEUE_SIZE = int(os.getenv('PASSWORD_QUEUE_SIZE', 16))
+PASSWORD_RETRY_AFTER = int(os.getenv('PASSWORD_RETRY_AFTER', 1))
+
+
+def timed(func, *args):
+    """Runs func(*args) in a pool process, returns its result and duration
+
+    bcrypt is timed where it runs, so the time waiting for a free process
+    is not counted.
+    """
+    began = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - began
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when the password pool has no room for another operation
+
+    Attributes:
+        retry_after (int): seconds the client should wait before retrying
+    """
+
+    def __init__(self, retry_after=PASSWORD_RETRY_AFTER):
+        super().__init__('Too many password operations in progress')
+        self.retry_after = retry_after
+
+
+class PasswordPool:
+    """Bounded pool of processes for password hashing and verification
+
+    At most workers + queue_size operations are in progress at any time,
+    workers of them running and the rest waiting for a free process.
+    """
+
+    def __init__(self, workers=PASSWORD_WORKERS,
+                 queue_size=PASSWORD_QUEUE_SIZE,
+                 retry_after=PASSWORD_RETRY_AFTER):
+        """Initializes the pool, processes are started on first use
+
+        Args:
+            workers (int): number of processes running bcrypt
+            queue_size (int): number of operations allowed to wait
+            retry_after (int): seconds reported with PasswordPoolBusy
+        """
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self.retry_after = retry_after
+        self.__executor = None
+        self.__pid = None
+        self.__lock = threading.Lock()
+        self.__pending = 0
+
+    @property
+    def pending(self):
+        """Returns the number of operations running or waiting"""
+        return self.__pending
+
+    def __get_executor(self):
+        """Returns the executor of the current process
+
+        A forked gunicorn worker cannot use the processes started by its
+        parent, so each process starts its own executor.
+        """
+        if self.__executor is None or self.__pid != os.getpid():
+            self.__executor = ProcessPoolExecutor(max_workers=self.workers)
+            self.__pid = os.getpid()
+            self.__pending = 0
+        return self.__executor
+
+    def __replace_executor(self, broken):
+        """Returns a new executor in place of one whose process died
+
+        A broken executor fails every later operation. Only the first
+        caller to notice replaces it, the others get its replacement.
+        """
+        with self.__lock:
+            if self.__executor is broken:
+                broken.shutdown(wait=False)
+                self.__executor = ProcessPoolExecutor(
+                    max_workers=self.workers)
+            return self.__executor
+
+    def __run(self, operation, func, *args):
+        """Runs func(*args) in the pool and waits for its result
+
+        The time func took is recorded in metrics as operation. If a pool
+        process died, the operation is retried once in a new pool.
+
+        Raises:
+            PasswordPoolBusy: if the pool is full
+            BrokenProcessPool: if the new pool breaks too
+        """
+        with self.__lock:
+            executor = self.__get_executor()
+            if self.__pending >= self.capacity:
+                raise PasswordPoolBusy(self.retry_after)
+            self.__pending += 1
+        try:
+            try:
+                result, seconds = executor.submit(
+                    timed, func, *args).result()
+            except BrokenProcessPool:
+                executor = self.__replace_executor(executor)
+                result, seconds = executor.submit(
+                    timed, func, *args).result()
+            registry.record_bcrypt(operation, seconds)
+            return result
+        finally:
+            with self.__lock:
+                self.__pending -= 1
+
+    def hash(self, password):
+        """Hashes a password in the pool, see utilities.password_hash
+
+        The cost is read in the calling process, so the pool processes
+        always hash with the current BCRYPT_ROUNDS.
+
+        Raises:
+            ValueError: if password is empty or is less than 8 chars long
+            PasswordPoolBusy: if the pool is full
+        """
+        return self.__run('hash', password_hash, password,
+                          get_bcrypt_rounds())
+
+    def verify(self, password, hashed_password):
+        """Verifies a password in the pool, see utilities.verify_password
+
+        Raises:
+            PasswordPoolBusy: if the pool is full
+        """
+        return self.__run('verify', verify_password, password,
+                          hashed_password)
+
+    def shutdown(self):
+        """Stops the processes of the pool"""
+        if self.__executor is not None and self.__pid == os.getpid():
+            self.__executor.shutdown()
+        self.__executor = None
+
+
+password_pool = PasswordPool()
@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+"""Module contains serializers turning rows straight into JSON bytes
+
+A Serializer is compiled once per model from the fields to output. For each
+row it reads those attributes and writes the JSON text directly, with no
+intermediate dictionary, no __dict__ copy and no ISO round trip for the
+timestamps, which are formatted once per distinct minute and reused.
+"""
+
+from datetime import datetime
+from functools import lru_cache
+from json import dumps
+from json.encoder import encode_basestring_ascii
+from utilities import format_minute
+
+
+@lru_cache(maxsize=16384)
+def encoded_minute(year, month, day, hour, minute):
+    """Returns the JSON string of a minute as format_datetime shows it"""
+    return encode_basestring_ascii(
+        format_minute(year, month, day, hour, minute))
+
+
+def encode_value(value):
+    """Returns the JSON text of a column value"""
+    if value is None:
+        return 'null'
+    if isinstance(value, str):
+        return encode_basestring_ascii(value)
+    if isinstance(value, datetime):
+        return encode_basestring_ascii(value.isoformat())
+    return dumps(value)
+
+
+def encode_date(value):
+    """Returns the JSON text of a datetime in format_datetime format"""
+    if value is None:
+        return 'null'
+    return encoded_minute(
+        value.year, value.month, value.day, value.hour, value.minute)
+
+
+class Serializer:
+    """Serializes objects or rows with a fixed set of fields to JSON
+
+    The function writing one row is generated once, when the serializer is
+    built, as a single expression formatting every field into a template.
+
+    Attributes:
+        fields (tuple): names of the attributes written, in order
+    """
+
+    def __init__(self, fields, date_fields=(), string_fields=()):
+        """Compiles the function serializing one row
+
+        Args:
+            fields (iterable): names of the attributes to write
+            date_fields (iterable): fields shown like format_datetime,
+                other datetime fields are written in ISO format
+            string_fields (iterable): fields that always hold a str, they
+                skip the type checks of the other fields
+        """
+        self.fields = tuple(fields)
+        for field in self.fields:
+            if not field.isidentifier():
+                raise ValueError(f'Invalid field name: {field!r}')
+
+        template = '{' + ','.join(
+            encode_basestring_ascii(field).replace('%', '%%') + ':%s'
+            for field in self.fields) + '}'
+        values = []
+        for field in self.fields:
+            if field in date_fields:
+                encoder = '_date'
+            elif field in string_fields:
+                encoder = '_string'
+            else:
+                encoder = '_value'
+            values.append(f'{encoder}(row.{field})')
+        source = (f'def encode(row):\n'
+                  f'    return _template % ({", ".join(values)},)\n')
+        namespace = {'_template': template, '_date': encode_date,
+                     '_string': encode_basestring_ascii,
+                     '_value': encode_value}
+        exec(source, namespace)
+        self.encode = namespace['encode']
+        self.encode.__doc__ = 'Returns the JSON object of one row as a str'
+
+    def encode_list(self, objs):
+        """Returns the JSON array of many rows as a str"""
+        return '[' + ','.join(map(self.encode, objs)) + ']'
+
+    def dumps_page(self, name, objs, next_cursor):
+        """Returns a page of rows as JSON bytes
+
+        Args:
+            name (str): key holding the list of rows
+            objs (iterable): rows of the page
+            next_cursor (str): cursor of the next page, or None
+
+        Returns:
+            bytes of {"<name>": [...], "next_cursor": ...}
+        """
+        return ('{' + encode_basestring_ascii(name) + ':' +
+                self.encode_list(objs) + ',"next_cursor":' +
+                encode_value(next_cursor) + '}').encode('ascii')
+
+
+snippet_serializer = Serializer(
+    ('snippet_id', 'title', 'description', 'language', 'code',
+     'created_at', 'updated_at', 'user_id'),
+    date_fields=('created_at', 'updated_at'),
+    string_fields=('snippet_id', 'title', 'language', 'code', 'user_id'))
+
+snippet_summary_serializer = Serializer(
+    ('snippet_id', 'title', 'description', 'language', 'line_count',
+     'byte_size', 'code_preview', 'created_at', 'updated_at', 'user_id'),
+    date_fields=('created_at', 'updated_at'),
+    string_fields=('snippet_id', 'title', 'language', 'user_id'))
+
+# A search result is a snippet with its relevance score
+snippet_search_serializer = Serializer(
+    snippet_serializer.fields + ('score',),
+    date_fields=('created_at', 'updated_at'),
+    string_fields=('snippet_id', 'title', 'language', 'code', 'user_id'))
+
+user_serializer = Serializer(
+    ('user_id', 'username', 'email', 'created_at', 'updated_at'),
+    string_fields=('user_id', 'username', 'email'))
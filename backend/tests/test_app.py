@@ -0,0 +1,295 @@
+#!/usr/bin/python3
+"""
+Module contains unittest for the endpoints of app.py
+
+Setup:
+Each test serves the app from a Storage on a new SQLite file, with a user
+  and a JWT for them.
+
+Import:
+Imports NDJSON lines and checks valid lines are stored, invalid lines are
+  reported by line number without stopping the import, and that when a
+  batch cannot be saved only its failing lines are reported.
+
+Create and Update:
+Sends fields that are not strings and checks the snippet is refused with
+  400 and the error, and checks an update answers with the whole snippet
+  without reading it again.
+
+Search:
+Checks search normalizes the language like the other views and answers
+  with the fields of the snippet pages and a score.
+
+ETag:
+Checks the snippet pages and a single snippet are served with an ETag,
+  that sending it back in If-None-Match gives 304 but still 404 for a
+  snippet that is missing or another user's, and that a create,
+  update or delete gives a new ETag so the old one is served 200 again.
+"""
+
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from flask_jwt_extended import create_access_token
+from sqlalchemy.exc import IntegrityError
+import app as app_module
+from app import app
+from models.engine.storage import Storage
+from models.snippet import Snippet
+from models.user import User
+
+API = '/coda_vaulta/api'
+
+
+def ndjson(*snippets):
+    """Returns an NDJSON body of snippets, str items are sent as they are"""
+    return ''.join((snippet if isinstance(snippet, str)
+                    else json.dumps(snippet)) + '\n' for snippet in snippets)
+
+
+def snippet(title, code='print(1)', language='python'):
+    """Returns the JSON fields of a snippet"""
+    return {'title': title, 'code': code, 'language': language}
+
+
+class AppTestCase(unittest.TestCase):
+    """Serves the app from a Storage on a temporary SQLite file"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.storage = Storage(
+            f'sqlite:///{os.path.join(directory, "vault.db")}', [],
+            group_commit_window_ms=0, slow_query_ms=0)
+        self.storage.migrate()
+        self.user = User(username='Api Tester', email='api@example.com',
+                         password='apiTester123')
+        self.storage.new(self.user)
+        self.storage.save()
+
+        patcher = patch.object(app_module, 'storage', self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.storage.close)
+        patcher = patch.dict(
+            app.config, JWT_SECRET_KEY='coda-vaulta-test-secret-key-32-bytes')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with app.app_context():
+            token = create_access_token(identity=self.user.user_id)
+        self.headers = {'Authorization': f'Bearer {token}'}
+        self.client = app.test_client()
+
+
+class TestImport(AppTestCase):
+    def post_import(self, body, batch_size=500):
+        return self.client.post(
+            f'{API}/user/import_snippets?batch_size={batch_size}',
+            data=body, headers=self.headers,
+            content_type='application/x-ndjson')
+
+    def titles(self):
+        return sorted(snippet.title for snippet in
+                      self.storage.get_snippets_by_user_id(self.user.user_id))
+
+    def test_import(self):
+        response = self.post_import(
+            ndjson(snippet('first'), snippet('second'), snippet('third')),
+            batch_size=2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(),
+                         {'imported': 3, 'error_count': 0, 'errors': []})
+        self.assertEqual(self.titles(), ['first', 'second', 'third'])
+
+    def test_invalid_lines(self):
+        response = self.post_import(ndjson(
+            snippet('first'), 'not json', {'title': 'no code',
+                                           'language': 'python'},
+            snippet('cobol', language='cobol'), snippet('last', code=123)))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {
+            'imported': 1, 'error_count': 4,
+            'errors': [{'line': 2, 'error': 'Not a JSON'},
+                       {'line': 3, 'error': 'Missing code'},
+                       {'line': 4, 'error': 'Language not supported'},
+                       {'line': 5, 'error': 'Code must be a string'}]})
+        self.assertEqual(self.titles(), ['first'])
+
+    def test_failed_batch(self):
+        bulk_insert = self.storage.bulk_insert_snippets
+
+        def failing_insert(snippets):
+            if any(snippet.title == 'broken' for snippet in snippets):
+                raise IntegrityError('INSERT', {}, Exception('broken'))
+            return bulk_insert(snippets)
+
+        with patch.object(self.storage, 'bulk_insert_snippets',
+                          failing_insert):
+            response = self.post_import(ndjson(
+                snippet('first'), snippet('broken'), snippet('third'),
+                snippet('fourth')), batch_size=3)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {
+            'imported': 3, 'error_count': 1,
+            'errors': [{'line': 2, 'error': 'Could not be saved'}]})
+        self.assertEqual(self.titles(), ['first', 'fourth', 'third'])
+
+
+class TestCreateAndUpdate(AppTestCase):
+    def test_create_code_not_a_string(self):
+        response = self.client.post(
+            f'{API}/user/create_snippet', json=snippet('numbers', code=123),
+            headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json(),
+                         {'error': 'Code must be a string'})
+        self.assertEqual(self.storage.count_snippets(), 0)
+
+    def test_create_language_not_a_string(self):
+        response = self.client.post(
+            f'{API}/user/create_snippet', json=snippet('numbers', language=1),
+            headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json(),
+                         {'error': 'Language must be a string'})
+
+    def test_update_code_not_a_string(self):
+        created = self.client.post(
+            f'{API}/user/create_snippet', json=snippet('numbers'),
+            headers=self.headers).get_json()
+        response = self.client.put(
+            f'{API}/user/update_snippet',
+            json={'snippet_id': created['snippet_id'], 'code': 123},
+            headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json(),
+                         {'error': 'Code must be a string'})
+
+    def test_update_without_reading_again(self):
+        created = self.client.post(
+            f'{API}/user/create_snippet',
+            json=dict(snippet('numbers'), description='counts'),
+            headers=self.headers).get_json()
+        with patch.object(self.storage, 'get_snippet_by_snippet_id') as get:
+            response = self.client.put(
+                f'{API}/user/update_snippet',
+                json={'snippet_id': created['snippet_id'],
+                      'title': 'renamed'},
+                headers=self.headers)
+        get.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        updated = response.get_json()
+        self.assertEqual(
+            (updated['snippet_id'], updated['title'], updated['description'],
+             updated['language'], updated['code']),
+            (created['snippet_id'], 'renamed', 'counts', 'python',
+             'print(1)'))
+
+    def test_update_not_found(self):
+        response = self.client.put(
+            f'{API}/user/update_snippet',
+            json={'snippet_id': '0' * 32, 'title': 'renamed'},
+            headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+
+
+class TestSearch(AppTestCase):
+    def search(self, query_string):
+        return self.client.get(f'{API}/snippets/search?{query_string}',
+                               headers=self.headers)
+
+    def test_search(self):
+        for title, language in (('parse tokens', 'python'),
+                                ('parse json', 'javascript')):
+            self.client.post(
+                f'{API}/user/create_snippet',
+                json=snippet(title, language=language), headers=self.headers)
+        page = self.client.get(f'{API}/user/get_snippets',
+                               headers=self.headers).get_json()
+
+        response = self.search('q=parse&language=Python')
+        self.assertEqual(response.status_code, 200)
+        found, = response.get_json()['snippets']
+        listed, = [row for row in page['snippets']
+                   if row['snippet_id'] == found['snippet_id']]
+        self.assertEqual(found.pop('title'), 'parse tokens')
+        self.assertGreater(found.pop('score'), 0)
+        listed.pop('title')
+        self.assertEqual(found, listed)
+
+    def test_unsupported_language(self):
+        response = self.search('q=parse&language=klingon')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json(),
+                         {'error': 'Language not supported'})
+
+
+class TestETag(AppTestCase):
+    def get(self, path, etag=None):
+        headers = dict(self.headers)
+        if etag:
+            headers['If-None-Match'] = etag
+        return self.client.get(f'{API}{path}', headers=headers)
+
+    def create(self, title):
+        return self.client.post(
+            f'{API}/user/create_snippet', json=snippet(title),
+            headers=self.headers).get_json()['snippet_id']
+
+    def test_etag(self):
+        self.create('first')
+        response = self.get('/user/get_snippets')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.headers.get('ETag'))
+        self.assertEqual(response.headers['Cache-Control'],
+                         'private, no-cache')
+        self.assertEqual(len(response.get_json()['snippets']), 1)
+
+    def test_not_modified(self):
+        snippet_id = self.create('first')
+        for path in ('/user/get_snippets', f'/user/snippet/{snippet_id}',
+                     '/snippets'):
+            etag = self.get(path).headers['ETag']
+            response = self.get(path, etag)
+            self.assertEqual(response.status_code, 304, path)
+            self.assertEqual(response.headers['ETag'], etag)
+            self.assertEqual(response.get_data(), b'')
+
+    def test_not_found_with_etag(self):
+        other = User(username='Other Tester', email='other@example.com',
+                     password='otherTester123')
+        self.storage.new(other)
+        self.storage.save()
+        theirs = self.storage.create_snippet(Snippet(
+            'theirs', 'print(2)', '', 'python', other.user_id))
+        self.create('mine')
+        etag = self.get('/user/get_snippets').headers['ETag']
+        for snippet_id in (theirs.snippet_id, '0' * 32):
+            response = self.get(f'/user/snippet/{snippet_id}', etag)
+            self.assertEqual(response.status_code, 404, snippet_id)
+
+    def test_new_etag_after_writes(self):
+        etags = [self.get('/user/get_snippets').headers['ETag']]
+        snippet_id = self.create('first')
+        etags.append(self.get('/user/get_snippets').headers['ETag'])
+        self.client.put(
+            f'{API}/user/update_snippet',
+            json={'snippet_id': snippet_id, 'title': 'renamed'},
+            headers=self.headers)
+        etags.append(self.get('/user/get_snippets').headers['ETag'])
+        self.client.delete(
+            f'{API}/user/delete_snippet', json={'snippet_id': snippet_id},
+            headers=self.headers)
+        etags.append(self.get('/user/get_snippets').headers['ETag'])
+
+        self.assertEqual(len(set(etags)), 4)
+        for etag in etags[:-1]:
+            self.assertEqual(
+                self.get('/user/get_snippets', etag).status_code, 200)
+        self.assertEqual(
+            self.get('/user/get_snippets', etags[-1]).status_code, 304)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+"""
+Module contains tests for bench_endpoints.py
+
+Percentile:
+Checks the nearest-rank percentile of a single value, of the lowest and
+  highest ranks, and of ranks that fall between two values.
+
+Compare:
+Checks a p95 or a throughput within the tolerance is not a regression,
+  that one beyond it is reported with both values, and that routes and
+  drivers missing from the baseline are skipped.
+
+Baseline:
+Checks the committed baseline has the results --baseline reads, and that
+  --baseline without a path compares with it.
+"""
+import json
+import unittest
+from benchmarks import bench_endpoints
+from benchmarks.bench_endpoints import compare, percentile
+
+
+def result(p95_ms, rps):
+    """Returns the result of a route with only the compared metrics"""
+    return {'p95_ms': p95_ms, 'rps': rps}
+
+
+class TestPercentile(unittest.TestCase):
+    def test_single_value(self):
+        for percent in (0, 50, 95, 99, 100):
+            self.assertEqual(percentile([7], percent), 7)
+
+    def test_bounds(self):
+        values = list(range(1, 11))
+        self.assertEqual(percentile(values, 0), 1)
+        self.assertEqual(percentile(values, 100), 10)
+
+    def test_nearest_rank(self):
+        values = list(range(1, 21))
+        self.assertEqual(percentile(values, 50), 10)
+        self.assertEqual(percentile(values, 95), 19)
+        self.assertEqual(percentile(values, 99), 20)
+        self.assertEqual(percentile([1, 2], 50), 1)
+        self.assertEqual(percentile([1, 2], 51), 2)
+
+
+class TestCompare(unittest.TestCase):
+    def setUp(self):
+        self.baseline = {'client': {'login': result(10.0, 100.0)}}
+
+    def test_within_tolerance(self):
+        for current in (result(12.0, 80.0), result(5.0, 300.0)):
+            self.assertEqual(compare({'client': {'login': current}},
+                                     self.baseline, 0.2), [])
+
+    def test_slower_p95(self):
+        self.assertEqual(
+            compare({'client': {'login': result(12.5, 100.0)}},
+                    self.baseline, 0.2),
+            [('client', 'login', 'p95_ms', 10.0, 12.5)])
+
+    def test_lower_throughput(self):
+        self.assertEqual(
+            compare({'client': {'login': result(10.0, 79.0)}},
+                    self.baseline, 0.2),
+            [('client', 'login', 'rps', 100.0, 79.0)])
+
+    def test_both(self):
+        self.assertEqual(
+            len(compare({'client': {'login': result(20.0, 50.0)}},
+                        self.baseline, 0.2)), 2)
+        self.assertEqual(
+            compare({'client': {'login': result(10.5, 100.0)}},
+                    self.baseline, 0), [
+                ('client', 'login', 'p95_ms', 10.0, 10.5)])
+
+    def test_missing_from_baseline(self):
+        results = {'client': {'logout': result(99.0, 1.0)},
+                   'server': {'login': result(99.0, 1.0)}}
+        self.assertEqual(compare(results, self.baseline, 0.2), [])
+
+
+class TestBaseline(unittest.TestCase):
+    def test_baseline(self):
+        with open(bench_endpoints.BASELINE) as f:
+            report = json.load(f)
+        self.assertIn('requests', report['meta'])
+        self.assertTrue(report['results'])
+        for endpoints in report['results'].values():
+            for current in endpoints.values():
+                self.assertGreater(current['rps'], 0)
+                self.assertGreater(current['p95_ms'], 0)
+
+    def test_default_baseline(self):
+        options = bench_endpoints.parse_args(['--baseline'])
+        self.assertEqual(options.baseline, bench_endpoints.BASELINE)
+        self.assertIsNone(bench_endpoints.parse_args([]).baseline)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -29,6 +29,51 @@ Test showing an existing snippet.
 
 -------------------------------------------------------------------
 
+Tests for do_migrate Method:
+
+Test migrating a database that is already up to date.
+Test migrating a database with missing indexes.
+
+-------------------------------------------------------------------
+
+Tests for do_export Method:
+
+Test exporting without a path.
+Test exporting the snippets of a user that does not exist.
+Test exporting the snippets of a user to a file.
+
+-------------------------------------------------------------------
+
+Tests for do_reconcile Method:
+
+Test reconciling counters that have drifted.
+
+-------------------------------------------------------------------
+
+Tests for do_calibrate_bcrypt Method:
+
+Test calibrating with a valid target.
+Test calibrating with an invalid target.
+
+-------------------------------------------------------------------
+
+Tests for do_seed Method:
+
+Test seeding without the number of snippets.
+Test seeding a number of users that is not an integer.
+Test seeding with a prefix that is already taken.
+Test seeding in batches with progress output.
+
+-------------------------------------------------------------------
+
+Tests for do_loadgen Method:
+
+Test generating load without a url.
+Test generating load against a url that is not http.
+Test generating load with a mix naming an unknown route.
+
+-------------------------------------------------------------------
+
 Mocking Database Calls:
 
 Use of unittest.mock.patch to mock database interactions
@@ -41,6 +86,10 @@ from console import CODAVAULTAConsole
 # from models.snippet import Snippet
 # from models.engine.storage import Storage
 import io
+import os
+import tempfile
+from datetime import datetime
+from types import SimpleNamespace
 
 
 class TestCODAVAULTAConsole(unittest.TestCase):
@@ -120,6 +169,127 @@ class TestCODAVAULTAConsole(unittest.TestCase):
             self.cli.onecmd("show Snippet snippet_id")
             self.assertIn('Test-Snippet', fake_out.getvalue().strip())
 
+    @patch('console.models.storage.migrate', return_value=[])
+    def test_do_migrate_up_to_date(self, mock_migrate):
+        with patch('sys.stdout', new_callable=io.StringIO) as fake_out:
+            self.cli.onecmd("migrate")
+            self.assertIn("** database is up to date **",
+                          fake_out.getvalue().strip())
+
+    @patch('console.models.storage.migrate',
+           return_value=['ix_users_updated_at'])
+    def test_do_migrate_applies(self, mock_migrate):
+        with patch('sys.stdout', new_callable=io.StringIO) as fake_out:
+            self.cli.onecmd("migrate")
+            self.assertIn("added ix_users_updated_at",
+                          fake_out.getvalue().strip())
+
+    @patch('console.models.storage.reconcile_counts',
+           return_value=[('global', 'snippets', 3, 4)])
+    def test_do_reconcile(self, mock_reconcile):
+        with patch('sys.stdout', new_callable=io.StringIO) as fake_out:
+            self.cli.onecmd("reconcile")
+            output = fake_out.getvalue().strip()
+            self.assertIn("global snippets: 3 -> 4", output)
+            self.assertIn("repaired 1 counters", output)
+
+    @patch('console.calibrate_bcrypt_rounds', return_value=(13, 260.0))
+    def test_do_calibrate_bcrypt(self, mock_calibrate):
+        with patch('sys.stdout', new_callable=io.StringIO) as fake_out:
+            self.cli.onecmd("calibrate_bcrypt 300")
+            mock_calibrate.assert_called_once_with(300.0)
+            self.assertIn("BCRYPT_ROUNDS=13", fake_out.getvalue().strip())
+
+    def test_do_calibrate_bcrypt_invalid_target(self):
+        with patch('sys.stdout', new_callable=io.StringIO) as fake_out:
+            self.cli.onecmd("calibrate_bcrypt fast")
+            self.assertIn("** target must be a number of milliseconds **",
+                          fake_out.getvalue().strip())
+
+    def test_do_export_missing_path(self):
+        with patch('sys.stdout', new_callable=io.StringIO) as fake_out:
+            self.cli.onecmd("export user_id")
+            self.assertIn("** user id or path missing **",
+                          fake_out.getvalue().strip())
+
+    @patch('console.models.storage.get_user_by_user_id', return_value=None)
+    def test_do_export_user_not_found(self, mock_get_user):
+        with patch('sys.stdout', new_callable=io.StringIO) as fake_out:
+            self.cli.onecmd("export non_existing out.ndjson")
+            self.assertIn("** user doesn't exist **",
+                          fake_out.getvalue().strip())
+
+    @patch('console.models.storage.stream_snippets_by_user_id')
+    @patch('console.models.storage.get_user_by_user_id')
+    def test_do_export(self, mock_get_user, mock_stream):
+        mock_stream.return_value = iter([SimpleNamespace(
+            snippet_id='1', title='Title', description='', code='x',
+            language='python', created_at=datetime(2024, 5, 12),
+            updated_at=datetime(2024, 5, 12))])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'out.ndjson')
+            with patch('sys.stdout', new_callable=io.StringIO) as fake_out:
+                self.cli.onecmd(f"export user_id {path}")
+                self.assertIn("exported 1 snippets",
+                              fake_out.getvalue().strip())
+            with open(path) as f:
+                self.assertIn('"title": "Title"', f.read())
+
+    def test_do_seed_missing_snippets(self):
+        with patch('sys.stdout', new_callable=io.StringIO) as fake_out:
+            self.cli.onecmd("seed 10")
+            self.assertIn("** number of users or snippets per user missing **",
+                          fake_out.getvalue().strip())
+
+    def test_do_seed_invalid_users(self):
+        with patch('sys.stdout', new_callable=io.StringIO) as fake_out:
+            self.cli.onecmd("seed many 10")
+            self.assertIn("** users, snippets and batch size must be "
+                          "integers **", fake_out.getvalue().strip())
+
+    @patch('console.models.storage.get_user_by_email')
+    def test_do_seed_prefix_taken(self, mock_get_user):
+        with patch('sys.stdout', new_callable=io.StringIO) as fake_out:
+            self.cli.onecmd("seed 10 5 100 load")
+            mock_get_user.assert_called_once_with('load.0@example.com')
+            self.assertIn("** users with prefix load already exist **",
+                          fake_out.getvalue().strip())
+
+    @patch('benchmarks.dataset.seed')
+    @patch('console.models.storage.get_user_by_email', return_value=None)
+    def test_do_seed(self, mock_get_user, mock_seed):
+        def seed(storage, users, per_user, batch_size, prefix, progress):
+            progress(users, 250)
+            progress(users, 500)
+            return users, 500
+
+        mock_seed.side_effect = seed
+        with patch('sys.stdout', new_callable=io.StringIO) as fake_out:
+            self.cli.onecmd("seed 10 50 250")
+            output = fake_out.getvalue()
+            self.assertEqual(mock_seed.call_args.args[1:4], (10, 50, 250))
+            self.assertIn("10/10 users, 250/500 snippets", output)
+            self.assertIn("seeded 10 users and 500 snippets", output)
+
+    def test_do_loadgen_missing_url(self):
+        with patch('sys.stdout', new_callable=io.StringIO) as fake_out:
+            self.cli.onecmd("loadgen")
+            self.assertIn("** server url missing **",
+                          fake_out.getvalue().strip())
+
+    def test_do_loadgen_invalid_url(self):
+        with patch('sys.stdout', new_callable=io.StringIO) as fake_out:
+            self.cli.onecmd("loadgen localhost:5000")
+            self.assertIn("** url must be http://host:port **",
+                          fake_out.getvalue().strip())
+
+    def test_do_loadgen_unknown_route(self):
+        with patch('sys.stdout', new_callable=io.StringIO) as fake_out:
+            self.cli.onecmd("loadgen http://localhost:5000 10 4 "
+                            "get_user_snippets=3,delete_user=1")
+            self.assertIn("** unknown route 'delete_user' **",
+                          fake_out.getvalue().strip())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,60 @@
+#!/usr/bin/python3
+"""
+Module contains unittest for export.py
+
+Test ndjson_lines Function:
+Check one JSON line is produced per snippet with ISO timestamps.
+
+Test zip_stream Function:
+Check the streamed chunks form a valid zip archive holding the exported
+    lines, and that chunks are produced before the input is exhausted.
+"""
+
+import io
+import json
+import unittest
+import zipfile
+from datetime import datetime
+from types import SimpleNamespace
+from export import ndjson_lines, zip_stream, EXPORT_FILENAME
+
+
+def make_snippet(i):
+    """Returns an object with the attributes of an exported snippet"""
+    return SimpleNamespace(
+        snippet_id=str(i), title=f'Title {i}', description='', code='x' * i,
+        language='python', created_at=datetime(2024, 5, 12, 22, 45),
+        updated_at=datetime(2024, 5, 12, 22, 46))
+
+
+class TestExport(unittest.TestCase):
+    def test_ndjson_lines(self):
+        lines = list(ndjson_lines(make_snippet(i) for i in range(3)))
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(all(line.endswith(b'\n') for line in lines))
+        first = json.loads(lines[0])
+        self.assertEqual(first['title'], 'Title 0')
+        self.assertEqual(first['updated_at'], '2024-05-12T22:46:00')
+
+    def test_zip_stream(self):
+        lines = list(ndjson_lines(make_snippet(i) for i in range(200)))
+        archive = b''.join(zip_stream(iter(lines)))
+        with zipfile.ZipFile(io.BytesIO(archive)) as z:
+            self.assertEqual(z.namelist(), [EXPORT_FILENAME])
+            self.assertEqual(z.read(EXPORT_FILENAME), b''.join(lines))
+
+    def test_zip_stream_is_lazy(self):
+        consumed = []
+
+        def chunks():
+            for i in range(10):
+                consumed.append(i)
+                yield b'x' * 100000
+
+        stream = zip_stream(chunks())
+        next(stream)
+        self.assertLess(len(consumed), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
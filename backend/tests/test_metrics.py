@@ -0,0 +1,186 @@
+#!/usr/bin/python3
+"""
+Module contains unittest for metrics.py
+
+Text Format:
+Checks counters and histograms are rendered with their help and type,
+  histogram buckets are cumulative up to +Inf with a sum and a count, and
+  label values are escaped.
+
+Multiprocess:
+Records in two registries sharing a directory, as two workers do, and
+  checks either one renders the sum of both once they flushed, and that
+  the values of a worker that exited are kept.
+
+Requests:
+Serves a small Flask app and checks each request is counted by route,
+  method and status with its latency, the SQL statements it ran on a
+  tracked engine, and its bcrypt time, while statements run outside a
+  request go to the background route.
+"""
+
+import shutil
+import tempfile
+import unittest
+from flask import Flask
+from sqlalchemy import create_engine, text
+import metrics
+from metrics import Registry
+
+
+class TestTextFormat(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry(directory=None)
+
+    def test_counter(self):
+        self.registry.inc('http_requests_total', route='api.login',
+                          method='POST', status='200')
+        self.registry.inc('http_requests_total', 2, route='api.login',
+                          method='POST', status='200')
+        output = self.registry.render()
+        self.assertIn('# TYPE coda_vaulta_http_requests_total counter',
+                      output)
+        self.assertIn('coda_vaulta_http_requests_total{method="POST",'
+                      'route="api.login",status="200"} 3', output)
+
+    def test_histogram(self):
+        for seconds in (0.003, 0.02, 0.02, 30):
+            self.registry.observe('http_request_duration_seconds', seconds,
+                                  route='api.login', method='POST')
+        lines = self.registry.render().splitlines()
+        labels = 'method="POST",route="api.login"'
+        name = 'coda_vaulta_http_request_duration_seconds'
+        self.assertIn(f'# TYPE {name} histogram', lines)
+        self.assertIn(f'{name}_bucket{{{labels},le="0.005"}} 1', lines)
+        self.assertIn(f'{name}_bucket{{{labels},le="0.025"}} 3', lines)
+        self.assertIn(f'{name}_bucket{{{labels},le="10"}} 3', lines)
+        self.assertIn(f'{name}_bucket{{{labels},le="+Inf"}} 4', lines)
+        self.assertIn(f'{name}_count{{{labels}}} 4', lines)
+        self.assertIn(f'{name}_sum{{{labels}}} 30.043', lines)
+
+    def test_escape(self):
+        self.registry.inc('http_requests_total', route='a"b\\c\nd',
+                          method='GET', status='200')
+        self.assertIn('route="a\\"b\\\\c\\nd"', self.registry.render())
+
+
+class TestMultiprocess(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_sum_of_workers(self):
+        first = Registry(directory=self.directory)
+        second = Registry(directory=self.directory)
+        first.inc('http_sql_statements_total', 2, route='api.login')
+        second.inc('http_sql_statements_total', 3, route='api.login')
+        for registry in (first, second):
+            registry.observe('bcrypt_duration_seconds', 0.2,
+                             buckets=metrics.BCRYPT_BUCKETS,
+                             operation='verify')
+        first.flush()
+        second.flush()
+        for registry in (first, second):
+            output = registry.render()
+            self.assertIn('coda_vaulta_http_sql_statements_total'
+                          '{route="api.login"} 5', output)
+            self.assertIn('coda_vaulta_bcrypt_duration_seconds_count'
+                          '{operation="verify"} 2', output)
+
+    def test_own_values_are_live(self):
+        first = Registry(directory=self.directory)
+        second = Registry(directory=self.directory)
+        first.inc('http_sql_statements_total', route='api.login')
+        first.flush()
+        first.inc('http_sql_statements_total', route='api.login')
+        self.assertIn('{route="api.login"} 2', first.render())
+        self.assertIn('{route="api.login"} 1', second.render())
+
+    def test_exited_worker_is_kept(self):
+        exited = Registry(directory=self.directory)
+        exited.inc('http_sql_statements_total', 4, route='api.login')
+        exited.flush()
+        del exited
+        self.assertIn('{route="api.login"} 4',
+                      Registry(directory=self.directory).render())
+
+    def test_maybe_flush(self):
+        registry = Registry(directory=self.directory, flush_seconds=60)
+        registry.inc('http_sql_statements_total', route='api.login')
+        registry.maybe_flush()
+        registry.inc('http_sql_statements_total', route='api.login')
+        registry.maybe_flush()
+        self.assertIn('{route="api.login"} 1',
+                      Registry(directory=self.directory).render())
+
+
+class TestRequests(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry(directory=None)
+        self.engine = create_engine('sqlite://')
+        metrics.track_sql(self.engine, self.registry)
+        app = Flask(__name__)
+        metrics.init_app(app, self.registry)
+
+        @app.route('/notes/<int:count>')
+        def notes(count):
+            with self.engine.connect() as connection:
+                for _ in range(count):
+                    connection.execute(text('SELECT 1'))
+            return 'ok'
+
+        @app.route('/login')
+        def login():
+            self.registry.record_bcrypt('verify', 0.25)
+            return 'ok', 401
+
+        self.client = app.test_client()
+
+    def value(self, name, **labels):
+        return self.registry.value(name, **labels)
+
+    def test_request(self):
+        self.client.get('/notes/3')
+        self.client.get('/notes/1')
+        self.assertEqual(self.value('http_requests_total', route='notes',
+                                    method='GET', status='200'), 2)
+        self.assertEqual(self.value('http_request_duration_seconds',
+                                    route='notes', method='GET'), 2)
+        self.assertEqual(self.value('http_sql_statements_total',
+                                    route='notes'), 4)
+        self.assertGreater(self.value('http_sql_duration_seconds_total',
+                                      route='notes'), 0)
+
+    def test_unmatched(self):
+        self.client.get('/missing')
+        self.assertEqual(self.value('http_requests_total', route='unmatched',
+                                    method='GET', status='404'), 1)
+
+    def test_bcrypt(self):
+        self.client.get('/login')
+        self.assertEqual(self.value('http_requests_total', route='login',
+                                    method='GET', status='401'), 1)
+        self.assertEqual(self.value('http_bcrypt_duration_seconds_total',
+                                    route='login'), 0.25)
+        self.assertEqual(self.value('bcrypt_duration_seconds',
+                                    operation='verify'), 1)
+
+    def test_background(self):
+        with self.engine.connect() as connection:
+            connection.execute(text('SELECT 1'))
+        self.assertEqual(self.value('http_sql_statements_total',
+                                    route=metrics.BACKGROUND), 1)
+
+    def test_endpoint(self):
+        self.client.get('/notes/1')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content_type, metrics.CONTENT_TYPE)
+        self.assertIn('coda_vaulta_http_sql_statements_total{route="notes"} 1',
+                      response.get_data(as_text=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+"""
+Module contains tests for cache.py
+
+LRU Eviction:
+Checks the least recently used entry is dropped once the cache is full,
+  and that reading an entry makes it recently used.
+
+Time To Live:
+Checks an entry older than ttl counts as a miss and is removed.
+
+Counters:
+Checks hits and misses are counted and reported by stats.
+"""
+import unittest
+from unittest.mock import patch
+from models.engine.cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(len(cache), 2)
+
+    @patch('models.engine.cache.time.monotonic')
+    def test_expired_entry_is_a_miss(self, mock_monotonic):
+        cache = LRUCache(maxsize=2, ttl=10)
+        mock_monotonic.return_value = 100
+        cache.set('a', 1)
+        mock_monotonic.return_value = 109
+        self.assertEqual(cache.get('a'), 1)
+        mock_monotonic.return_value = 111
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+    def test_invalidate_and_clear(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.invalidate('a')
+        self.assertIsNone(cache.get('a'))
+        cache.clear()
+        self.assertIsNone(cache.get('b'))
+
+    def test_disabled(self):
+        cache = LRUCache(maxsize=0, ttl=60)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+    def test_stats(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('b')
+        self.assertEqual(cache.stats(),
+                         {'hits': 1, 'misses': 1, 'size': 1, 'maxsize': 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
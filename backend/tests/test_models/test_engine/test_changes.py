@@ -0,0 +1,87 @@
+#!/usr/bin/python3
+"""
+Module contains tests for changes.py
+
+Record:
+Logs snippets of two users and checks each user gets consecutive sequence
+  numbers of its own, and that a snippet changed again keeps one row with
+  its latest number, turned into a tombstone when deleted.
+
+Read:
+Reads the log past a sequence number in pages and checks has_more.
+
+Truncate:
+Checks truncate empties the log and moves the horizon of every user
+  past its last sequence number, which later changes carry on from.
+
+Remove users:
+Checks a deleted user's log and sequence are forgotten.
+"""
+import unittest
+from sqlalchemy import create_engine
+from models.base import Base
+from models.engine import changes
+from models.ids import uuid7
+
+TEST_DATABASE_URL = 'sqlite:///test_database.db'
+
+test_engine = create_engine(TEST_DATABASE_URL)
+
+U1, U2 = uuid7(), uuid7()
+A, B, C = uuid7(), uuid7(), uuid7()
+
+
+class TestChanges(unittest.TestCase):
+    def setUp(self):
+        Base.metadata.create_all(test_engine)
+        self.connection = test_engine.connect()
+
+    def tearDown(self):
+        self.connection.close()
+        Base.metadata.drop_all(test_engine)
+
+    def log(self, user_id, since=0, limit=100):
+        rows, _ = changes.read(self.connection, user_id, since, limit)
+        return [(row.snippet_id, row.seq, row.deleted) for row in rows]
+
+    def test_record(self):
+        changes.record(self.connection, saved=[(U1, A), (U1, B), (U2, C)])
+        changes.record(self.connection, saved=[(U1, A)],
+                       deleted=[(U1, B)])
+        self.assertEqual(self.log(U1), [(A, 3, False), (B, 4, True)])
+        self.assertEqual(self.log(U2), [(C, 1, False)])
+        self.assertEqual(self.log(U1, since=3), [(B, 4, True)])
+
+    def test_read_pages(self):
+        changes.record(self.connection, saved=[
+            (U1, uuid7()) for _ in range(5)])
+        rows, has_more = changes.read(self.connection, U1, 0, 3)
+        self.assertEqual([row.seq for row in rows], [1, 2, 3])
+        self.assertTrue(has_more)
+        rows, has_more = changes.read(self.connection, U1, 3, 3)
+        self.assertEqual([row.seq for row in rows], [4, 5])
+        self.assertFalse(has_more)
+
+    def test_truncate(self):
+        changes.record(self.connection, saved=[(U1, A), (U1, B)])
+        self.assertEqual(changes.horizon(self.connection, U1), 0)
+        changes.truncate(self.connection)
+        self.assertEqual(self.log(U1), [])
+        self.assertEqual(changes.horizon(self.connection, U1), 3)
+
+        changes.record(self.connection, saved=[(U1, C)])
+        self.assertEqual(self.log(U1), [(C, 4, False)])
+        changes.truncate(self.connection)
+        self.assertEqual(changes.horizon(self.connection, U1), 5)
+
+    def test_remove_users(self):
+        changes.record(self.connection, saved=[(U1, A), (U2, B)])
+        changes.remove_users(self.connection, [U1])
+        self.assertEqual(self.log(U1), [])
+        self.assertEqual(self.log(U2), [(B, 1, False)])
+        changes.record(self.connection, saved=[(U1, C)])
+        self.assertEqual(self.log(U1), [(C, 1, False)])
+
+
+if __name__ == '__main__':
+    unittest.main()
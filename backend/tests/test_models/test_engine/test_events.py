@@ -0,0 +1,117 @@
+#!/usr/bin/python3
+"""
+Module contains tests for events.py
+
+Local Broker:
+Subscribes two users and checks each subscription only gets the events of
+  its user, that get returns nothing after its timeout, that closed
+  subscriptions get nothing, and that thousands of subscriptions start no
+  thread.
+
+Overflow:
+Publishes more events than a subscription holds and checks they are
+  replaced by a single resync event.
+
+SQLite Broker:
+Opens two brokers on the same file, as two worker processes would, and
+  checks an event published through one reaches the subscriptions of both.
+
+Format:
+Checks events become server-sent event messages with the sequence number
+  as their id.
+"""
+import os
+import tempfile
+import threading
+import unittest
+from models.engine import events
+
+
+class TestLocalBroker(unittest.TestCase):
+    def setUp(self):
+        self.broker = events.LocalBroker(max_pending=3)
+
+    def test_publish(self):
+        first = self.broker.subscribe('u1')
+        second = self.broker.subscribe('u2')
+        self.broker.publish([('u1', {'type': 'created', 'seq': 1}),
+                             ('u2', {'type': 'deleted', 'seq': 1})])
+        self.assertEqual(first.get(0), [{'type': 'created', 'seq': 1}])
+        self.assertEqual(second.get(0), [{'type': 'deleted', 'seq': 1}])
+        self.assertEqual(first.get(0.01), [])
+
+        first.close()
+        first.close()
+        self.broker.publish([('u1', {'type': 'updated', 'seq': 2})])
+        self.assertEqual(first.get(0), [])
+        self.assertEqual(len(self.broker), 1)
+
+    def test_get_waits(self):
+        subscription = self.broker.subscribe('u1')
+        timer = threading.Timer(0.05, self.broker.publish,
+                                [[('u1', {'type': 'created', 'seq': 1})]])
+        timer.start()
+        self.assertEqual(subscription.get(5), [{'type': 'created', 'seq': 1}])
+        timer.join()
+
+    def test_no_thread_per_subscription(self):
+        threads = threading.active_count()
+        subscriptions = [self.broker.subscribe(str(i)) for i in range(5000)]
+        self.assertEqual(threading.active_count(), threads)
+        self.assertEqual(len(self.broker), 5000)
+        for subscription in subscriptions:
+            subscription.close()
+        self.assertEqual(len(self.broker), 0)
+
+    def test_overflow(self):
+        subscription = self.broker.subscribe('u1')
+        self.broker.publish([('u1', {'type': 'updated', 'seq': i})
+                             for i in range(10)])
+        self.assertEqual(subscription.get(0), [events.RESYNC])
+        self.broker.publish([('u1', {'type': 'updated', 'seq': 11})])
+        self.assertEqual(subscription.get(0), [{'type': 'updated',
+                                                'seq': 11}])
+
+
+class TestSQLiteBroker(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.brokers = [events.SQLiteBroker(self.path, poll_interval=0.01)
+                        for _ in range(2)]
+
+    def tearDown(self):
+        for broker in self.brokers:
+            broker.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def test_shared_between_brokers(self):
+        subscriptions = [broker.subscribe('u1') for broker in self.brokers]
+        self.brokers[0].publish([('u1', {'type': 'created', 'seq': 1}),
+                                 ('u2', {'type': 'created', 'seq': 1})])
+        for subscription in subscriptions:
+            self.assertEqual(subscription.get(5),
+                             [{'type': 'created', 'seq': 1}])
+
+    def test_create_broker(self):
+        self.assertIsInstance(events.create_broker('local'),
+                              events.LocalBroker)
+        with self.assertRaises(ValueError):
+            events.create_broker('redis')
+
+
+class TestFormat(unittest.TestCase):
+    def test_format_sse(self):
+        self.assertEqual(
+            events.format_sse({'type': 'deleted', 'snippet_id': 'a',
+                               'seq': 7}),
+            'id: 7\nevent: deleted\n'
+            'data: {"type": "deleted", "snippet_id": "a", "seq": 7}\n\n')
+        self.assertEqual(events.format_sse(events.RESYNC),
+                         'event: resync\ndata: {"type": "resync"}\n\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+"""
+Module contains tests for group_commit.py
+
+Coalescing:
+Submits items from many threads at once and checks they are committed in
+  fewer batches than items, none bigger than max_size, and that every
+  thread gets the result of its own item.
+
+Alone:
+Checks a lone item is committed once its window has passed.
+
+Failures:
+Makes the commit of one item fail and checks only the thread that
+  submitted it gets the exception, the rest of its batch being committed.
+"""
+import threading
+import unittest
+from models.engine.group_commit import GroupCommit
+
+
+class TestGroupCommit(unittest.TestCase):
+    def setUp(self):
+        self.committed = []
+        self.lock = threading.Lock()
+
+    def commit(self, items):
+        if 'bad' in items:
+            raise ValueError('bad item')
+        with self.lock:
+            self.committed.append(list(items))
+        return [item.upper() for item in items]
+
+    def submit_all(self, group, items):
+        results = {}
+        start = threading.Barrier(len(items))
+
+        def submit(item):
+            start.wait()
+            try:
+                results[item] = group.submit(item)
+            except ValueError as e:
+                results[item] = e
+
+        threads = [threading.Thread(target=submit, args=(item,))
+                   for item in items]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_coalescing(self):
+        group = GroupCommit(self.commit, 0.05, 8)
+        items = [f'item{i}' for i in range(20)]
+        results = self.submit_all(group, items)
+        self.assertEqual(results, {item: item.upper() for item in items})
+        self.assertLess(len(self.committed), len(items))
+        self.assertEqual(group.batches, len(self.committed))
+        self.assertTrue(all(len(batch) <= 8 for batch in self.committed))
+        self.assertEqual(sorted(sum(self.committed, [])), sorted(items))
+
+    def test_alone(self):
+        group = GroupCommit(self.commit, 0.001, 8)
+        self.assertEqual(group.submit('a'), 'A')
+        self.assertEqual(group.submit('b'), 'B')
+        self.assertEqual(self.committed, [['a'], ['b']])
+
+    def test_failures(self):
+        group = GroupCommit(self.commit, 0.05, 100)
+        items = ['a', 'b', 'bad', 'c']
+        results = self.submit_all(group, items)
+        self.assertIsInstance(results.pop('bad'), ValueError)
+        self.assertEqual(results, {'a': 'A', 'b': 'B', 'c': 'C'})
+        with self.assertRaises(ValueError):
+            group.submit('bad')
+
+
+if __name__ == '__main__':
+    unittest.main()
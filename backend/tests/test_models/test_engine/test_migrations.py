@@ -0,0 +1,300 @@
+#!/usr/bin/python3
+"""
+Module contains tests for migrations.py
+
+Missing Indexes:
+Drops declared indexes from an existing database and checks that
+  missing_indexes reports exactly those.
+
+Migrate:
+Verifies that migrate adds the dropped indexes back to tables that already
+  exist, and that running it a second time applies nothing.
+
+Missing Columns:
+Drops the code summary columns from a snippets table holding rows, checks
+  that missing_columns reports them and that migrate adds them back and
+  fills them in for the existing rows.
+
+Search Backfill:
+Stores snippets without indexing them, as before the search tables
+  existed, and checks migrate indexes them once so that search finds them.
+
+Change Log Backfill:
+Stores snippets of two users without logging them, as before the change
+  log existed, and checks migrate logs each once with the next sequence
+  numbers of its user, so that a sync from 0 gets them.
+
+Id Conversion:
+Creates the tables with their ids as text, as they were before uuid7,
+  and checks migrate rebuilds them with 16-byte ids keeping every id and
+  index, and that running it again converts nothing. Converts tables
+  larger than one batch, with single and composite primary keys, and
+  checks no read streams rows while the copy writes on the connection.
+"""
+import unittest
+from sqlalchemy import create_engine, inspect, select, func, event
+from sqlalchemy import MetaData, String
+from models.base import Base
+from models.user import User  # noqa: F401 registers the users table
+from models.snippet import Snippet  # noqa: F401 registers the snippets table
+from models.engine.migrations import missing_indexes, migrate
+from models.engine.migrations import missing_columns, text_id_tables
+from models.engine.migrations import convert_ids, fill_search_index
+from models.engine.migrations import fill_change_log
+from models.engine import changes, search
+from models.ids import UUID, uuid7
+from uuid import uuid4
+from datetime import datetime
+
+TEST_DATABASE_URL = 'sqlite:///test_database.db'
+
+test_engine = create_engine(TEST_DATABASE_URL)
+
+USER_ID = uuid7()
+
+
+class TestMigrations(unittest.TestCase):
+    def setUp(self):
+        Base.metadata.create_all(test_engine)
+        with test_engine.begin() as connection:
+            connection.exec_driver_sql(
+                'DROP INDEX ix_snippets_user_id_updated_at')
+            connection.exec_driver_sql('DROP INDEX ix_users_updated_at')
+
+    def tearDown(self):
+        Base.metadata.drop_all(test_engine)
+
+    def test_missing_indexes(self):
+        with test_engine.connect() as connection:
+            names = [index.name for index in missing_indexes(connection)]
+        self.assertEqual(
+            sorted(names),
+            ['ix_snippets_user_id_updated_at', 'ix_users_updated_at'])
+
+    def test_migrate_adds_missing_indexes(self):
+        applied = migrate(test_engine)
+        self.assertEqual(
+            sorted(applied),
+            ['ix_snippets_user_id_updated_at', 'ix_users_updated_at'])
+        indexes = {index['name']: index['column_names'] for index in
+                   inspect(test_engine).get_indexes('snippets')}
+        self.assertEqual(indexes['ix_snippets_user_id_updated_at'],
+                         ['user_id', 'updated_at', 'snippet_id'])
+
+    def test_migrate_is_idempotent(self):
+        migrate(test_engine)
+        self.assertEqual(migrate(test_engine), [])
+
+
+class TestColumnMigrations(unittest.TestCase):
+    SUMMARY_COLUMNS = ['byte_size', 'code_preview', 'line_count']
+
+    def setUp(self):
+        Base.metadata.create_all(test_engine)
+        now = datetime(2024, 5, 12, 22, 45)
+        with test_engine.begin() as connection:
+            for name in self.SUMMARY_COLUMNS:
+                connection.exec_driver_sql(
+                    f'ALTER TABLE snippets DROP COLUMN {name}')
+            connection.execute(User.__table__.insert().values(
+                user_id=USER_ID, username='jane', email='jane@example.com',
+                hashed_password=b'x', created_at=now, updated_at=now))
+            connection.execute(Snippet.__table__.insert(), [
+                {'snippet_id': uuid7(), 'title': 'Title',
+                 'language': 'python', 'code': 'a = 1\nb = 2\n' * (i + 1),
+                 'created_at': now, 'updated_at': now, 'user_id': USER_ID}
+                for i in range(3)])
+
+    def tearDown(self):
+        Base.metadata.drop_all(test_engine)
+
+    def test_missing_columns(self):
+        with test_engine.connect() as connection:
+            names = [column.name for column in missing_columns(connection)]
+        self.assertEqual(sorted(names), self.SUMMARY_COLUMNS)
+
+    def test_migrate_adds_and_backfills_columns(self):
+        applied = migrate(test_engine)
+        self.assertEqual(sorted(applied), [
+            f'snippets.{name}' for name in self.SUMMARY_COLUMNS])
+        with test_engine.connect() as connection:
+            rows = connection.execute(
+                Snippet.__table__.select().order_by('line_count')).all()
+        self.assertEqual([row.line_count for row in rows], [2, 4, 6])
+        self.assertEqual(rows[0].byte_size, 12)
+        self.assertEqual(rows[0].code_preview, 'a = 1\nb = 2')
+        self.assertEqual(migrate(test_engine), [])
+
+
+class TestSearchBackfill(unittest.TestCase):
+    def setUp(self):
+        Base.metadata.create_all(test_engine)
+        now = datetime(2024, 5, 12, 22, 45)
+        self.snippet_ids = [uuid7() for _ in range(5)]
+        with test_engine.begin() as connection:
+            connection.execute(User.__table__.insert().values(
+                user_id=USER_ID, username='jane', email='jane@example.com',
+                hashed_password=b'x', created_at=now, updated_at=now))
+            connection.execute(Snippet.__table__.insert(), [
+                {'snippet_id': snippet_id, 'title': f'Parser {i}',
+                 'language': 'python', 'code': 'tokens = lex(source)',
+                 'created_at': now, 'updated_at': now, 'user_id': USER_ID}
+                for i, snippet_id in enumerate(self.snippet_ids)])
+
+    def tearDown(self):
+        Base.metadata.drop_all(test_engine)
+
+    def test_fill_search_index(self):
+        with test_engine.connect() as connection:
+            self.assertEqual(search.search(connection, USER_ID, 'lex'), [])
+            self.assertEqual(fill_search_index(connection, batch_size=2), 5)
+            found = search.search(connection, USER_ID, 'lex')
+            self.assertEqual(sorted(snippet_id for snippet_id, _ in found),
+                             sorted(self.snippet_ids))
+            self.assertEqual(fill_search_index(connection), 0)
+
+    def test_migrate_fills_search_index(self):
+        migrate(test_engine)
+        with test_engine.connect() as connection:
+            self.assertEqual(
+                len(search.search(connection, USER_ID, 'parser')), 5)
+
+
+class TestChangeLogBackfill(unittest.TestCase):
+    def setUp(self):
+        Base.metadata.create_all(test_engine)
+        now = datetime(2024, 5, 12, 22, 45)
+        self.other_id = uuid7()
+        self.snippet_ids = {USER_ID: [uuid7() for _ in range(3)],
+                            self.other_id: [uuid7() for _ in range(2)]}
+        with test_engine.begin() as connection:
+            connection.execute(User.__table__.insert(), [
+                {'user_id': user_id, 'username': name,
+                 'email': f'{name}@example.com', 'hashed_password': b'x',
+                 'created_at': now, 'updated_at': now}
+                for user_id, name in ((USER_ID, 'jane'),
+                                      (self.other_id, 'john'))])
+            connection.execute(Snippet.__table__.insert(), [
+                {'snippet_id': snippet_id, 'title': 'Title',
+                 'language': 'python', 'code': 'a = 1',
+                 'created_at': now, 'updated_at': now, 'user_id': user_id}
+                for user_id, ids in self.snippet_ids.items()
+                for snippet_id in ids])
+
+    def tearDown(self):
+        Base.metadata.drop_all(test_engine)
+
+    def test_fill_change_log(self):
+        with test_engine.connect() as connection:
+            self.assertEqual(fill_change_log(connection, batch_size=2), 5)
+            for user_id, ids in self.snippet_ids.items():
+                rows, has_more = changes.read(connection, user_id, 0, 10)
+                self.assertFalse(has_more)
+                self.assertEqual(sorted(row.snippet_id for row in rows),
+                                 sorted(ids))
+                self.assertEqual([row.seq for row in rows],
+                                 list(range(1, len(ids) + 1)))
+                self.assertFalse(any(row.deleted for row in rows))
+            self.assertEqual(fill_change_log(connection), 0)
+
+    def test_migrate_fills_change_log(self):
+        migrate(test_engine)
+        with test_engine.connect() as connection:
+            rows, _ = changes.read(connection, USER_ID, 0, 10)
+        self.assertEqual(len(rows), 3)
+
+
+class TestIdMigrations(unittest.TestCase):
+    def setUp(self):
+        # The tables as they were when ids were stored as text
+        legacy = MetaData()
+        for table in Base.metadata.sorted_tables:
+            table = table.to_metadata(legacy)
+            for column in table.columns:
+                if isinstance(column.type, UUID):
+                    column.type = String(60)
+        legacy.create_all(test_engine)
+        now = datetime(2024, 5, 12, 22, 45)
+        self.user_id = str(uuid4())
+        self.snippet_ids = sorted(str(uuid4()) for _ in range(3))
+        with test_engine.begin() as connection:
+            connection.execute(legacy.tables['users'].insert().values(
+                user_id=self.user_id, username='jane',
+                email='jane@example.com', hashed_password=b'x',
+                created_at=now, updated_at=now))
+            connection.execute(legacy.tables['snippets'].insert(), [
+                {'snippet_id': snippet_id, 'title': 'Title',
+                 'language': 'python', 'code': 'x', 'created_at': now,
+                 'updated_at': now, 'user_id': self.user_id}
+                for snippet_id in self.snippet_ids])
+        self.legacy = legacy
+
+    def tearDown(self):
+        Base.metadata.drop_all(test_engine)
+
+    def test_text_id_tables(self):
+        with test_engine.connect() as connection:
+            names = [table.name for table in text_id_tables(connection)]
+        self.assertEqual(sorted(names), [
+            'search_documents', 'search_postings', 'snippet_changes',
+            'snippets', 'users'])
+        self.assertLess(names.index('users'), names.index('snippets'))
+
+    def test_migrate_converts_ids(self):
+        applied = migrate(test_engine)
+        self.assertIn('users ids', applied)
+        self.assertIn('snippets ids', applied)
+        with test_engine.connect() as connection:
+            self.assertEqual(text_id_tables(connection), [])
+            self.assertEqual(connection.execute(
+                select(User.user_id)).scalars().all(), [self.user_id])
+            self.assertEqual(connection.execute(
+                select(Snippet.snippet_id).where(
+                    Snippet.user_id == self.user_id).order_by(
+                        Snippet.snippet_id)).scalars().all(),
+                self.snippet_ids)
+            self.assertEqual(connection.execute(
+                select(func.length(Snippet.user_id))).scalar(), 16)
+            names = inspect(connection).get_table_names()
+        self.assertFalse(any(name.endswith('_text_ids') for name in names))
+        indexes = {index['name'] for index in
+                   inspect(test_engine).get_indexes('snippets')}
+        self.assertIn('ix_snippets_user_id_updated_at', indexes)
+        self.assertEqual(migrate(test_engine), [])
+
+    def test_convert_in_pages(self):
+        streamed = []
+
+        def check(connection, cursor, statement, parameters, context,
+                  executemany):
+            streamed.append(bool(
+                context.execution_options.get('stream_results')))
+
+        # A composite primary key spread over several pages
+        postings = self.legacy.tables['search_postings']
+        with test_engine.begin() as connection:
+            connection.execute(postings.insert(), [
+                {'user_id': self.user_id, 'term': term,
+                 'snippet_id': snippet_id, 'language': 'python', 'tf': 1,
+                 'doc_length': 3}
+                for term in ('a', 'b', 'c')
+                for snippet_id in self.snippet_ids])
+        event.listen(test_engine, 'before_cursor_execute', check)
+        try:
+            with test_engine.connect() as connection:
+                copied = convert_ids(connection, text_id_tables(connection),
+                                     batch_size=2)
+        finally:
+            event.remove(test_engine, 'before_cursor_execute', check)
+        self.assertEqual(copied, 1 + 3 + 9)
+        self.assertNotIn(True, streamed)
+        with test_engine.connect() as connection:
+            self.assertEqual(connection.execute(select(
+                func.count()).select_from(Snippet.__table__)).scalar(), 3)
+            self.assertEqual(connection.execute(
+                select(func.count()).select_from(Base.metadata.tables[
+                    'search_postings'])).scalar(), 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
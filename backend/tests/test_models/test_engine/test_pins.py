@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+"""
+Module contains tests for pins.py
+
+Shared Pins:
+Pins a user in one ReplicaPins and checks another one on the same file,
+  as another worker process holds, sees the pin until it expires.
+
+Cleanup:
+Checks expired pins are dropped when users are pinned.
+
+Failures:
+Checks a pin that cannot be read counts as pinned, and that a pin that
+  cannot be written is not raised.
+"""
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+from models.engine.pins import ReplicaPins
+
+
+class TestReplicaPins(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'pins.db')
+
+    def test_shared(self):
+        writer = ReplicaPins(self.path, 60)
+        reader = ReplicaPins(self.path, 60)
+        self.assertFalse(reader.pinned('user'))
+        writer.pin(['user'])
+        self.assertTrue(reader.pinned('user'))
+        self.assertFalse(reader.pinned('other'))
+
+    def test_expires(self):
+        pins = ReplicaPins(self.path, 60)
+        pins.pin(['user'])
+        with patch('models.engine.pins.time.time', return_value=1e12):
+            self.assertFalse(pins.pinned('user'))
+
+    def test_cleanup(self):
+        pins = ReplicaPins(self.path, 60)
+        pins.pin(['old'])
+        with patch('models.engine.pins.time.time', return_value=1e12):
+            pins.pin(['new'])
+        with sqlite3.connect(self.path) as connection:
+            users = connection.execute(
+                'SELECT user_id FROM pins').fetchall()
+        self.assertEqual(users, [('new',)])
+
+    def test_unreadable(self):
+        pins = ReplicaPins(self.path, 60)
+        with patch.object(pins, '_ReplicaPins__connect',
+                          side_effect=sqlite3.OperationalError('locked')):
+            self.assertTrue(pins.pinned('user'))
+            pins.pin(['user'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+"""
+Module contains tests for search.py
+
+Tokenize:
+Checks identifiers are kept whole and also split on snake_case and
+  camelCase boundaries, lowercased, with short terms dropped.
+
+Search:
+Indexes snippets directly and checks BM25 puts the best match first,
+  scopes results to one user and one language, and that removed snippets
+  are no longer found.
+"""
+import unittest
+from types import SimpleNamespace
+from sqlalchemy import create_engine
+from models.base import Base
+from models.engine import search
+from models.ids import uuid7
+
+TEST_DATABASE_URL = 'sqlite:///test_database.db'
+
+test_engine = create_engine(TEST_DATABASE_URL)
+
+U1, U2 = uuid7(), uuid7()
+S1, S2, S3, S4 = (uuid7() for _ in range(4))
+
+
+def make_snippet(snippet_id, user_id, title, code,
+                 description='', language='python'):
+    """Returns an object with the attributes the index reads"""
+    return SimpleNamespace(snippet_id=snippet_id, user_id=user_id,
+                           title=title, code=code, description=description,
+                           language=language)
+
+
+class TestTokenize(unittest.TestCase):
+    def test_splits_identifiers(self):
+        self.assertEqual(
+            search.tokenize('getUserById(user_id)'),
+            ['getuserbyid', 'get', 'user', 'by', 'id',
+             'user_id', 'user', 'id'])
+
+    def test_drops_short_terms(self):
+        self.assertEqual(search.tokenize('a = b + cc'), ['cc'])
+
+    def test_empty(self):
+        self.assertEqual(search.tokenize(None), [])
+
+
+class TestSearch(unittest.TestCase):
+    def setUp(self):
+        Base.metadata.create_all(test_engine)
+        self.connection = test_engine.connect()
+        search.index_snippets(self.connection, [
+            make_snippet(S1, U1, 'Fetch users', 'def fetch_users(): pass'),
+            make_snippet(S2, U1, 'Sort list', 'sorted(users)'),
+            make_snippet(S3, U1, 'Parse JSON', 'JSON.parse(text)',
+                         language='javascript'),
+            make_snippet(S4, U2, 'Fetch users', 'def fetch_users(): pass'),
+        ], replace=False)
+
+    def tearDown(self):
+        self.connection.close()
+        Base.metadata.drop_all(test_engine)
+
+    def test_best_match_first(self):
+        results = search.search(self.connection, U1, 'fetch users')
+        self.assertEqual([snippet_id for snippet_id, _ in results],
+                         [S1, S2])
+        self.assertGreater(results[0][1], results[1][1])
+
+    def test_scoped_by_language(self):
+        results = search.search(self.connection, U1, 'parse users',
+                                language='javascript')
+        self.assertEqual([snippet_id for snippet_id, _ in results], [S3])
+
+    def test_scoped_by_user(self):
+        results = search.search(self.connection, U2, 'sort')
+        self.assertEqual(results, [])
+
+    def test_removed_snippets(self):
+        search.remove_snippets(self.connection, [S1])
+        results = search.search(self.connection, U1, 'fetch')
+        self.assertEqual(results, [])
+
+    def test_reindex_replaces_entries(self):
+        search.index_snippets(self.connection, [
+            make_snippet(S2, U1, 'Reverse list', 'reversed(items)')])
+        self.assertEqual(search.search(self.connection, U1, 'sorted'), [])
+        self.assertEqual(
+            search.search(self.connection, U1, 'reverse')[0][0], S2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+#!/usr/bin/python3
+"""
+Module contains tests for slow_queries.py
+
+Redaction:
+Checks strings and bytes are replaced by their type and length, while
+  numbers, dates and None are kept.
+
+Slow Query Log:
+Logs the statements of a SQLite engine with no threshold and checks each
+  line holds the statement, its redacted parameters and the plan showing
+  the full scan of an unindexed column, that nothing is written under the
+  threshold, and that the results of the statement are intact.
+
+Storage:
+Runs Storage methods, directly and from a Flask route, with slow query
+  logging on and checks the entries name the method and the route.
+"""
+
+from datetime import datetime
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from flask import Flask
+from sqlalchemy import create_engine, text
+import metrics
+from models.engine import slow_queries
+from models.engine.slow_queries import SlowQueryLog, log_slow_queries
+from models.engine.storage import Storage
+from models.user import User
+
+
+def entries(path):
+    """Returns the entries written to a slow query log"""
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+class TestRedaction(unittest.TestCase):
+    def test_redact(self):
+        self.assertEqual(slow_queries.redact('user@example.com'), '<str 16>')
+        self.assertEqual(slow_queries.redact(b'\x01' * 16), '<bytes 16>')
+        self.assertEqual(slow_queries.redact(42), 42)
+        self.assertIsNone(slow_queries.redact(None))
+        self.assertEqual(slow_queries.redact(datetime(2024, 5, 12, 9, 30)),
+                         '2024-05-12T09:30:00')
+
+    def test_redact_parameters(self):
+        self.assertEqual(
+            slow_queries.redact_parameters({'email': 'secret', 'limit': 5}),
+            {'email': '<str 6>', 'limit': 5})
+        self.assertEqual(
+            slow_queries.redact_parameters([('secret', 1), ('other', 2)]),
+            [['<str 6>', 1], ['<str 5>', 2]])
+
+
+class TestSlowQueryLog(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.path = os.path.join(directory, 'slow.log')
+        self.engine = create_engine(
+            f'sqlite:///{os.path.join(directory, "notes.db")}')
+        with self.engine.begin() as connection:
+            connection.execute(text(
+                'CREATE TABLE notes (note_id INTEGER PRIMARY KEY, '
+                'author TEXT)'))
+            connection.execute(text(
+                "INSERT INTO notes VALUES (1, 'ada'), (2, 'grace')"))
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_full_scan(self):
+        log_slow_queries(self.engine, 0, SlowQueryLog(self.path))
+        with self.engine.connect() as connection:
+            rows = connection.execute(text(
+                'SELECT note_id FROM notes WHERE author = :author'),
+                {'author': 'grace'}).scalars().all()
+        self.assertEqual(rows, [2])
+        entry, = entries(self.path)
+        self.assertIn('WHERE author = ?', entry['statement'])
+        self.assertEqual(entry['parameters'], ['<str 5>'])
+        self.assertIsNone(entry['route'])
+        self.assertIn('SCAN notes', ' '.join(entry['plan'][0]))
+        with open(self.path) as f:
+            self.assertNotIn('grace', f.read())
+
+    def test_not_explained(self):
+        log_slow_queries(self.engine, 0, SlowQueryLog(self.path))
+        with self.engine.begin() as connection:
+            connection.execute(text("INSERT INTO notes VALUES (3, 'alan')"))
+        entry, = entries(self.path)
+        self.assertIsNone(entry['plan'])
+
+    def test_under_threshold(self):
+        log_slow_queries(self.engine, 60000, SlowQueryLog(self.path))
+        with self.engine.connect() as connection:
+            connection.execute(text('SELECT note_id FROM notes'))
+        self.assertEqual(entries(self.path), [])
+
+
+class TestStorageSlowQueries(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.path = os.path.join(directory, 'slow.log')
+        path = self.path
+        with patch.object(slow_queries, 'SlowQueryLog',
+                          lambda: SlowQueryLog(path)):
+            self.storage = Storage(
+                f'sqlite:///{os.path.join(directory, "vault.db")}', [],
+                slow_query_ms=0.000001)
+            self.storage.migrate()
+        self.user = User(username='Slow Reader', email='slow@example.com',
+                         password='slowReader123')
+        self.storage.new(self.user)
+        self.storage.save()
+        self.storage.close()
+
+    def tearDown(self):
+        self.storage.close()
+
+    def logged(self, method):
+        return [entry for entry in entries(self.path)
+                if entry['method'] == method]
+
+    def test_method(self):
+        self.storage.get_user_by_email('slow@example.com')
+        entry, = self.logged('get_user_by_email')
+        self.assertEqual(entry['parameters'][0], '<str 16>')
+        self.assertIn('users', ' '.join(entry['plan'][0]))
+
+    def test_route(self):
+        app = Flask(__name__)
+        metrics.init_app(app, metrics.Registry(directory=None))
+
+        @app.route('/snippets')
+        def snippets():
+            self.storage.get_snippets_by_user_id(self.user.user_id)
+            return 'ok'
+
+        app.test_client().get('/snippets')
+        entry, = self.logged('get_snippets_by_user_id')
+        self.assertEqual(entry['route'], 'snippets')
+
+
+if __name__ == '__main__':
+    unittest.main()
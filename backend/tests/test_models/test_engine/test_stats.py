@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+"""
+Module contains tests for stats.py
+
+Deltas:
+Checks adding and removing snippets changes the global, per-user and
+  per-language counters by one each.
+
+Adjust:
+Applies deltas several times and checks the counters add up whatever slot
+  each write landed in, and that removed counters read as 0. Checks a
+  counter summed as a DECIMAL, as MySQL does, is read as an int.
+
+Reconcile:
+Stores wrong counters next to real users and snippets and checks
+  reconcile reports the drift and replaces them with the actual counts,
+  leaving the versions untouched.
+
+Versions:
+Checks version_deltas bumps each user once and the version of all
+  snippets once, and bump_versions moves every version forward.
+"""
+import unittest
+from datetime import datetime
+from decimal import Decimal
+from unittest.mock import MagicMock
+from sqlalchemy import create_engine
+from models.base import Base
+from models.user import User
+from models.snippet import Snippet
+from models.engine import stats
+from models.ids import uuid7
+
+TEST_DATABASE_URL = 'sqlite:///test_database.db'
+
+test_engine = create_engine(TEST_DATABASE_URL)
+
+
+class TestDeltas(unittest.TestCase):
+    def test_snippet_deltas(self):
+        deltas = stats.snippet_deltas(
+            added=[('u1', 'python'), ('u1', 'go')],
+            removed=[('u2', 'python')])
+        self.assertEqual(deltas[stats.SNIPPETS], 1)
+        self.assertEqual(deltas[(stats.USER, 'u1')], 2)
+        self.assertEqual(deltas[(stats.USER, 'u2')], -1)
+        self.assertEqual(deltas[(stats.LANGUAGE, 'python')], 0)
+        self.assertEqual(deltas[(stats.LANGUAGE, 'go')], 1)
+
+    def test_version_deltas(self):
+        self.assertEqual(stats.version_deltas(['u1', 'u2', 'u1']), {
+            (stats.VERSION, 'u1'): 1, (stats.VERSION, 'u2'): 1,
+            (stats.VERSION, stats.ALL): 1})
+        self.assertEqual(stats.version_deltas([]), {})
+
+
+class TestCounters(unittest.TestCase):
+    def setUp(self):
+        Base.metadata.create_all(test_engine)
+        self.connection = test_engine.connect()
+
+    def tearDown(self):
+        self.connection.close()
+        Base.metadata.drop_all(test_engine)
+
+    def test_adjust(self):
+        for _ in range(20):
+            stats.adjust(self.connection, stats.snippet_deltas(
+                added=[('u1', 'python')]))
+        stats.adjust(self.connection, stats.snippet_deltas(
+            removed=[('u1', 'python')]))
+        self.assertEqual(stats.get(self.connection, *stats.SNIPPETS), 19)
+        self.assertEqual(stats.get(self.connection, stats.USER, 'u1'), 19)
+        self.assertEqual(stats.counts(self.connection, stats.LANGUAGE),
+                         {'python': 19})
+
+    def test_get_decimal(self):
+        connection = MagicMock()
+        connection.execute.return_value.scalar_one.return_value = \
+            Decimal('19')
+        value = stats.get(connection, *stats.SNIPPETS)
+        self.assertEqual(value, 19)
+        self.assertIs(type(value), int)
+
+    def test_remove(self):
+        stats.adjust(self.connection, {(stats.USER, 'u1'): 3})
+        stats.remove(self.connection, stats.USER, ['u1'])
+        self.assertEqual(stats.get(self.connection, stats.USER, 'u1'), 0)
+
+    def test_reconcile(self):
+        now = datetime(2024, 5, 12, 22, 45)
+        user_id = uuid7()
+        self.connection.execute(User.__table__.insert().values(
+            user_id=user_id, username='jane', email='jane@example.com',
+            hashed_password=b'x', created_at=now, updated_at=now))
+        self.connection.execute(Snippet.__table__.insert(), [
+            {'snippet_id': uuid7(), 'title': 'Title', 'code': 'x',
+             'language': 'go' if i else 'python', 'created_at': now,
+             'updated_at': now, 'user_id': user_id} for i in range(3)])
+        stats.adjust(self.connection, {stats.SNIPPETS: 5,
+                                       (stats.LANGUAGE, 'rust'): 1,
+                                       (stats.VERSION, 'u1'): 7})
+        self.assertFalse(stats.is_empty(self.connection))
+
+        drift = stats.reconcile(self.connection)
+        self.assertIn(('global', 'snippets', 5, 3), drift)
+        self.assertIn(('language', 'rust', 1, 0), drift)
+        self.assertIn(('global', 'users', 0, 1), drift)
+        self.assertEqual(stats.get(self.connection, *stats.SNIPPETS), 3)
+        self.assertEqual(stats.counts(self.connection, stats.LANGUAGE),
+                         {'go': 2, 'python': 1})
+        self.assertEqual(stats.reconcile(self.connection), [])
+        self.assertEqual(stats.get(self.connection, stats.VERSION, 'u1'), 7)
+
+    def test_bump_versions(self):
+        stats.adjust(self.connection, stats.version_deltas(['u1']))
+        stats.bump_versions(self.connection)
+        self.assertEqual(stats.get(self.connection, stats.VERSION, 'u1'), 2)
+        self.assertEqual(
+            stats.get(self.connection, stats.VERSION, stats.ALL), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
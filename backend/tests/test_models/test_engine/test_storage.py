@@ -55,18 +55,146 @@ Confirms that a snippet can be created, associated with a user,
 Snippet Deletion:
 Ensures that a snippet can be deleted from the database and verifies that
   the deleted snippet cannot be retrieved afterward.
+
+Storage Pagination Tests:
+
+Keyset Pages:
+Walks every page with next_cursor and checks that each row comes back
+  exactly once, most recently updated first, and that the last page has
+  no next_cursor.
+
+Invalid Cursor:
+Ensures a cursor that was not produced by Storage raises ValueError.
+
+Summary Pages:
+Checks summary pages carry the summary columns but not the code.
+
+Storage Concurrency Tests:
+
+Threads x Requests:
+Runs N threads each serving M simulated requests (query then close, as the
+  Flask teardown does) and checks that no session is ever used by two
+  threads and no pooled connection is ever checked out twice at once.
+
+Fork:
+Checks that a forked child starts with a fresh connection pool instead of
+  reusing the sockets of the parent.
+
+Storage Search Tests:
+
+Index Maintenance:
+Creates, updates and deletes snippets through Storage and checks that
+  search_snippets reflects every change, including deleting the owner.
+  Rebuilds the index from more snippets than a page and checks no read
+  streams rows while postings are written.
+
+Storage User Cache Tests:
+
+Hits and Misses:
+Looks the same user up twice and checks the second lookup is a hit.
+
+Invalidation:
+Updates and deletes a cached user and checks the next lookup sees the
+  change instead of the cached copy.
+
+Storage Ownership-Checked Write Tests:
+
+Update and Delete:
+Checks update_user_snippet and delete_user_snippet only touch a snippet
+  when it belongs to the given user, return the updated snippet or None,
+  and keep the search index and the code summary in step. get_user_snippet
+  only returns a snippet to its owner.
+
+Storage Counter Tests:
+
+Writes:
+Creates users and snippets, changes a snippet's language and deletes
+  snippets through every Storage write path, and checks the global,
+  per-user and per-language counters follow each change.
+
+Reconcile:
+Changes the snippets table behind Storage's back and checks
+  reconcile_counts reports and repairs the drift.
+
+Versions:
+Checks every kind of write bumps the version of the owner's snippets and
+  of all snippets, reads and writes to other users leave it alone, and
+  reconcile never moves it back.
+
+Change Feed:
+Syncs with get_changes after every kind of write and checks only the
+  snippets written since come back, deletions as tombstones, and that
+  clearing the snippets makes an old client reset.
+
+Events:
+Subscribes to a user's events and checks every committed write publishes
+  one, in the order of the change feed, and a write rolled back none.
+  Reads the counters as DECIMAL, as MySQL sums them, and checks the
+  events still carry int sequence numbers and format as server-sent
+  events.
+
+Storage Bulk Insert Tests:
+
+Batch:
+Inserts a batch of snippets in one call and checks they are all stored
+  and searchable.
+
+Group Commit:
+Creates snippets from concurrent threads with group commit on and checks
+  they are stored in fewer commits than snippets.
+
+Storage Replica Tests:
+
+Round Robin:
+Gives two SQLite files different users, as stand-ins for replicas, and
+  checks the reads of a thread stay on one replica until close and then
+  move on to the next, while writes go to the primary.
+
+Read Your Writes:
+Creates a snippet and checks its owner reads it from the primary for the
+  pin window, while other users and the global pages read the replicas,
+  and that its owner reads the replicas again once the window is over.
+  A second Storage sharing the pins file, as another worker does, also
+  sends the owner's reads to the primary.
+
+Storage Startup Tests:
+
+Lazy Connection:
+Checks creating storage, and closing it before any use, creates no
+  engine, and that the first use connects to the url storage was
+  created with.
+
+Stream:
+Streams the snippets of a user back with a small batch size and checks
+  every one is yielded, most recently updated first.
 """
+import os
+import tempfile
+import threading
+import time
 import unittest
-from sqlalchemy import create_engine
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest.mock import patch
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session as OrmSession
 from sqlalchemy.orm import sessionmaker, scoped_session
 from models.base import Base  # Base contains the declarative_base
 from models.user import User
 from models.snippet import Snippet
+from models.engine.storage import Storage, encode_cursor, decode_cursor
+from models.engine import stats
+from models.engine.events import format_sse
+from models.ids import uuid7
 
 TEST_DATABASE_URL = 'sqlite:///test_database.db'
 
 test_engine = create_engine(TEST_DATABASE_URL, echo=True)
 
+# A user who owns none of the snippets of the tests
+SOMEONE_ELSE = uuid7()
+
 Session = scoped_session(sessionmaker(bind=test_engine))
 
 
@@ -169,5 +297,898 @@ class TestSnippetModel(unittest.TestCase):
         self.assertIsNone(retrieved_snippet)
 
 
+class TestStoragePagination(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with patch('models.engine.storage.created_engine',
+                   TEST_DATABASE_URL):
+            cls.storage = Storage()
+        cls.storage.migrate()
+
+        cls.user = User(
+            username="Page Owner",
+            email="pages@example.com",
+            password="paginate123"
+            )
+        cls.storage.new(cls.user)
+        start = datetime(2024, 5, 12, 22, 45)
+        for i in range(7):
+            snippet = Snippet(
+                title=f"Snippet {i}",
+                code=f"print({i})",
+                description="",
+                language="python",
+                user_id=cls.user.user_id
+                )
+            # Two snippets share each timestamp to exercise the tie-break
+            snippet.updated_at = start + timedelta(minutes=i // 2)
+            cls.storage.new(snippet)
+        cls.storage.save()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.storage.close()
+        Base.metadata.drop_all(test_engine)
+
+    def test_pages_cover_every_snippet_once(self):
+        seen, cursor, pages = [], None, 0
+        while True:
+            page, cursor = self.storage.get_snippets_page(
+                self.user.user_id, limit=3, cursor=cursor)
+            seen.extend(page)
+            pages += 1
+            if cursor is None:
+                break
+        self.assertEqual(pages, 3)
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(len({s.snippet_id for s in seen}), 7)
+        keys = [(s.updated_at, s.snippet_id) for s in seen]
+        self.assertEqual(keys, sorted(keys, reverse=True))
+
+    def test_last_page_has_no_cursor(self):
+        page, cursor = self.storage.get_snippets_page(
+            self.user.user_id, limit=10)
+        self.assertEqual(len(page), 7)
+        self.assertIsNone(cursor)
+
+    def test_users_page(self):
+        page, cursor = self.storage.get_users_page(limit=1)
+        self.assertEqual(page[0].user_id, self.user.user_id)
+        self.assertIsNone(cursor)
+
+    def test_cursor_round_trip(self):
+        updated_at = datetime(2024, 5, 12, 22, 45)
+        cursor = encode_cursor(updated_at, 'abc')
+        self.assertEqual(decode_cursor(cursor), (updated_at, 'abc'))
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            self.storage.get_snippets_page(cursor='not-a-cursor')
+
+    def test_summary_page(self):
+        page, _ = self.storage.get_snippets_page(
+            self.user.user_id, limit=3, summary=True)
+        self.assertEqual(len(page), 3)
+        self.assertNotIn('code', page[0]._fields)
+        self.assertEqual(page[0].line_count, 1)
+        self.assertGreater(page[0].byte_size, 0)
+
+
+class TestStorageConcurrency(unittest.TestCase):
+    THREADS = 8
+    REQUESTS = 25
+
+    @classmethod
+    def setUpClass(cls):
+        with patch('models.engine.storage.created_engine',
+                   TEST_DATABASE_URL):
+            cls.storage = Storage()
+        cls.storage.migrate()
+        cls.user = User(
+            username="Busy User",
+            email="busy@example.com",
+            password="concurrent123"
+            )
+        cls.storage.new(cls.user)
+        cls.storage.save()
+        cls.storage.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.storage.close()
+        Base.metadata.drop_all(test_engine)
+
+    def test_threads_never_share_session_or_connection(self):
+        lock = threading.Lock()
+        session_threads = {}
+        sessions = []  # keeps sessions alive so their ids are not reused
+        checked_out = set()
+        errors = []
+
+        def on_begin(session, transaction, connection):
+            with lock:
+                sessions.append(session)
+                session_threads.setdefault(id(session), set()).add(
+                    threading.get_ident())
+
+        def on_checkout(dbapi_connection, record, proxy):
+            with lock:
+                if id(dbapi_connection) in checked_out:
+                    errors.append('connection checked out twice')
+                checked_out.add(id(dbapi_connection))
+
+        def on_checkin(dbapi_connection, record):
+            with lock:
+                checked_out.discard(id(dbapi_connection))
+
+        def serve():
+            try:
+                for _ in range(self.REQUESTS):
+                    user = self.storage.get_user_by_user_id(
+                        self.user.user_id)
+                    if user is None:
+                        errors.append('user not found')
+                    self.storage.get_snippets_page(self.user.user_id)
+                    self.storage.close()
+            except Exception as e:
+                errors.append(repr(e))
+
+        engine = self.storage.engine
+        event.listen(OrmSession, 'after_begin', on_begin)
+        event.listen(engine, 'checkout', on_checkout)
+        event.listen(engine, 'checkin', on_checkin)
+        try:
+            threads = [threading.Thread(target=serve)
+                       for _ in range(self.THREADS)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            event.remove(OrmSession, 'after_begin', on_begin)
+            event.remove(engine, 'checkout', on_checkout)
+            event.remove(engine, 'checkin', on_checkin)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(session_threads), self.THREADS * self.REQUESTS)
+        for threads_of_session in session_threads.values():
+            self.assertEqual(len(threads_of_session), 1)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'requires os.fork')
+    def test_child_gets_fresh_pool(self):
+        self.storage.get_user_by_user_id(self.user.user_id)
+        parent_pool = id(self.storage.engine.pool)
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            fresh = id(self.storage.engine.pool) != parent_pool
+            os.write(write_end, b'1' if fresh else b'0')
+            os._exit(0)
+        os.close(write_end)
+        result = os.read(read_end, 1)
+        os.close(read_end)
+        os.waitpid(pid, 0)
+        self.storage.close()
+        self.assertEqual(result, b'1')
+
+
+class TestStorageSearch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with patch('models.engine.storage.created_engine',
+                   TEST_DATABASE_URL):
+            cls.storage = Storage()
+        cls.storage.migrate()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.storage.close()
+        Base.metadata.drop_all(test_engine)
+
+    def setUp(self):
+        self.user = User(
+            username="Search User",
+            email="search@example.com",
+            password="searching123"
+            )
+        self.snippet = Snippet(
+            title="Binary search",
+            code="def binary_search(items, target): pass",
+            description="Halves the range each step",
+            language="python",
+            user_id=self.user.user_id
+            )
+        self.storage.new(self.user)
+        self.storage.new(self.snippet)
+        self.storage.save()
+
+    def tearDown(self):
+        self.storage.close()
+        self.storage.delete_all(Snippet)
+        self.storage.delete_all(User)
+        self.storage.close()
+
+    def found(self, query, language=None):
+        return [snippet.snippet_id for snippet, _ in
+                self.storage.search_snippets(
+                    self.user.user_id, query, language)]
+
+    def test_created_snippet_is_found(self):
+        self.assertEqual(self.found('binary'), [self.snippet.snippet_id])
+        self.assertEqual(self.found('range', 'python'),
+                         [self.snippet.snippet_id])
+        self.assertEqual(self.found('binary', 'ruby'), [])
+
+    def test_updated_snippet_is_reindexed(self):
+        self.storage.update_snippet(
+            self.snippet.snippet_id, title="Linear scan")
+        self.assertEqual(self.found('linear'), [self.snippet.snippet_id])
+        self.assertEqual(self.found('binary'), [self.snippet.snippet_id])
+        self.storage.update_snippet(
+            self.snippet.snippet_id, code="for item in items: pass")
+        self.assertEqual(self.found('binary_search'), [])
+
+    def test_deleted_snippet_is_not_found(self):
+        self.storage.delete(self.snippet)
+        self.storage.save()
+        self.assertEqual(self.found('binary'), [])
+
+    def test_deleted_user_is_not_found(self):
+        self.storage.delete_user_and_snippets(self.user.user_id)
+        self.assertEqual(self.found('binary'), [])
+
+    def test_reindex(self):
+        self.assertEqual(self.storage.reindex_search(), 1)
+        self.assertEqual(self.found('halves'), [self.snippet.snippet_id])
+
+    def test_reindex_in_pages(self):
+        self.storage.bulk_insert_snippets([Snippet(
+            title=f"Merge pass {i}", code="merge(left, right)",
+            description="", language="python", user_id=self.user.user_id)
+            for i in range(4)])
+        streamed = []
+
+        def check(connection, cursor, statement, parameters, context,
+                  executemany):
+            streamed.append(bool(
+                context.execution_options.get('stream_results')))
+
+        event.listen(Engine, 'before_cursor_execute', check)
+        try:
+            self.assertEqual(self.storage.reindex_search(batch_size=2), 5)
+        finally:
+            event.remove(Engine, 'before_cursor_execute', check)
+        self.assertNotIn(True, streamed)
+        self.assertEqual(len(self.found('merge')), 4)
+        self.assertEqual(self.found('halves'), [self.snippet.snippet_id])
+
+
+class TestStorageUserCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with patch('models.engine.storage.created_engine',
+                   TEST_DATABASE_URL):
+            cls.storage = Storage()
+        cls.storage.migrate()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.storage.close()
+        Base.metadata.drop_all(test_engine)
+
+    def setUp(self):
+        self.user = User(
+            username="Cached User",
+            email="cached@example.com",
+            password="caching123"
+            )
+        self.storage.new(self.user)
+        self.storage.save()
+        self.storage.close()
+
+    def tearDown(self):
+        self.storage.close()
+        self.storage.delete_all(User)
+        self.storage.close()
+
+    def test_second_lookup_is_a_hit(self):
+        before = self.storage.user_cache_stats()
+        first = self.storage.get_cached_user(self.user.user_id)
+        second = self.storage.get_cached_user(self.user.user_id)
+        after = self.storage.user_cache_stats()
+        self.assertEqual(first, second)
+        self.assertEqual(first.email, "cached@example.com")
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+
+    def test_unknown_user(self):
+        self.assertIsNone(self.storage.get_cached_user('no-such-user'))
+
+    def test_update_invalidates(self):
+        self.storage.get_cached_user(self.user.user_id)
+        user = self.storage.get_user_by_user_id(self.user.user_id)
+        user.email = "changed@example.com"
+        self.storage.save()
+        self.assertEqual(
+            self.storage.get_cached_user(self.user.user_id).email,
+            "changed@example.com")
+
+    def test_delete_invalidates(self):
+        self.storage.get_cached_user(self.user.user_id)
+        user = self.storage.get_user_by_user_id(self.user.user_id)
+        self.storage.delete(user)
+        self.storage.save()
+        self.assertIsNone(self.storage.get_cached_user(self.user.user_id))
+
+
+class TestStorageOwnedWrites(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with patch('models.engine.storage.created_engine',
+                   TEST_DATABASE_URL):
+            cls.storage = Storage()
+        cls.storage.migrate()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.storage.close()
+        Base.metadata.drop_all(test_engine)
+
+    def setUp(self):
+        self.owner = User(
+            username="Owner",
+            email="owner@example.com",
+            password="owning1234"
+            )
+        self.snippet = Snippet(
+            title="Owned",
+            code="print('mine')",
+            description="",
+            language="python",
+            user_id=self.owner.user_id
+            )
+        self.storage.new(self.owner)
+        self.storage.new(self.snippet)
+        self.storage.save()
+        self.storage.close()
+
+    def tearDown(self):
+        self.storage.close()
+        self.storage.delete_all(Snippet)
+        self.storage.delete_all(User)
+        self.storage.close()
+
+    def test_update_by_owner(self):
+        self.assertTrue(self.storage.update_user_snippet(
+            self.snippet.snippet_id, self.owner.user_id,
+            {'title': 'Renamed'}))
+        self.storage.close()
+        snippet = self.storage.get_snippet_by_snippet_id(
+            self.snippet.snippet_id)
+        self.assertEqual(snippet.title, 'Renamed')
+        self.assertEqual(snippet.code, "print('mine')")
+        found = self.storage.search_snippets(self.owner.user_id, 'renamed')
+        self.assertEqual(len(found), 1)
+
+    def test_update_returns_snippet(self):
+        snippet = self.storage.update_user_snippet(
+            self.snippet.snippet_id, self.owner.user_id,
+            {'title': 'Renamed'})
+        self.assertEqual(snippet.title, 'Renamed')
+        self.assertEqual(snippet.code, "print('mine')")
+        self.assertEqual(snippet.description, self.snippet.description)
+        self.assertIsNotNone(snippet.updated_at)
+
+        updated_at = datetime(2024, 5, 12, 9, 30)
+        snippet = self.storage.update_user_snippet(
+            self.snippet.snippet_id, self.owner.user_id,
+            {'title': 'Greeting', 'code': 'console.log(1)',
+             'description': 'logs', 'language': 'javascript',
+             'updated_at': updated_at})
+        self.assertEqual(
+            (snippet.title, snippet.code, snippet.description,
+             snippet.language, snippet.updated_at),
+            ('Greeting', 'console.log(1)', 'logs', 'javascript', updated_at))
+
+    def test_update_full_snippet(self):
+        self.assertTrue(self.storage.update_user_snippet(
+            self.snippet.snippet_id, self.owner.user_id,
+            {'title': 'Greeting', 'code': 'console.log(1)',
+             'description': 'logs', 'language': 'javascript'}))
+        found = self.storage.search_snippets(
+            self.owner.user_id, 'console', 'javascript')
+        self.assertEqual(len(found), 1)
+        self.assertEqual(
+            self.storage.search_snippets(self.owner.user_id, 'owned'), [])
+
+    def test_update_code_summary(self):
+        self.assertTrue(self.storage.update_user_snippet(
+            self.snippet.snippet_id, self.owner.user_id,
+            {'code': 'a = 1\nb = "\u00e9"'}))
+        snippet = self.storage.get_user_snippet(
+            self.snippet.snippet_id, self.owner.user_id)
+        self.assertEqual(snippet.line_count, 2)
+        self.assertEqual(snippet.byte_size, 14)
+        self.assertEqual(snippet.code_preview, 'a = 1\nb = "\u00e9"')
+
+    def test_get_user_snippet(self):
+        snippet = self.storage.get_user_snippet(
+            self.snippet.snippet_id, self.owner.user_id)
+        self.assertEqual(snippet.code, "print('mine')")
+        self.assertIsNone(self.storage.get_user_snippet(
+            self.snippet.snippet_id, SOMEONE_ELSE))
+
+    def test_update_by_other_user(self):
+        self.assertFalse(self.storage.update_user_snippet(
+            self.snippet.snippet_id, SOMEONE_ELSE, {'title': 'Stolen'}))
+        self.assertEqual(self.storage.get_snippet_by_snippet_id(
+            self.snippet.snippet_id).title, 'Owned')
+
+    def test_update_unknown_attribute(self):
+        with self.assertRaises(ValueError):
+            self.storage.update_user_snippet(
+                self.snippet.snippet_id, self.owner.user_id,
+                {'user_id': SOMEONE_ELSE})
+
+    def test_delete_by_other_user(self):
+        self.assertFalse(self.storage.delete_user_snippet(
+            self.snippet.snippet_id, SOMEONE_ELSE))
+        self.assertIsNotNone(self.storage.get_snippet_by_snippet_id(
+            self.snippet.snippet_id))
+
+    def test_delete_by_owner(self):
+        self.assertTrue(self.storage.delete_user_snippet(
+            self.snippet.snippet_id, self.owner.user_id))
+        self.assertIsNone(self.storage.get_snippet_by_snippet_id(
+            self.snippet.snippet_id))
+        self.assertEqual(
+            self.storage.search_snippets(self.owner.user_id, 'owned'), [])
+        self.assertFalse(self.storage.delete_user_snippet(
+            self.snippet.snippet_id, self.owner.user_id))
+
+
+class TestStorageCounters(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with patch('models.engine.storage.created_engine',
+                   TEST_DATABASE_URL):
+            cls.storage = Storage()
+        cls.storage.migrate()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.storage.close()
+        Base.metadata.drop_all(test_engine)
+
+    def setUp(self):
+        self.user = User(
+            username="Counter",
+            email="counter@example.com",
+            password="counting123"
+            )
+        self.storage.new(self.user)
+        self.storage.save()
+        self.snippets = [Snippet(
+            title=f"Counted {i}",
+            code="print(1)",
+            description="",
+            language="python" if i % 2 else "go",
+            user_id=self.user.user_id
+            ) for i in range(4)]
+        for snippet in self.snippets:
+            self.storage.new(snippet)
+        self.storage.save()
+        self.storage.close()
+
+    def tearDown(self):
+        self.storage.close()
+        self.storage.delete_all(Snippet)
+        self.storage.delete_all(User)
+        self.storage.close()
+
+    def add_someone_else(self):
+        other = User(
+            username="Someone Else",
+            email="else@example.com",
+            password="elsewhere123"
+            )
+        other.user_id = SOMEONE_ELSE
+        self.storage.new(other)
+        self.storage.save()
+
+    def assertCounts(self, users, snippets, user_snippets, languages):
+        self.assertEqual(self.storage.count_users(), users)
+        self.assertEqual(self.storage.count_snippets(), snippets)
+        self.assertEqual(
+            self.storage.count_snippets_by_user_id(self.user.user_id),
+            user_snippets)
+        self.assertEqual(self.storage.count_snippets_by_language(),
+                         languages)
+
+    def test_created(self):
+        self.assertCounts(1, 4, 4, {'go': 2, 'python': 2})
+        self.storage.bulk_insert_snippets([Snippet(
+            title="Bulk", code="x", description="", language="rust",
+            user_id=self.user.user_id)])
+        self.assertCounts(1, 5, 5, {'go': 2, 'python': 2, 'rust': 1})
+
+    def test_language_changed(self):
+        self.assertTrue(self.storage.update_user_snippet(
+            self.snippets[0].snippet_id, self.user.user_id,
+            {'language': 'rust'}))
+        snippet = self.storage.get_snippet_by_snippet_id(
+            self.snippets[1].snippet_id)
+        snippet.language = 'rust'
+        self.storage.save()
+        self.assertCounts(1, 4, 4, {'go': 1, 'python': 1, 'rust': 2})
+        self.assertFalse(self.storage.update_user_snippet(
+            self.snippets[2].snippet_id, SOMEONE_ELSE,
+            {'language': 'rust'}))
+        self.assertCounts(1, 4, 4, {'go': 1, 'python': 1, 'rust': 2})
+
+    def test_deleted(self):
+        self.assertTrue(self.storage.delete_user_snippet(
+            self.snippets[0].snippet_id, self.user.user_id))
+        snippet = self.storage.get_snippet_by_snippet_id(
+            self.snippets[1].snippet_id)
+        self.storage.delete(snippet)
+        self.storage.save()
+        self.assertCounts(1, 2, 2, {'go': 1, 'python': 1})
+
+    def test_user_deleted(self):
+        self.storage.delete_user_and_snippets(self.user.user_id)
+        self.assertCounts(0, 0, 0, {})
+
+    def test_reconcile(self):
+        with test_engine.begin() as connection:
+            connection.execute(Snippet.__table__.delete().where(
+                Snippet.__table__.c.snippet_id ==
+                self.snippets[0].snippet_id))
+        drift = self.storage.reconcile_counts()
+        self.assertIn(('global', 'snippets', 4, 3), drift)
+        self.assertCounts(1, 3, 3, {'go': 1, 'python': 2})
+
+    def test_versions(self):
+        user_id = self.user.user_id
+        versions = [self.storage.get_snippets_version(user_id)]
+        self.storage.get_snippets_page(user_id)
+        self.assertEqual(
+            self.storage.get_snippets_version(user_id), versions[-1])
+
+        def bumped():
+            versions.append(self.storage.get_snippets_version(user_id))
+            self.assertGreater(versions[-1], versions[-2])
+
+        self.storage.update_user_snippet(
+            self.snippets[0].snippet_id, user_id,
+            {'updated_at': datetime.now()})
+        bumped()
+        self.storage.update_user_snippet(
+            self.snippets[0].snippet_id, user_id, {'title': 'Renamed'})
+        bumped()
+        self.storage.delete_user_snippet(
+            self.snippets[0].snippet_id, user_id)
+        bumped()
+        snippet = self.storage.get_snippet_by_snippet_id(
+            self.snippets[1].snippet_id)
+        snippet.updated_at = datetime.now()
+        self.storage.save()
+        bumped()
+
+        self.add_someone_else()
+        everyone = self.storage.get_snippets_version()
+        self.storage.bulk_insert_snippets([Snippet(
+            title="Other", code="x", description="", language="go",
+            user_id=SOMEONE_ELSE)])
+        self.assertEqual(
+            self.storage.get_snippets_version(user_id), versions[-1])
+        self.assertGreater(self.storage.get_snippets_version(), everyone)
+
+        self.storage.reconcile_counts()
+        self.assertEqual(
+            self.storage.get_snippets_version(user_id), versions[-1])
+
+    def test_changes(self):
+        user_id = self.user.user_id
+        ids = [snippet.snippet_id for snippet in self.snippets]
+        first = self.storage.get_changes(user_id)
+        self.assertEqual(
+            sorted(row.snippet_id for row in first.snippets), sorted(ids))
+        self.assertEqual(first.deleted, [])
+        self.assertFalse(first.has_more or first.reset)
+
+        def sync(since, limit=50):
+            changes = self.storage.get_changes(user_id, since, limit)
+            self.assertFalse(changes.reset)
+            return ([row.snippet_id for row in changes.snippets],
+                    changes.deleted, changes.next_since)
+
+        self.assertEqual(sync(first.next_since),
+                         ([], [], first.next_since))
+        self.storage.update_user_snippet(
+            ids[0], user_id, {'title': 'Renamed'})
+        self.storage.update_user_snippet(
+            ids[1], user_id, {'updated_at': datetime.now()})
+        self.storage.delete_user_snippet(ids[2], user_id)
+        self.add_someone_else()
+        snippet = self.storage.get_snippet_by_snippet_id(ids[3])
+        snippet.user_id = SOMEONE_ELSE
+        self.storage.save()
+        snippets, deleted, since = sync(first.next_since)
+        self.assertEqual(snippets, ids[:2])
+        self.assertEqual(deleted, ids[2:])
+        self.assertEqual(self.storage.get_changes(
+            SOMEONE_ELSE).snippets[0].snippet_id, ids[3])
+
+        page = self.storage.get_changes(user_id, first.next_since, 3)
+        self.assertTrue(page.has_more)
+        self.assertEqual(sync(page.next_since), ([], [ids[3]], since))
+
+        self.storage.delete_all(Snippet)
+        self.storage.close()
+        self.assertTrue(self.storage.get_changes(user_id, since).reset)
+        self.storage.bulk_insert_snippets([Snippet(
+            title="Fresh", code="x", description="", language="go",
+            user_id=user_id)])
+        changes = self.storage.get_changes(user_id, since)
+        self.assertTrue(changes.reset)
+        self.assertEqual(len(changes.snippets), 1)
+        self.assertFalse(self.storage.get_changes(
+            user_id, changes.next_since).reset)
+
+    def test_events(self):
+        user_id = self.user.user_id
+        ids = [snippet.snippet_id for snippet in self.snippets]
+        subscription = self.storage.subscribe_events(user_id)
+        self.addCleanup(subscription.close)
+        since = self.storage.get_changes(user_id).next_since
+
+        self.storage.update_user_snippet(ids[0], user_id, {'title': 'New'})
+        self.storage.delete_user_snippet(ids[1], user_id)
+        snippet = Snippet(title="Pushed", code="x", description="",
+                          language="go", user_id=user_id)
+        self.storage.new(snippet)
+        self.storage.save()
+        self.storage.update_user_snippet(ids[2], SOMEONE_ELSE,
+                                         {'title': 'Stolen'})
+        self.assertEqual(subscription.get(0), [
+            {'type': 'updated', 'snippet_id': ids[0], 'seq': since + 1},
+            {'type': 'deleted', 'snippet_id': ids[1], 'seq': since + 2},
+            {'type': 'created', 'snippet_id': snippet.snippet_id,
+             'seq': since + 3}])
+
+        snippet = self.storage.get_snippet_by_snippet_id(ids[3])
+        snippet.title = 'Rolled back'
+        self.storage.new(snippet)
+        self.storage.all('Snippet')
+        self.storage.close()
+        self.assertEqual(subscription.get(0), [])
+
+    def test_events_with_decimal_counters(self):
+        user_id = self.user.user_id
+        subscription = self.storage.subscribe_events(user_id)
+        self.addCleanup(subscription.close)
+        get = stats.get
+
+        def get_decimal(connection, scope, name):
+            return Decimal(get(connection, scope, name))
+
+        with patch('models.engine.stats.get', get_decimal):
+            self.storage.update_user_snippet(
+                self.snippets[0].snippet_id, user_id, {'title': 'Summed'})
+        event, = subscription.get(0)
+        self.assertIs(type(event['seq']), int)
+        self.assertIn(f"id: {event['seq']}", format_sse(event))
+
+
+class TestStorageBulkInsert(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with patch('models.engine.storage.created_engine',
+                   TEST_DATABASE_URL):
+            cls.storage = Storage()
+        cls.storage.migrate()
+        cls.user = User(
+            username="Importer",
+            email="importer@example.com",
+            password="importing123"
+            )
+        cls.storage.new(cls.user)
+        cls.storage.save()
+        cls.storage.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.storage.close()
+        Base.metadata.drop_all(test_engine)
+
+    def test_bulk_insert(self):
+        snippets = [Snippet(
+            title=f"Imported {i}",
+            code=f"print({i})",
+            description="from the old vault",
+            language="python",
+            user_id=self.user.user_id
+            ) for i in range(25)]
+        self.assertEqual(self.storage.bulk_insert_snippets(snippets), 25)
+        self.storage.close()
+        self.assertEqual(
+            self.storage.count_snippets_by_user_id(self.user.user_id), 25)
+        found = self.storage.search_snippets(
+            self.user.user_id, 'vault', limit=50)
+        self.assertEqual(len(found), 25)
+
+    def test_bulk_insert_nothing(self):
+        self.assertEqual(self.storage.bulk_insert_snippets([]), 0)
+
+    def test_group_commit(self):
+        with patch('models.engine.storage.created_engine',
+                   TEST_DATABASE_URL):
+            storage = Storage(group_commit_window_ms=50)
+        before = self.storage.count_snippets_by_user_id(self.user.user_id)
+        self.storage.close()
+        created = []
+        start = threading.Barrier(10)
+
+        def create(i):
+            start.wait()
+            created.append(storage.create_snippet(Snippet(
+                title=f"Grouped {i}", code="x", description="",
+                language="go", user_id=self.user.user_id)))
+            storage.close()
+
+        threads = [threading.Thread(target=create, args=(i,))
+                   for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(created), 10)
+        self.assertLess(storage.group_commit_batches(), 10)
+        self.assertEqual(
+            self.storage.count_snippets_by_user_id(self.user.user_id),
+            before + 10)
+        self.assertEqual(self.storage.group_commit_batches(), 0)
+        storage.engine.dispose()
+
+    def test_stream_snippets(self):
+        other = User(
+            username="Streamer",
+            email="streamer@example.com",
+            password="streaming123"
+            )
+        self.storage.new(other)
+        self.storage.save()
+        start = datetime(2024, 5, 12, 22, 45)
+        snippets = []
+        for i in range(12):
+            snippet = Snippet(
+                title=f"Streamed {i}",
+                code=f"print({i})",
+                description="",
+                language="python",
+                user_id=other.user_id
+                )
+            snippet.updated_at = start + timedelta(minutes=i)
+            snippets.append(snippet)
+        self.storage.bulk_insert_snippets(snippets)
+
+        rows = list(self.storage.stream_snippets_by_user_id(
+            other.user_id, batch_size=5))
+        self.assertEqual([row.title for row in rows],
+                         [f"Streamed {i}" for i in reversed(range(12))])
+
+
+class TestStorageReplicas(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.replica_urls = []
+        for name in ('first', 'second'):
+            url = f'sqlite:///{os.path.join(directory, name)}.db'
+            engine = create_engine(url)
+            Base.metadata.create_all(engine)
+            with OrmSession(engine) as session:
+                session.add(User(
+                    username=f"On {name}",
+                    email=f"{name}@example.com",
+                    password="replicated123"
+                    ))
+                session.commit()
+            engine.dispose()
+            self.replica_urls.append(url)
+        self.pins_db = os.path.join(directory, 'pins.db')
+        self.storage = Storage(TEST_DATABASE_URL, self.replica_urls,
+                               replica_pin_seconds=0.3,
+                               replica_pins_db=self.pins_db)
+        self.storage.migrate()
+        self.owner = User(
+            username="Primary Owner",
+            email="owner@example.com",
+            password="primary123"
+            )
+        self.storage.new(self.owner)
+        self.storage.save()
+        self.storage.close()
+
+    def tearDown(self):
+        self.storage.close()
+        self.storage.delete_all(Snippet)
+        self.storage.delete_all(User)
+        self.storage.close()
+
+    def usernames(self):
+        rows, _ = self.storage.get_users_page()
+        return [row.username for row in rows]
+
+    def test_round_robin(self):
+        first = self.usernames()
+        self.assertEqual(self.usernames(), first)
+        self.storage.close()
+        second = self.usernames()
+        self.storage.close()
+        self.assertEqual(sorted(first + second), ["On first", "On second"])
+        self.assertEqual(self.usernames(), first)
+        self.assertIsNotNone(
+            self.storage.get_user_by_user_id(self.owner.user_id))
+
+    def test_read_your_writes(self):
+        owner_id = self.owner.user_id
+        self.storage.create_snippet(Snippet(
+            title="Fresh", code="x", description="", language="go",
+            user_id=owner_id))
+        self.storage.close()
+
+        rows, _ = self.storage.get_snippets_page(owner_id)
+        self.assertEqual([row.title for row in rows], ["Fresh"])
+        self.assertEqual(self.storage.count_snippets_by_user_id(owner_id), 1)
+        self.assertEqual(len(self.storage.get_changes(owner_id).snippets), 1)
+        self.assertEqual(self.storage.get_snippets_page()[0], [])
+        self.assertEqual(self.storage.get_snippets_page(SOMEONE_ELSE)[0], [])
+        self.storage.close()
+
+        time.sleep(0.3)
+        self.assertEqual(self.storage.get_snippets_page(owner_id)[0], [])
+        self.assertEqual(self.storage.count_snippets_by_user_id(owner_id), 0)
+
+    def test_read_your_writes_in_another_worker(self):
+        owner_id = self.owner.user_id
+        worker = Storage(TEST_DATABASE_URL, self.replica_urls,
+                         replica_pin_seconds=0.3,
+                         replica_pins_db=self.pins_db)
+        self.addCleanup(worker.close)
+        self.assertEqual(worker.get_snippets_page(owner_id)[0], [])
+        worker.close()
+
+        self.storage.create_snippet(Snippet(
+            title="Fresh", code="x", description="", language="go",
+            user_id=owner_id))
+        self.storage.close()
+
+        rows, _ = worker.get_snippets_page(owner_id)
+        self.assertEqual([row.title for row in rows], ["Fresh"])
+        self.assertEqual(worker.get_snippets_page(SOMEONE_ELSE)[0], [])
+        worker.close()
+
+        time.sleep(0.3)
+        self.assertEqual(worker.get_snippets_page(owner_id)[0], [])
+
+
+class TestStorageStartup(unittest.TestCase):
+    def test_lazy_connection(self):
+        with patch('models.engine.storage.created_engine',
+                   TEST_DATABASE_URL):
+            storage = Storage()
+        with patch('models.engine.storage.create_storage_engine') as engine:
+            storage.close()
+            engine.assert_not_called()
+        self.assertFalse(storage.connected)
+        storage.migrate()
+        self.assertTrue(storage.connected)
+        self.assertEqual(str(storage.engine.url), TEST_DATABASE_URL)
+        storage.count_users()
+        storage.close()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+"""
+Module contains tests for ids.py
+
+uuid7:
+Checks ids carry version 7 and the RFC variant, start with the current
+  time, and keep increasing within a millisecond and across threads.
+
+UUID Type:
+Stores ids in a table and checks they take 16 bytes, read back as text,
+  and that an id that is not a uuid matches no row.
+"""
+import threading
+import time
+import unittest
+import uuid
+from sqlalchemy import create_engine, MetaData, Table, Column, select
+from sqlalchemy import String, func
+from models.ids import UUID, uuid7
+
+
+class TestUuid7(unittest.TestCase):
+    def test_format(self):
+        before = time.time_ns() // 1000000
+        value = uuid.UUID(uuid7())
+        self.assertEqual(value.version, 7)
+        self.assertEqual(value.variant, uuid.RFC_4122)
+        self.assertGreaterEqual(value.int >> 80, before)
+        self.assertLessEqual(value.int >> 80, time.time_ns() // 1000000)
+
+    def test_increasing(self):
+        ids = [uuid7() for _ in range(10000)]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), len(ids))
+
+    def test_threads(self):
+        ids = []
+
+        def make():
+            ids.extend(uuid7() for _ in range(1000))
+
+        threads = [threading.Thread(target=make) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(ids)), 4000)
+
+
+class TestUUIDType(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        self.table = Table('things', MetaData(),
+                           Column('thing_id', UUID, primary_key=True),
+                           Column('name', String(10)))
+        self.table.metadata.create_all(self.engine)
+
+    def test_round_trip(self):
+        thing_id = uuid7()
+        with self.engine.begin() as connection:
+            connection.execute(self.table.insert(),
+                               {'thing_id': thing_id, 'name': 'a'})
+            self.assertEqual(connection.execute(
+                select(self.table.c.thing_id)).scalar(), thing_id)
+            self.assertEqual(connection.execute(
+                select(func.length(self.table.c.thing_id))).scalar(), 16)
+            self.assertEqual(connection.execute(
+                select(self.table.c.name).where(
+                    self.table.c.thing_id == thing_id.upper())).scalar(), 'a')
+
+    def test_not_a_uuid(self):
+        with self.engine.begin() as connection:
+            connection.execute(self.table.insert(),
+                               {'thing_id': uuid7(), 'name': 'a'})
+            self.assertIsNone(connection.execute(select(self.table).where(
+                self.table.c.thing_id == 'not-an-id')).first())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -11,7 +11,7 @@ Verify that a Snippet object can be created with valid arguments.
 
 Test Invalid Inputs:
 Check that the appropriate exceptions are raised for invalid inputs
- such as empty strings for required fields.
+ such as empty strings for required fields or code that is not a string.
 
 Test Attribute Assignments:
 Ensure that all attributes are correctly assigned during object creation.
@@ -19,10 +19,14 @@ Ensure that all attributes are correctly assigned during object creation.
 Test Default Values:
 Confirm that default values for created_at and updated_at
  are applied correctly.
+
+Test Code Summary:
+Confirm line_count, byte_size and code_preview follow the code, both at
+ creation and when the code is changed.
 """
 import unittest
 from datetime import datetime
-from models.snippet import Snippet
+from models.snippet import Snippet, CODE_PREVIEW_LINES
 
 
 class TestSnippetModel(unittest.TestCase):
@@ -70,6 +74,18 @@ class TestSnippetModel(unittest.TestCase):
                 user_id="1"
                 )
 
+    def test_snippet_creation_with_code_not_a_string(self):
+        """Test Snippet creation fails when the code is not a string."""
+        with self.assertRaises(ValueError) as context:
+            Snippet(
+                title="Test Title",
+                code=123,
+                description="A simple print statement",
+                language="Python",
+                user_id="1"
+                )
+        self.assertEqual(str(context.exception), 'Code must be a string')
+
     def test_attribute_assignments(self):
         """Test that all attributes are correctly assigned."""
         snippet = Snippet(
@@ -100,6 +116,23 @@ class TestSnippetModel(unittest.TestCase):
         self.assertIsNotNone(snippet.created_at)
         self.assertIsNotNone(snippet.updated_at)
 
+    def test_code_summary(self):
+        """Test the summary columns are computed from the code."""
+        code = "\n".join(f"line_{i} = {i}" for i in range(20))
+        snippet = Snippet(
+            title="Long", code=code, description="",
+            language="python", user_id="1"
+        )
+        self.assertEqual(snippet.line_count, 20)
+        self.assertEqual(snippet.byte_size, len(code))
+        self.assertEqual(snippet.code_preview.splitlines(),
+                         code.splitlines()[:CODE_PREVIEW_LINES])
+
+        snippet.code = "x"
+        self.assertEqual(snippet.line_count, 1)
+        self.assertEqual(snippet.byte_size, 1)
+        self.assertEqual(snippet.code_preview, "x")
+
 
 if __name__ == '__main__':
     unittest.main()
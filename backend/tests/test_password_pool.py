@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+"""
+Module contains unittest for password_pool.py
+
+Test hash and verify:
+Check that passwords hashed in the pool verify both in the pool and with
+    bcrypt directly, that the time bcrypt took is recorded in metrics, and
+    that validation errors reach the caller.
+
+Test bounded queue:
+Ensure the pool raises PasswordPoolBusy, carrying retry_after, as soon as
+    workers + queue_size operations are already in progress.
+
+Test broken pool:
+Kill the process of the pool and check the next operation still succeeds
+    in a new pool, and that an operation breaking the new pool too fails.
+"""
+
+from concurrent.futures.process import BrokenProcessPool
+import os
+import signal
+import threading
+import time
+import unittest
+import bcrypt
+from metrics import registry
+from password_pool import PasswordPool, PasswordPoolBusy
+
+
+class TestPasswordPool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = PasswordPool(workers=1, queue_size=0, retry_after=3)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.shutdown()
+
+    def test_hash_and_verify(self):
+        verified = registry.value('bcrypt_duration_seconds',
+                                  operation='verify')
+        hashed = self.pool.hash('validPassword123')
+        self.assertTrue(bcrypt.checkpw(b'validPassword123', hashed))
+        self.assertTrue(self.pool.verify('validPassword123', hashed))
+        self.assertFalse(self.pool.verify('wrongPassword123', hashed))
+        self.assertEqual(self.pool.pending, 0)
+        self.assertEqual(registry.value('bcrypt_duration_seconds',
+                                        operation='verify'), verified + 2)
+        self.assertGreater(registry.value('bcrypt_duration_seconds',
+                                          operation='hash'), 0)
+
+    def test_hash_short_password(self):
+        with self.assertRaises(ValueError):
+            self.pool.hash('short')
+        self.assertEqual(self.pool.pending, 0)
+
+    def test_busy_when_full(self):
+        worker = threading.Thread(
+            target=self.pool.hash, args=('validPassword123',))
+        worker.start()
+        while self.pool.pending == 0:
+            time.sleep(0.001)
+
+        with self.assertRaises(PasswordPoolBusy) as context:
+            self.pool.verify('validPassword123', b'')
+        self.assertEqual(context.exception.retry_after, 3)
+
+        worker.join()
+        self.assertEqual(self.pool.pending, 0)
+
+
+class TestBrokenPasswordPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = PasswordPool(workers=1, queue_size=0)
+        self.addCleanup(self.pool.shutdown)
+
+    def test_worker_killed(self):
+        hashed = self.pool.hash('validPassword123')
+        pid = self.pool._PasswordPool__run('verify', os.getpid)
+        os.kill(pid, signal.SIGKILL)
+        self.assertTrue(self.pool.verify('validPassword123', hashed))
+        self.assertNotEqual(self.pool._PasswordPool__run('verify', os.getpid),
+                            pid)
+        self.assertEqual(self.pool.pending, 0)
+
+    def test_broken_again(self):
+        with self.assertRaises(BrokenProcessPool):
+            self.pool._PasswordPool__run('verify', os._exit, 1)
+        self.assertEqual(self.pool.pending, 0)
+        self.assertTrue(self.pool.verify(
+            'validPassword123', self.pool.hash('validPassword123')))
+
+
+if __name__ == '__main__':
+    unittest.main()
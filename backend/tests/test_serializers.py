@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+"""
+Module contains unittest for serializers.py
+
+Test Serializer Class:
+Check the JSON produced matches what json.dumps gives for the same row,
+    that date fields are shown like format_datetime and other datetimes
+    in ISO format, that strings are escaped and None becomes null, and
+    that field names which are not identifiers are refused.
+
+Test dumps_page Method:
+Check the page is valid JSON bytes holding the rows and the next_cursor.
+"""
+
+import json
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+from serializers import Serializer, snippet_serializer, user_serializer
+from serializers import encoded_minute
+from utilities import format_datetime
+
+
+def make_snippet(i, **kwargs):
+    """Returns an object with the columns of a snippet"""
+    attributes = dict(
+        snippet_id=str(i), title=f'Title {i}', description=None,
+        language='python', code='print("h\u00e9llo")\n\tx = 1',
+        created_at=datetime(2024, 5, 12, 22, 45, 10),
+        updated_at=datetime(2024, 5, 12, 22, 46, 59, 123), user_id='u1')
+    attributes.update(kwargs)
+    return SimpleNamespace(**attributes)
+
+
+class TestSerializer(unittest.TestCase):
+    def test_matches_format_datetime(self):
+        snippet = make_snippet(1)
+        data = json.loads(snippet_serializer.encode(snippet))
+        self.assertEqual(data['created_at'],
+                         format_datetime(snippet.created_at))
+        self.assertEqual(data['updated_at'], '12th May 2024 at 22:46')
+
+    def test_matches_json_dumps(self):
+        snippet = make_snippet(2)
+        data = json.loads(snippet_serializer.encode(snippet))
+        self.assertEqual(data['code'], snippet.code)
+        self.assertIsNone(data['description'])
+        self.assertEqual(list(data), list(snippet_serializer.fields))
+
+    def test_iso_datetimes(self):
+        user = SimpleNamespace(
+            user_id='u1', username='jane', email='jane@example.com',
+            created_at=datetime(2024, 5, 12, 22, 45, 10),
+            updated_at=datetime(2024, 5, 12, 22, 45, 10))
+        data = json.loads(user_serializer.encode(user))
+        self.assertEqual(data['created_at'], '2024-05-12T22:45:10')
+        self.assertNotIn('hashed_password', data)
+
+    def test_other_values(self):
+        serializer = Serializer(('count', 'score', 'done'))
+        row = SimpleNamespace(count=3, score=1.5, done=True)
+        self.assertEqual(json.loads(serializer.encode(row)),
+                         {'count': 3, 'score': 1.5, 'done': True})
+
+    def test_invalid_field(self):
+        with self.assertRaises(ValueError):
+            Serializer(('title', 'x) or (y'))
+
+    def test_minute_is_formatted_once(self):
+        encoded_minute.cache_clear()
+        rows = [make_snippet(i, updated_at=datetime(2024, 5, 12, 22, 46, i))
+                for i in range(30)]
+        snippet_serializer.encode_list(rows)
+        self.assertEqual(encoded_minute.cache_info().misses, 2)
+
+    def test_dumps_page(self):
+        rows = [make_snippet(i) for i in range(3)]
+        page = snippet_serializer.dumps_page('snippets', rows, 'abc')
+        self.assertIsInstance(page, bytes)
+        data = json.loads(page)
+        self.assertEqual(len(data['snippets']), 3)
+        self.assertEqual(data['next_cursor'], 'abc')
+        empty = json.loads(snippet_serializer.dumps_page('snippets', [], None))
+        self.assertEqual(empty, {'snippets': [], 'next_cursor': None})
+
+
+if __name__ == '__main__':
+    unittest.main()
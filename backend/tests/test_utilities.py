@@ -9,6 +9,11 @@ Verify it raises a ValueError for empty or short passwords and
 Test verify_password Function:
 Check if it correctly verifies a password against its hashed version.
 
+Test bcrypt cost Functions:
+Check password_hash honours the requested cost, get_hash_rounds reads it
+    back, needs_rehash flags hashes of another cost and
+    calibrate_bcrypt_rounds returns a valid cost.
+
 Test get_ordinal_suffix Function:
 Ensure it returns the correct ordinal suffix for a given day.
 
@@ -20,6 +25,9 @@ Validate it correctly formats datetime objects and ISO format strings,
 import unittest
 from utilities import validate_username, validate_email, password_hash
 from utilities import verify_password, get_ordinal_suffix, format_datetime
+from utilities import get_hash_rounds, needs_rehash, calibrate_bcrypt_rounds
+from utilities import MIN_BCRYPT_ROUNDS
+from unittest.mock import patch
 import bcrypt
 
 
@@ -62,6 +70,27 @@ class TestValidationFunctions(unittest.TestCase):
             password.encode('utf-8'), bcrypt.gensalt())
         self.assertTrue(verify_password(password, hashed_password))
 
+    def test_password_hash_rounds(self):
+        hashed = password_hash('validPassword123', rounds=5)
+        self.assertEqual(get_hash_rounds(hashed), 5)
+        self.assertEqual(get_hash_rounds(hashed.decode('utf-8')), 5)
+
+    @patch.dict('os.environ', {'BCRYPT_ROUNDS': '6'})
+    def test_password_hash_rounds_from_env(self):
+        hashed = password_hash('validPassword123')
+        self.assertEqual(get_hash_rounds(hashed), 6)
+        self.assertFalse(needs_rehash(hashed))
+        self.assertTrue(needs_rehash(hashed, rounds=7))
+
+    def test_get_hash_rounds_invalid(self):
+        with self.assertRaises(ValueError):
+            get_hash_rounds('not-a-hash')
+
+    def test_calibrate_bcrypt_rounds(self):
+        rounds, elapsed = calibrate_bcrypt_rounds(target_ms=0.001, samples=1)
+        self.assertEqual(rounds, MIN_BCRYPT_ROUNDS)
+        self.assertGreater(elapsed, 0)
+
     def test_get_ordinal_suffix(self):
         self.assertEqual(get_ordinal_suffix(1), 'st')
         self.assertEqual(get_ordinal_suffix(2), 'nd')
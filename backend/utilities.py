@@ -2,9 +2,16 @@
 """Module containers validators and hashing function"""
 
 from datetime import datetime
+from functools import lru_cache
+import os
 import re
+import time
 import bcrypt
 
+DEFAULT_BCRYPT_ROUNDS = 12
+MIN_BCRYPT_ROUNDS = 4
+MAX_BCRYPT_ROUNDS = 31
+
 
 def validate_username(username):
     """Validates username passed for account creation
@@ -37,7 +44,16 @@ def validate_email(email):
         raise ValueError(f'Invalid email address: {email}')
 
 
-def password_hash(password):
+def get_bcrypt_rounds():
+    """Returns the bcrypt cost to hash new passwords with
+
+    Read from the BCRYPT_ROUNDS environment variable, which the console
+    command 'calibrate_bcrypt' helps to choose for the host.
+    """
+    return int(os.getenv('BCRYPT_ROUNDS', DEFAULT_BCRYPT_ROUNDS))
+
+
+def password_hash(password, rounds=None):
     """Checks and hashes password
         -   Checks if password is empty
         -   Checks is password is less than 8 characters
@@ -45,6 +61,7 @@ def password_hash(password):
 
     Args:
         password (str): password passed in
+        rounds (int): bcrypt cost, defaults to get_bcrypt_rounds()
 
     Raises:
         ValueError: if password is empty or is less than 8 chars long
@@ -57,12 +74,79 @@ def password_hash(password):
     if len(password) < 8:
         raise ValueError('Password must be at least 8 characters long')
 
-    salt = bcrypt.gensalt()
+    if rounds is None:
+        rounds = get_bcrypt_rounds()
+    salt = bcrypt.gensalt(rounds)
     hashed_password = bcrypt.hashpw(password.encode('utf-8'), salt)
 
     return hashed_password
 
 
+def get_hash_rounds(hashed_password):
+    """Returns the bcrypt cost a password was hashed with
+
+    Args:
+        hashed_password (str): hash in the '$2b$12$...' format
+
+    Raises:
+        ValueError: if hashed_password is not a bcrypt hash
+    """
+    if isinstance(hashed_password, bytes):
+        hashed_password = hashed_password.decode('utf-8')
+    parts = hashed_password.split('$')
+    if len(parts) < 4 or not parts[2].isdigit():
+        raise ValueError('Not a bcrypt hash')
+    return int(parts[2])
+
+
+def needs_rehash(hashed_password, rounds=None):
+    """Checks if a stored hash was made with another cost than the current
+
+    Args:
+        hashed_password (str): hash stored in database
+        rounds (int): current bcrypt cost, defaults to get_bcrypt_rounds()
+
+    Returns:
+        True if the password should be hashed again at the next login
+    """
+    if rounds is None:
+        rounds = get_bcrypt_rounds()
+    return get_hash_rounds(hashed_password) != rounds
+
+
+def calibrate_bcrypt_rounds(target_ms=250, samples=3):
+    """Finds the bcrypt cost that hashes closest to a target latency
+
+    Each extra round doubles the hashing time, so the cost is raised one
+    round at a time from the minimum until the next one would overshoot.
+
+    Args:
+        target_ms (float): wanted time to hash one password, in ms
+        samples (int): number of hashes timed for each cost
+
+    Returns:
+        tuple (rounds, milliseconds one hash takes with that cost)
+    """
+    def measure(rounds):
+        salt = bcrypt.gensalt(rounds)
+        timings = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            bcrypt.hashpw(b'calibration password', salt)
+            timings.append((time.perf_counter() - start) * 1000)
+        return sorted(timings)[len(timings) // 2]
+
+    rounds = MIN_BCRYPT_ROUNDS
+    elapsed = measure(rounds)
+    while rounds < MAX_BCRYPT_ROUNDS:
+        # Stop when doubling lands further from the target than we are now
+        if abs(elapsed * 2 - target_ms) >= abs(elapsed - target_ms):
+            break
+        rounds += 1
+        elapsed = measure(rounds)
+    return rounds, elapsed
+
+
 def verify_password(password, hashed_password):
     """Checks if provided password matches stored password
 
@@ -103,8 +187,19 @@ def format_datetime(dt_input):
     else:
         raise TypeError("Must be a datetime object or a string in ISO format")
 
+    return format_minute(dt.year, dt.month, dt.day, dt.hour, dt.minute)
+
+
+@lru_cache(maxsize=16384)
+def format_minute(year, month, day, hour, minute):
+    """
+    Format a minute to '12th May 2024 at 22:45' format.
+    Rows written close together share their minute, so each distinct
+    minute is only formatted once.
+    """
+    dt = datetime(year, month, day, hour, minute)
+
     # Extract the day and determine its ordinal suffix
-    day = dt.day
     ordinal_suffix = get_ordinal_suffix(day)
 
     # Format the datetime object, manually inserting the ordinal suffix
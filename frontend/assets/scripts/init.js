@@ -614,16 +614,27 @@ class App {
 
   // SNIPPET MANAGEMENT
   async fetchSnippets() {
-    const response = await this.fetchWithAuth('user/get_snippets', {
-      method: 'GET',
-    });
+    // Snippets are served one page at a time, follow next_cursor to the end
+    let snippets = [];
+    let cursor = null;
+
+    do {
+      const endpoint = cursor
+        ? `user/get_snippets?cursor=${encodeURIComponent(cursor)}`
+        : 'user/get_snippets';
+      const response = await this.fetchWithAuth(endpoint, {
+        method: 'GET',
+      });
 
-    const data = await response.json();
-    if (response.ok) {
-      return data;
-    } else {
-      throw new Error(data.error || 'Failed to fetch snippets');
-    }
+      const data = await response.json();
+      if (!response.ok) {
+        throw new Error(data.error || 'Failed to fetch snippets');
+      }
+      snippets = snippets.concat(data.snippets);
+      cursor = data.next_cursor;
+    } while (cursor);
+
+    return snippets;
   }
 
   async createSnippet(snippet) {
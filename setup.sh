@@ -7,3 +7,6 @@ sudo pip install -r requirements.txt
 
 # Set up database
 cat database/db_setup.sql | mysql -u root -p
+
+# Create the tables
+(cd backend && python3 console.py migrate)